@@ -1,8 +1,8 @@
-from sqlalchemy import create_engine, text
-import url
+from sqlalchemy import text
+from engine_factory import get_engine
 
-# Crea il motore SQLAlchemy
-engine = create_engine(url.url, echo=True)
+# Crea il motore SQLAlchemy (pool configurato in url.py)
+engine = get_engine(echo=True)
 
 # Test: connessione e query semplice
 with engine.connect() as conn:
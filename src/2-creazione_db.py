@@ -1,9 +1,8 @@
-from sqlalchemy import create_engine
-import url
+from engine_factory import get_engine
 from tables_definition import *
 
-# Crea il motore SQLAlchemy
-engine = create_engine(url.url, echo=True)
+# Crea il motore SQLAlchemy (pool configurato in url.py)
+engine = get_engine(echo=True)
 
 # Creazione fisica delle tabelle nel DB
 Base.metadata.create_all(engine)
@@ -1,166 +1,1124 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import or_, and_
+from sqlalchemy.orm import sessionmaker, selectinload, aliased, make_transient_to_detached
+from sqlalchemy import (or_, and_, select, insert, update, delete, tuple_, func, literal, cast, exists, case,
+                        union_all, String, event, inspect)
 
-import json
+import contextvars
+import functools
+import threading
+import time
+import weakref
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
 
 from tables_definition import *
+from records import IntentRecord, EntityRecord, RelationPathRecord
+from relation_closure import RelationClosure
+from deprecation_resolver import DeprecationResolver
+from query_budget import QueryBudget, default_mode
+from ontology_snapshot import OntologySnapshot, ConceptSnapshot
+from ontology_loader import (iter_ontology_source, load_ontology_source, list_shards,
+                             default_ontology_sources, batched)
+
+# cache process-wide dei livelli ISA95: engine -> {ISA95LevelEnum: id}
+# la tabella isa95_level è un insieme piccolo e fisso, basta caricarla una volta per engine
+_isa95_level_ids = weakref.WeakKeyDictionary()
+_isa95_level_ids_lock = threading.Lock()
+
+def _freeze_rows(rows):
+    '''
+    immutable copy of a list of records or ORM instances, stored in the read cache:
+    an ORM instance is kept as its class and the tuple of its loaded columns
+    '''
+    frozen = []
+    for row in rows:
+        if hasattr(row, "__mapper__"):
+            state = inspect(row)
+            frozen.append((type(row), tuple((attribute.key, state.dict[attribute.key])
+                                            for attribute in state.mapper.column_attrs
+                                            if attribute.key in state.dict)))
+        else:
+            frozen.append(row)
+    return tuple(frozen)
+
+def _thaw_rows(frozen):
+    '''
+    new list for one caller: the ORM instances are rebuilt as new detached objects,
+    so no caller shares (or can modify) the instances of another one
+    '''
+    rows = []
+    for row in frozen:
+        if isinstance(row, tuple):
+            model, columns = row
+            instance = model(**dict(columns))
+            make_transient_to_detached(instance)
+            rows.append(instance)
+        else:
+            rows.append(row)
+    return rows
+
+def _cached_by_level(method):
+    '''
+    read-through cache of a get_*_by_isa95_level method (when the repository has a cache):
+    the key is (method name, level), a hit does not open a session.
+    the cache holds immutable values (see _freeze_rows), each call gets its own list
+    '''
+    @functools.wraps(method)
+    def wrapper(self, level):
+        if self.cache is None:
+            return method(self, level)
+
+        self.check_ontology_version()
+        key = (method.__name__, level)
+        found, value = self.cache.lookup(key)
+        if found:
+            return _thaw_rows(value)
+        token = value
+        value = _freeze_rows(method(self, level))
+        self.cache.put(key, value, token)
+        return _thaw_rows(value)
+
+    return wrapper
+
+def _query_budget(max_statements: int):
+    '''
+    pins the number of statements of a repository method (level id cache misses included),
+    checked only when repository.query_budget_mode is set (see query_budget)
+    '''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.query_budget_mode is None:
+                return method(self, *args, **kwargs)
+            with self.query_budget(max_statements, label=f"RepositoryLayer.{method.__name__}"):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+def _mark_orm_write(orm_execute_state):
+    '''marks the sessions that executed an INSERT / UPDATE / DELETE, see RepositoryLayer._commit'''
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["ontology_written"] = True
+
+def _has_orm_changes(session):
+    '''pending ORM changes (session.dirty also lists objects whose attributes were set to the same value)'''
+    return bool(session.new or session.deleted
+                or any(session.is_modified(instance) for instance in session.dirty))
+
+def _mark_flush(session, flush_context, instances):
+    '''marks the sessions that flushed ORM changes, see RepositoryLayer._commit'''
+    if _has_orm_changes(session):
+        session.info["ontology_written"] = True
+
+def _listen_for_writes(target):
+    '''
+    installs the write markers on a sessionmaker or a session
+    '''
+    if not event.contains(target, "do_orm_execute", _mark_orm_write):
+        event.listen(target, "do_orm_execute", _mark_orm_write)
+        event.listen(target, "before_flush", _mark_flush)
+
+class _ContextLocal():
+    '''
+    attributes local to the current context (thread, asyncio task or greenlet of
+    AsyncSession.run_sync), like threading.local but also separate between coroutines
+    that run on the same thread
+    '''
+    def __init__(self):
+        object.__setattr__(self, "_values", contextvars.ContextVar(f"repository_local_{id(self)}", default={}))
+
+    def __getattr__(self, name):
+        try:
+            return self._values.get()[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        # copia: il dizionario può essere condiviso con i contesti copiati da questo
+        self._values.set({**self._values.get(), name: value})
+
+def _unit_of_work(method):
+    '''
+    runs a repository method in a unit of work: a short session opened for the call
+    and closed at the end (or the external session set with use_session).
+    nested calls share the session of the outer call
+    '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if getattr(self._local, "session", None) is not None:
+            return method(self, *args, **kwargs)
+
+        # solo la chiamata più esterna viene misurata (vedi query_metrics)
+        with self.metrics.measure(method.__name__) if self.metrics is not None else nullcontext():
+            external_session = getattr(self._local, "external_session", None)
+            if external_session is not None:
+                self._local.session = external_session
+                try:
+                    return method(self, *args, **kwargs)
+                finally:
+                    self._local.session = None
+
+            session = self.session_factory()
+            self._local.session = session
+            try:
+                return method(self, *args, **kwargs)
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                self._local.session = None
+                session.close()
+
+    return wrapper
 
 # RepositoryLayer
 class RepositoryLayer():
-    def __init__(self, engine):
-        Session = sessionmaker(bind=engine)
-        self.session = Session()
+    # numero massimo di righe per singolo statement nelle operazioni bulk
+    BULK_CHUNK_SIZE = 1000
+
+    # secondi minimi tra due letture di ontology_version (vedi check_ontology_version)
+    VERSION_POLL_INTERVAL = 1.0
+
+    # letture in cache per livello ISA95, invalidate dalle scritture sul livello
+    LEVEL_READERS = {
+        "intent": ("get_intents_by_isa95_level", "get_intent_records_by_isa95_level"),
+        "entity": ("get_entities_by_isa95_level", "get_entity_records_by_isa95_level"),
+    }
+
+    def __init__(self, engine=None, intents_source=None, entities_source=None, session_factory=None,
+                 cache=None, metrics=None):
+        '''
+        engine / session_factory: each method call opens its own short session from
+        session_factory (default: sessionmaker(bind=engine, expire_on_commit=False)),
+        so the repository can be shared between threads and keeps no identity map
+        between calls. the returned ORM objects are detached: their columns are loaded,
+        relationships have to be loaded explicitly (see get_intent_full)
+
+        intents_source / entities_source: ontology used by populate_default_db_configuration,
+        by default intents.json / entities.json in ontology_loader.DEFAULT_ONTOLOGY_DIR
+
+        cache: optional read-through cache of the get_*_by_isa95_level reads
+        (e.g. read_cache.LRUTTLCache), the write methods invalidate the levels they touch
+
+        metrics: optional query_metrics.QueryMetrics, collects statements, rows and
+        latencies per repository method from the events of the engine
+        '''
+        if engine is None and session_factory is None:
+            raise ValueError("Devi fornire 'engine' o 'session_factory'")
+
+        if session_factory is None:
+            session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+        self.session_factory = session_factory
+        self.engine = engine if engine is not None else session_factory.kw["bind"]
+        _listen_for_writes(self.session_factory)
+
+        default_sources = default_ontology_sources()
+        self.intents_source = intents_source if intents_source is not None else default_sources["intents"]
+        self.entities_source = entities_source if entities_source is not None else default_sources["entities"]
+        self.cache = cache
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.attach(self.engine)
+        # "raise" / "log": controlla i budget fissi dei metodi (vedi query_budget)
+        self.query_budget_mode = default_mode()
+
+        # sessione della unità di lavoro corrente, una per thread / task asyncio
+        self._local = _ContextLocal()
+
+        # indici in memoria da aggiornare a ogni modifica delle relazioni
+        # (vedi get_intent_closure, get_intent_deprecation_resolver)
+        self._relation_indexes = {"intent": [], "entity": []}
+        # una closure per (label, threshold): get_*_closure restituisce sempre la stessa
+        self._closures = {}
+        # un resolver dei nomi deprecati per label (get_*_deprecation_resolver)
+        self._deprecation_resolvers = {}
+        self._relation_indexes_lock = threading.Lock()
+
+        # ultima ontology_version vista da questo processo
+        self._ontology_version = None
+        self._next_version_check = 0.0
+        self._version_lock = threading.Lock()
+
+        # ultima snapshot in memoria (vedi load_snapshot), sostituita in blocco a ogni ricarica
+        self.snapshot = None
+        self._snapshot_lock = threading.Lock()
+
+    # unit of work
+    @property
+    def session(self):
+        '''
+        session of the current unit of work (only inside a repository method)
+        '''
+        session = getattr(self._local, "session", None)
+        if session is None:
+            raise RuntimeError("La sessione del repository è disponibile solo durante una chiamata "
+                               "a un suo metodo, usa use_session per una sessione esterna")
+        return session
+
+    @contextmanager
+    def use_session(self, session):
+        """
+        Esegue i metodi del repository chiamati nel blocco (da questo thread o task asyncio)
+        dentro una sessione gestita dal chiamante.
+        Il repository non fa commit né rollback: fa solo flush, la transazione
+        viene confermata o annullata dal chiamante.
+        
+        Example:
+            with Session() as session, session.begin():
+                with repository.use_session(session):
+                    repository.create_intents_with_levels(intents, bulk=True)
+                    repository.define_intents_relation(180, 181, RelationType.DEPRECATED)
+        """
+        _listen_for_writes(session)
+        previous = getattr(self._local, "external_session", None)
+        self._local.external_session = session
+        try:
+            yield session
+        finally:
+            self._local.external_session = previous
+
+    def _commit(self):
+        session = self.session
+        written = session.info.pop("ontology_written", False) or _has_orm_changes(session)
+        version = self._bump_ontology_version() if written else None
+
+        if getattr(self._local, "external_session", None) is session:
+            session.flush()
+        else:
+            session.commit()
+        self._invalidate_touched_levels()
+        if version is not None:
+            self._own_ontology_version(version)
+
+    def _rollback(self):
+        if getattr(self._local, "external_session", None) is not self.session:
+            self.session.rollback()
+        self.session.info.pop("touched_levels", None)
+        self.session.info.pop("ontology_written", None)
+
+    # query budgets
+    def query_budget(self, max_statements: int, mode: str = None, label: str = None):
+        """
+        Limita il numero di statement eseguiti sull'engine del repository in un blocco
+        (context manager) o in ogni chiamata di una funzione (decoratore), vedi query_budget.
+        
+        Args:
+            max_statements: numero massimo di statement
+            mode: "raise" o "log" (default: query_budget_mode del repository, altrimenti "raise")
+            label: nome mostrato nel report
+        
+        Returns:
+            QueryBudget
+        
+        Raises:
+            QueryBudgetExceeded: All'uscita dal blocco, se il budget è superato (mode="raise")
+        
+        Example:
+            with repository.query_budget(max_statements=8):
+                repository.add_intent_isa_levels(intent_name="start_machine", levels=[ISA95LevelEnum.LEVEL_2])
+        """
+        return QueryBudget(self.engine, max_statements, mode or self.query_budget_mode or "raise", label)
+
+    # cross-process invalidation
+    def _bump_ontology_version(self):
+        '''
+        increments ontology_version in the current transaction and returns the new value
+        '''
+        bumped = self.session.execute(
+            update(OntologyVersion).where(OntologyVersion.id == 1)
+            .values(version=OntologyVersion.version + 1)).rowcount
+        if not bumped:
+            # db creato prima della tabella ontology_version
+            self.session.execute(insert(OntologyVersion).values(id=1, version=1))
+        version = self.session.execute(
+            select(OntologyVersion.version).where(OntologyVersion.id == 1)).scalar_one()
+        # la scrittura di ontology_version non va contata come modifica dell'ontologia
+        self.session.info.pop("ontology_written", None)
+        return version
+
+    def _own_ontology_version(self, version: int):
+        '''
+        the version written by this process does not make its caches stale,
+        unless another process wrote in between
+        '''
+        with self._version_lock:
+            if self._ontology_version is not None and self._ontology_version == version - 1:
+                self._ontology_version = version
+
+    @_unit_of_work
+    def _get_ontology_version(self):
+        return self.session.execute(
+            select(OntologyVersion.version).where(OntologyVersion.id == 1)).scalar_one_or_none() or 0
+
+    def check_ontology_version(self, force: bool = False):
+        """
+        Controlla se un altro processo ha modificato l'ontologia e, in quel caso,
+        svuota le cache locali (cache delle letture, chiusure, resolver).
+        La lettura di ontology_version (una lookup per primary key) avviene al più
+        una volta ogni VERSION_POLL_INTERVAL secondi; le letture in cache e gli indici
+        in memoria la chiamano da soli.
+        
+        Args:
+            force: legge la versione anche se l'intervallo non è trascorso
+        
+        Returns:
+            bool: True se le cache sono state svuotate
+        """
+        now = time.monotonic()
+        with self._version_lock:
+            if not force and now < self._next_version_check:
+                return False
+            self._next_version_check = now + self.VERSION_POLL_INTERVAL
+
+        version = self._get_ontology_version()
+        with self._version_lock:
+            previous, self._ontology_version = self._ontology_version, version
+        if previous is None or previous == version:
+            return False
+
+        if self.cache is not None:
+            self.cache.clear()
+        self._invalidate_relation_indexes("intent")
+        self._invalidate_relation_indexes("entity")
+        return True
+
+    # read cache invalidation
+    def _touch_levels(self, label: str, level_ids):
+        '''
+        records the ISA95 levels whose reads are changed by the current transaction,
+        their cache keys are invalidated at the commit
+        '''
+        if self.cache is not None:
+            self.session.info.setdefault("touched_levels", set()).update(
+                (label, level_id) for level_id in level_ids)
+
+    def _touch_concept_levels(self, label: str, key_column, keys):
+        '''
+        records the current levels of the concepts with key_column IN keys
+        (one query per chunk, only if the repository has a cache)
+        '''
+        if self.cache is None or not keys:
+            return
+        link_fk_column = IntentISA95Link.intent_id if label == "intent" else EntityISA95Link.entity_id
+        link_table = link_fk_column.table
+        keys = list(keys)
+        for start in range(0, len(keys), self.BULK_CHUNK_SIZE):
+            self._touch_levels(label, self.session.execute(
+                select(link_table.c.isa95_id).distinct()
+                .join(key_column.class_, key_column.class_.id == link_fk_column)
+                .where(key_column.in_(keys[start:start + self.BULK_CHUNK_SIZE]))).scalars())
+
+    def _invalidate_touched_levels(self):
+        touched = self.session.info.pop("touched_levels", None)
+        if not touched:
+            return
+        level_of_id = {level_id: level for level, level_id in self._get_isa95_level_ids().items()}
+        self.cache.invalidate([(method_name, level_of_id[level_id])
+                               for label, level_id in touched if level_id in level_of_id
+                               for method_name in self.LEVEL_READERS[label]])
+
+    # ISA95 level id cache
+    @_unit_of_work
+    def _get_isa95_level_ids(self, reload: bool = False):
+        '''
+        returns the {ISA95LevelEnum: id} map of the engine,
+        loading it with a single query the first time
+        '''
+        level_ids = _isa95_level_ids.get(self.engine)
+        if level_ids is not None and not reload:
+            return level_ids
+
+        with _isa95_level_ids_lock:
+            level_ids = _isa95_level_ids.get(self.engine)
+            if level_ids is None or reload:
+                level_ids = {}
+                for level_id, level_name in self.session.execute(select(ISA95Level.id, ISA95Level.name)):
+                    try:
+                        level_ids[ISA95LevelEnum(level_name)] = level_id
+                    except ValueError:
+                        # livello non previsto dall'enum, non indirizzabile
+                        continue
+                _isa95_level_ids[self.engine] = level_ids
+        return level_ids
+
+    def _get_isa95_level_id(self, level):
+        '''
+        returns the id of an ISA95 level (ISA95LevelEnum or its name), None if not found.
+        on a miss the cache is reloaded once (the table could have been populated meanwhile)
+        '''
+        if not isinstance(level, ISA95LevelEnum):
+            try:
+                level = ISA95LevelEnum(level)
+            except ValueError:
+                return None
+
+        level_id = self._get_isa95_level_ids().get(level)
+        if level_id is None:
+            level_id = self._get_isa95_level_ids(reload=True).get(level)
+        return level_id
+
+    def _load_isa95_levels(self):
+        '''
+        loads the ISA95Level rows (a handful) in the current session, returns {id: ISA95Level}:
+        afterwards link.isa95_level is resolved from the identity map, without queries
+        '''
+        return {level.id: level for level in self.session.execute(select(ISA95Level)).scalars()}
+
+    def invalidate_isa95_level_cache(self):
+        '''
+        drops the cached ISA95 level ids of this engine,
+        to be called if the isa95_level table is modified outside the repository
+        '''
+        with _isa95_level_ids_lock:
+            _isa95_level_ids.pop(self.engine, None)
+
+    # ISA95 level masks
+    def _levels_mask(self, levels):
+        '''
+        bitmask of ISA95 levels (ISA95LevelEnum or names), the names unknown to the enum are ignored
+        (the callers reject them while resolving the level ids)
+        '''
+        mask = 0
+        for level in levels:
+            try:
+                mask |= levels_to_mask([level])
+            except ValueError:
+                continue
+        return mask
+
+    def _links_mask(self, link_fk_column, concept_id):
+        '''
+        SELECT of the level mask computed from the links of concept_id
+        (a column, e.g. Intent.id, for a correlated subquery)
+        '''
+        link_table = link_fk_column.table
+        bits = {level_id: ISA95_LEVEL_BITS[level] for level, level_id in self._get_isa95_level_ids().items()}
+        # un link per (concetto, livello): la somma dei bit è il loro OR
+        return (select(func.coalesce(func.sum(case(bits, value=link_table.c.isa95_id, else_=0)), 0))
+                .where(link_fk_column == concept_id))
+
+    def _change_level_mask(self, concept, link_fk_column, added=(), removed=()):
+        '''
+        keeps concept.level_mask in sync with the levels added to / removed from its links,
+        a mask never computed (NULL) is recomputed from the links
+        '''
+        if concept.level_mask is None:
+            self.session.flush()
+            concept.level_mask = self.session.execute(self._links_mask(link_fk_column, concept.id)).scalar_one()
+        else:
+            concept.level_mask = (concept.level_mask | levels_to_mask(added)) & ~levels_to_mask(removed)
+
+    @_unit_of_work
+    def check_level_masks(self, repair: bool = False, chunk_size: int = None):
+        """
+        Confronta la colonna level_mask di intenti ed entità con i loro link ISA95
+        (una SELECT per tabella) e, con repair=True, ricalcola le maschere errate o NULL.
+        
+        Args:
+            repair: True per correggere le maschere (un UPDATE per chunk di concetti)
+            chunk_size: id per singolo UPDATE (default BULK_CHUNK_SIZE)
+        
+        Returns:
+            dict: {"intent": [id], "entity": [id]} dei concetti con maschera non coerente
+        
+        Example:
+            repository.check_level_masks()              # {"intent": [], "entity": []}
+            repository.check_level_masks(repair=True)   # dopo migrazione_level_mask.py
+        """
+        chunk_size = chunk_size or self.BULK_CHUNK_SIZE
+        report = {}
+        for label, model, link_fk_column in (("intent", Intent, IntentISA95Link.intent_id),
+                                             ("entity", Entity, EntityISA95Link.entity_id)):
+            expected = self._links_mask(link_fk_column, model.id).scalar_subquery()
+            report[label] = list(self.session.execute(
+                select(model.id).where(or_(model.level_mask.is_(None), model.level_mask != expected))
+                .order_by(model.id)).scalars())
+
+            if repair:
+                for chunk in batched(report[label], chunk_size):
+                    self._touch_concept_levels(label, model.id, chunk)
+                    self.session.execute(update(model).where(model.id.in_(chunk)).values(level_mask=expected),
+                                         execution_options={"synchronize_session": False})
+
+        if repair and (report["intent"] or report["entity"]):
+            self._commit()
+            print(f"Maschere ricalcolate: {len(report['intent'])} intent, {len(report['entity'])} entity")
+        return report
     
     # populate the db with the default onfiguration of concepts
-    def populate_default_db_configuration(self):
+    @_unit_of_work
+    def populate_default_db_configuration(self,
+                                          upsert: bool = False,
+                                          stream: bool = False,
+                                          batch_size: int = None,
+                                          workers: int = 1):
         '''
         used to populate che db with the initial configuration.
         the database must already exists
+
+        the ontology is read from self.intents_source / self.entities_source,
+        see populate_db_from_sources for the meaning of the parameters
         '''
-        default_configuration = self._get_default_configuration()
+        return self.populate_db_from_sources(self.intents_source,
+                                             self.entities_source,
+                                             upsert=upsert,
+                                             stream=stream,
+                                             batch_size=batch_size,
+                                             workers=workers)
+
+    @_unit_of_work
+    def populate_db_from_sources(self,
+                                 intents_source=None,
+                                 entities_source=None,
+                                 upsert: bool = False,
+                                 stream: bool = False,
+                                 batch_size: int = None,
+                                 workers: int = 1):
+        """
+        Popola il db a partire da sorgenti di ontologia.
+
+        Una sorgente può essere un path (.json / .jsonl, anche compresso .gz / .zst),
+        "-" per stdin, un file object o una directory di shard (vedi ontology_loader).
+        Ogni shard viene caricato in una propria transazione: dopo un errore gli shard
+        già caricati restano nel db, si può rilanciare con upsert=True.
+
+        Args:
+            intents_source: sorgente degli intenti (None per non caricarli)
+            entities_source: sorgente delle entità (None per non caricarle)
+            upsert: popolazione idempotente, vedi _upsert_with_levels
+            stream: legge i file un concetto alla volta invece di usare json.load,
+                    la memoria non dipende dalla dimensione del file
+            batch_size: concetti scritti per volta (default BULK_CHUNK_SIZE)
+            workers: numero di thread che caricano gli shard in parallelo
 
+        Returns:
+            dict: {"intents": report, "entities": report}
+                  report = {"inserted": int, "updated": int, "unchanged": int}
+
+        Example:
+            populate_db_from_sources("/data/ontology/intents", "/data/ontology/entities.json.gz",
+                                     upsert=True, stream=True, workers=8)
+        """
         self._populate_isa95_levels()
-        self._populate_default_intents(default_configuration['intents'])
-        self._populate_default_entities(default_configuration['entities'])
 
-    def _get_default_configuration(self):
-        intents_path = r'C:\Users\f.cavaleri\Desktop\NLP_BREAKDOWN\IPCEI.NLPBreakdown\config\ontology\intents.json'
-        entities_path = r'C:\Users\f.cavaleri\Desktop\NLP_BREAKDOWN\IPCEI.NLPBreakdown\config\ontology\entities.json'
+        report = {}
+        if intents_source is not None:
+            report["intents"] = self._populate_shards("intents", list_shards(intents_source),
+                                                      upsert, stream, batch_size, workers)
+        if entities_source is not None:
+            report["entities"] = self._populate_shards("entities", list_shards(entities_source),
+                                                       upsert, stream, batch_size, workers)
+        return report
 
-        return {"intents" : self._get_json_data(intents_path),
-                "entities" : self._get_json_data(entities_path)}
+    def _populate_shards(self, section: str, shards, upsert, stream, batch_size, workers):
+        '''
+        loads the shards, in parallel if workers > 1, and returns the sum of their reports
+        '''
+        if workers <= 1 or len(shards) == 1:
+            reports = [self._populate_shard(section, shard, upsert, stream, batch_size)
+                       for shard in shards]
+        else:
+            def load_shard(shard):
+                # ogni thread apre la propria unità di lavoro (e quindi la propria sessione)
+                return self._populate_shard(section, shard, upsert, stream, batch_size)
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                reports = list(executor.map(load_shard, shards))
+
+        report = {"inserted": 0, "updated": 0, "unchanged": 0}
+        for shard_report in reports:
+            for key, value in shard_report.items():
+                report[key] += value
+        return report
+
+    @_unit_of_work
+    def _populate_shard(self, section: str, shard, upsert, stream, batch_size):
+        '''
+        loads a single shard in its own transaction
+        '''
+        if section == "intents":
+            concept_rows = self._iter_default_intents
+            args = (Intent, IntentISA95Link, "intent_id")
+            label = "intent"
+        else:
+            concept_rows = self._iter_default_entities
+            args = (Entity, EntityISA95Link, "entity_id")
+            label = "entity"
+
+        if stream:
+            items = iter_ontology_source(shard, section)
+        else:
+            items = self._get_json_data(shard, section)
+
+        write = self._upsert_with_levels if upsert else self._bulk_create_with_levels
+        try:
+            report = self._populate_in_batches(
+                concept_rows(items),
+                lambda batch: write(*args, batch, label, commit=False),
+                batch_size)
+        except Exception:
+            self._rollback()
+            raise
+        self._commit()
 
-    def _get_json_data(self, path:str):
+        shard_name = shard if isinstance(shard, str) else getattr(shard, "name", "file object")
+        print(f"Shard '{shard_name}' caricato: {report['inserted']} {label} inseriti")
+        return report
+
+    def _get_json_data(self, source, section: str):
         '''
-        used to get entities / intents from the json definition
+        used to get entities / intents from the json definition,
+        returns the (name, data) pairs of the section
         '''
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return data
+        return load_ontology_source(source, section)
 
+    @_unit_of_work
     def _populate_isa95_levels(self):
         """Inserisce i livelli ISA95 standard"""
+        # Livelli già presenti, con una sola query
+        existing = set(self.session.execute(select(ISA95Level.name)).scalars())
         for level_name in [isa_class.value for isa_class in ISA95LevelEnum]:
-            # Controlla se già esiste
-            existing = self.session.query(ISA95Level).filter_by(name=level_name).first()
-            if not existing:
+            if level_name not in existing:
                 level = ISA95Level(name=level_name)
                 self.session.add(level)
         
-        self.session.commit()
+        self._commit()
+
+        # Riscalda la cache dei livelli
+        self._get_isa95_level_ids(reload=True)
 
-    def _populate_default_intents(self, intents_dict):
+    def _iter_default_intents(self, intents_items):
         '''
-        it creates the structure for the create_intents_with_levels function
+        it creates the structure for the create_intents_with_levels function:
+        (name, json definition) -> [name, description, isa95_level]
 
         keep this code clear!
         '''
-        intents_dict = intents_dict['intents']
-        intents_names = list(intents_dict.keys())
-        intent_list=[]
-        for name in intents_names:
-            intent_description = intents_dict[name]['description'] + (' - function: '+intents_dict[name]['function'] 
-                                                                      if 'function' in intents_dict[name].keys() 
-                                                                      else '')
-            intent_isa95_level = intents_dict[name]['domain']
-            intent_list.append([name, intent_description, intent_isa95_level])
-        
-        self.create_intents_with_levels(intent_list)
+        for name, intent_data in intents_items:
+            intent_description = intent_data['description'] + (' - function: '+intent_data['function'] 
+                                                                if 'function' in intent_data.keys() 
+                                                                else '')
+            intent_isa95_level = intent_data['domain']
+            yield [name, intent_description, intent_isa95_level]
 
-    def _populate_default_entities(self, entities_dict):
+    def _iter_default_entities(self, entities_items):
         '''
-        it creates the structure for the create_intents_with_levels function
+        it creates the structure for the create_entities_with_levels function:
+        (name, json definition) -> [name, description, isa95_level]
 
         keep this code clear!
         '''
-        entities_dict = entities_dict['entities']
-        entities_names = list(entities_dict.keys())
-        entities_list = []
-        for name in entities_names:
-            entity_description = entities_dict[name]['description']
-            entity_isa95_level = entities_dict[name]['level']
-            entities_list.append([name, entity_description, entity_isa95_level])
-        
-        self.create_entities_with_levels(entities_list)
+        for name, entity_data in entities_items:
+            entity_description = entity_data['description']
+            entity_isa95_level = entity_data['level']
+            yield [name, entity_description, entity_isa95_level]
+
+    def _populate_in_batches(self, concept_rows, write, batch_size: int = None):
+        '''
+        feeds concept_rows to write (create / upsert) in batches of batch_size,
+        only one batch at a time is kept in memory.
+        returns the sum of the reports, see _upsert_with_levels
+        '''
+        report = {"inserted": 0, "updated": 0, "unchanged": 0}
+        for batch in batched(concept_rows, batch_size or self.BULK_CHUNK_SIZE):
+            batch_report = write(batch)
+            if batch_report is None:
+                # create: tutte le righe del batch sono nuove
+                batch_report = {"inserted": len(batch)}
+            for key, value in batch_report.items():
+                report[key] += value
+        return report
 
     # intents and entities management
+    @_unit_of_work
     def create_intents_with_levels(self,
-                                   intent_list):
+                                   intent_list,
+                                   bulk: bool = False,
+                                   chunk_size: int = None):
         '''
         each element of the list must contain
         intent_name,
         intent_description,
         intent_isa95_level
+
+        with bulk=True the intents are inserted set-based
+        (see _bulk_create_with_levels for the round trip count)
         '''
+        if bulk:
+            return self._bulk_create_with_levels(Intent, IntentISA95Link, "intent_id",
+                                                 intent_list, "intent", chunk_size)
+
         for intent in intent_list: 
             intent_name, intent_description, intent_isa95_levels = intent
+            
+            # Gestisce sia singolo livello che lista
+            if isinstance(intent_isa95_levels, str):
+                intent_isa95_levels = [intent_isa95_levels]
+            
             intent_obj = Intent(
                 name=intent_name,
-                description=intent_description
+                description=intent_description,
+                level_mask=self._levels_mask(intent_isa95_levels)
             )
             self.session.add(intent_obj)
             self.session.flush()  # Ottiene l'ID senza committare
             
-            # Gestisce sia singolo livello che lista
-            if isinstance(intent_isa95_levels, str):
-                intent_isa95_levels = [intent_isa95_levels]
-            
             # Associa ai livelli ISA95
             for level_name in intent_isa95_levels:
-                level = self.session.query(ISA95Level).filter_by(name=level_name).first()
+                level_id = self._get_isa95_level_id(level_name)
                 
-                if not level:
+                if level_id is None:
                     # Gestione errore: livello non trovato
-                    self.session.rollback()
+                    self._rollback()
                     raise ValueError(f"Livello ISA95 '{level_name}' non trovato per intent '{intent_name}'")
                 
-                link = IntentISA95Link(intent_id=intent_obj.id, isa95_id=level.id)
+                link = IntentISA95Link(intent_id=intent_obj.id, isa95_id=level_id)
                 self.session.add(link)
+                self._touch_levels("intent", [level_id])
         
-        self.session.commit()
+        self._commit()
         
+    @_unit_of_work
     def create_entities_with_levels(self,
-                                   enity_list):
+                                   enity_list,
+                                   bulk: bool = False,
+                                   chunk_size: int = None):
         '''
         each element of the list must contain
         entity_name,
         entity_description,
         entity_isa95_level
+
+        with bulk=True the entities are inserted set-based
+        (see _bulk_create_with_levels for the round trip count)
         '''
+        if bulk:
+            return self._bulk_create_with_levels(Entity, EntityISA95Link, "entity_id",
+                                                 enity_list, "entity", chunk_size)
+
         for entity in enity_list: 
             entity_name, entity_description, entity_isa95_levels = entity
+            
+            # Gestisce sia singolo livello che lista
+            if isinstance(entity_isa95_levels, str):
+                entity_isa95_levels = [entity_isa95_levels]
+            
             entity_obj = Entity(
                 name=entity_name,
-                description=entity_description
+                description=entity_description,
+                level_mask=self._levels_mask(entity_isa95_levels)
             )
             self.session.add(entity_obj)
             self.session.flush()  # Ottiene l'ID senza committare
             
-            # Gestisce sia singolo livello che lista
-            if isinstance(entity_isa95_levels, str):
-                entity_isa95_levels = [entity_isa95_levels]
-            
             # Associa ai livelli ISA95
             for level_name in entity_isa95_levels:
-                level = self.session.query(ISA95Level).filter_by(name=level_name).first()
+                level_id = self._get_isa95_level_id(level_name)
                 
-                if not level:
+                if level_id is None:
                     # Gestione errore: livello non trovato
-                    self.session.rollback()
+                    self._rollback()
                     raise ValueError(f"Livello ISA95 '{level_name}' non trovato per entity '{entity_name}'")
                 
-                link = EntityISA95Link(entity_id=entity_obj.id, isa95_id=level.id)
+                link = EntityISA95Link(entity_id=entity_obj.id, isa95_id=level_id)
                 self.session.add(link)
+                self._touch_levels("entity", [level_id])
         
-        self.session.commit()
-  
-    def replace_intent_isa_levels(self, 
+        self._commit()
+
+    def _bulk_create_with_levels(self,
+                                 model,
+                                 link_model,
+                                 link_fk: str,
+                                 concept_list,
+                                 label: str,
+                                 chunk_size: int = None,
+                                 commit: bool = True):
+        """
+        Inserimento set-based di intenti / entità con i relativi livelli ISA95.
+
+        Il numero di round trip non dipende dal numero di livelli per concetto:
+            al più 1 SELECT per risolvere i livelli ISA95 (cache per engine)
+            per ogni chunk di chunk_size concetti:
+                1 INSERT multi-row dei concetti (executemany)
+                1 SELECT id, name per recuperare gli id generati
+                1 INSERT multi-row dei link
+            1 COMMIT
+        cioè al più 2 + 3 * ceil(len(concept_list) / chunk_size) statement.
+
+        Args:
+            model: Intent o Entity
+            link_model: IntentISA95Link o EntityISA95Link
+            link_fk: nome della colonna FK nel link ("intent_id" / "entity_id")
+            concept_list: lista di [name, description, level | [levels]]
+            label: "intent" / "entity", usato nei messaggi di errore
+            chunk_size: righe per statement (default BULK_CHUNK_SIZE)
+            commit: False per lasciare la transazione aperta al chiamante
+
+        Raises:
+            ValueError: Se un livello ISA95 non esiste (nessuna riga viene inserita)
+        """
+        chunk_size = chunk_size or self.BULK_CHUNK_SIZE
+
+        # Validazione prima di qualsiasi insert
+        rows = self._normalize_concept_list(concept_list)
+        level_ids = self._resolve_concept_levels(rows, label)
+
+        try:
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+
+                self.session.execute(insert(model),
+                                     [{"name": name, "description": description,
+                                       "level_mask": levels_to_mask(levels)}
+                                      for name, description, levels in chunk])
+
+                # Recupera gli id generati tramite il nome (unique)
+                ids = dict(self.session.execute(
+                    select(model.name, model.id).where(model.name.in_([name for name, _, _ in chunk]))
+                ).all())
+
+                links = [{link_fk: ids[name], "isa95_id": level_ids[level_name]}
+                         for name, _, levels in chunk
+                         for level_name in levels]
+                if links:
+                    self.session.execute(insert(link_model), links)
+                    self._touch_levels(label, {link["isa95_id"] for link in links})
+        except Exception:
+            self._rollback()
+            raise
+
+        if commit:
+            self._commit()
+
+    def _normalize_concept_list(self, concept_list):
+        '''
+        [name, description, level | [levels]] -> [(name, description, [levels])]
+        '''
+        rows = []
+        for concept in concept_list:
+            name, description, levels = concept
+            if isinstance(levels, str):
+                levels = [levels]
+            rows.append((name, description, list(dict.fromkeys(levels))))
+        return rows
+
+    def _resolve_concept_levels(self, rows, label: str):
+        '''
+        returns {level_name: level_id} for all the levels used in rows,
+        raises ValueError (after a rollback) if a level does not exist
+        '''
+        # Risolve tutti i livelli tramite la cache (al più una query)
+        level_names = {level_name for _, _, levels in rows for level_name in levels}
+        level_ids = {}
+        for level_name in level_names:
+            level_id = self._get_isa95_level_id(level_name)
+            if level_id is not None:
+                level_ids[level_name] = level_id
+
+        for name, _, levels in rows:
+            for level_name in levels:
+                if level_name not in level_ids:
+                    self._rollback()
+                    raise ValueError(f"Livello ISA95 '{level_name}' non trovato per {label} '{name}'")
+        return level_ids
+
+    @_unit_of_work
+    def upsert_intents_with_levels(self,
+                                   intent_list,
+                                   chunk_size: int = None):
+        '''
+        idempotent version of create_intents_with_levels, same input format.
+        see _upsert_with_levels
+        '''
+        return self._upsert_with_levels(Intent, IntentISA95Link, "intent_id",
+                                        intent_list, "intent", chunk_size)
+
+    @_unit_of_work
+    def upsert_entities_with_levels(self,
+                                    entity_list,
+                                    chunk_size: int = None):
+        '''
+        idempotent version of create_entities_with_levels, same input format.
+        see _upsert_with_levels
+        '''
+        return self._upsert_with_levels(Entity, EntityISA95Link, "entity_id",
+                                        entity_list, "entity", chunk_size)
+
+    def _upsert_statement(self,
+                          table,
+                          conflict_columns: list[str],
+                          update_columns: list[str] = (),
+                          extra_values: dict = None):
+        '''
+        INSERT that, on a conflict on conflict_columns, takes update_columns from the
+        proposed row (plus extra_values), or does nothing if there is nothing to update.
+        MySQL: ON DUPLICATE KEY UPDATE, SQLite: ON CONFLICT
+        '''
+        dialect_name = self.engine.dialect.name
+        if dialect_name in ("mysql", "mariadb"):
+            from sqlalchemy.dialects.mysql import insert as dialect_insert
+        elif dialect_name == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            raise ValueError(f"Upsert non supportato per il database '{dialect_name}'")
+
+        stmt = dialect_insert(table)
+
+        if dialect_name in ("mysql", "mariadb"):
+            values = {column: stmt.inserted[column] for column in update_columns}
+            values.update(extra_values or {})
+            if not values:
+                # update no-op: come INSERT IGNORE ma senza nascondere gli altri errori
+                values = {conflict_columns[0]: stmt.inserted[conflict_columns[0]]}
+            return stmt.on_duplicate_key_update(values)
+
+        values = {column: stmt.excluded[column] for column in update_columns}
+        values.update(extra_values or {})
+        if not values:
+            return stmt.on_conflict_do_nothing(index_elements=conflict_columns)
+        return stmt.on_conflict_do_update(index_elements=conflict_columns, set_=values)
+
+    def _upsert_with_levels(self,
+                            model,
+                            link_model,
+                            link_fk: str,
+                            concept_list,
+                            label: str,
+                            chunk_size: int = None,
+                            commit: bool = True):
+        """
+        Upsert set-based di intenti / entità con i relativi livelli ISA95.
+        Vengono scritti solo i concetti nuovi o con descrizione / livelli cambiati.
+
+        Per ogni chunk di chunk_size concetti:
+            1 SELECT dei concetti esistenti
+            1 SELECT dei loro link
+            solo se ci sono modifiche:
+                1 INSERT ... ON DUPLICATE KEY UPDATE (ON CONFLICT su SQLite) dei concetti
+                1 SELECT degli id dei concetti nuovi
+                1 DELETE dei link rimossi
+                1 INSERT dei link aggiunti
+        più 1 COMMIT: un reload senza modifiche costa 2 statement per chunk.
+
+        Args:
+            model: Intent o Entity
+            link_model: IntentISA95Link o EntityISA95Link
+            link_fk: nome della colonna FK nel link ("intent_id" / "entity_id")
+            concept_list: lista di [name, description, level | [levels]]
+            label: "intent" / "entity", usato nei messaggi
+            chunk_size: righe per statement (default BULK_CHUNK_SIZE)
+            commit: False per lasciare la transazione aperta al chiamante
+
+        Returns:
+            dict: {"inserted": int, "updated": int, "unchanged": int}
+
+        Raises:
+            ValueError: Se un livello ISA95 non esiste (nessuna riga viene scritta)
+        """
+        chunk_size = chunk_size or self.BULK_CHUNK_SIZE
+
+        rows = self._normalize_concept_list(concept_list)
+        level_ids = self._resolve_concept_levels(rows, label)
+
+        link_table = link_model.__table__
+        link_fk_column = link_table.c[link_fk]
+
+        # updated_at va impostato esplicitamente: l'onupdate dell'ORM non vale per gli upsert
+        concept_upsert = self._upsert_statement(model.__table__, ["name"], ["description", "level_mask"],
+                                                {"updated_at": func.now()})
+        link_insert = self._upsert_statement(link_table, [link_fk, "isa95_id"])
+
+        report = {"inserted": 0, "updated": 0, "unchanged": 0}
+
+        try:
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+
+                # Stato attuale del chunk
+                existing = {name: (concept_id, description, level_mask)
+                            for concept_id, name, description, level_mask in self.session.execute(
+                                select(model.id, model.name, model.description, model.level_mask)
+                                .where(model.name.in_([name for name, _, _ in chunk])))}
+                current_levels = {}
+                if existing:
+                    for concept_id, isa95_id in self.session.execute(
+                            select(link_fk_column, link_table.c.isa95_id)
+                            .where(link_fk_column.in_([concept_id for concept_id, _, _ in existing.values()]))):
+                        current_levels.setdefault(concept_id, set()).add(isa95_id)
+
+                # Calcolo delle differenze
+                concepts_to_write = []
+                links_to_delete = []
+                links_to_add = {}
+                for name, description, levels in chunk:
+                    wanted_levels = {level_ids[level_name] for level_name in levels}
+                    wanted_mask = levels_to_mask(levels)
+
+                    if name not in existing:
+                        concepts_to_write.append({"name": name, "description": description,
+                                                  "level_mask": wanted_mask})
+                        links_to_add[name] = wanted_levels
+                        self._touch_levels(label, wanted_levels)
+                        report["inserted"] += 1
+                        continue
+
+                    concept_id, old_description, old_mask = existing[name]
+                    old_levels = current_levels.get(concept_id, set())
+                    if (old_description == description and old_levels == wanted_levels
+                            and old_mask == wanted_mask):
+                        report["unchanged"] += 1
+                        continue
+
+                    if old_description != description or old_mask != wanted_mask:
+                        concepts_to_write.append({"name": name, "description": description,
+                                                  "level_mask": wanted_mask})
+                    links_to_delete += [(concept_id, isa95_id) for isa95_id in old_levels - wanted_levels]
+                    links_to_add[name] = wanted_levels - old_levels
+                    self._touch_levels(label, old_levels | wanted_levels)
+                    report["updated"] += 1
+
+                if concepts_to_write:
+                    self.session.execute(concept_upsert, concepts_to_write)
+
+                # Id dei concetti nuovi
+                ids = {name: concept_id for name, (concept_id, _, _) in existing.items()}
+                new_names = [name for name in links_to_add if name not in existing]
+                if new_names:
+                    ids.update(self.session.execute(
+                        select(model.name, model.id).where(model.name.in_(new_names))).all())
+
+                if links_to_delete:
+                    self.session.execute(
+                        delete(link_table)
+                        .where(tuple_(link_fk_column, link_table.c.isa95_id).in_(links_to_delete)))
+
+                links = [{link_fk: ids[name], "isa95_id": isa95_id}
+                         for name, isa95_ids in links_to_add.items()
+                         for isa95_id in isa95_ids]
+                if links:
+                    self.session.execute(link_insert, links)
+        except Exception:
+            self._rollback()
+            raise
+
+        if commit:
+            self._commit()
+
+        print(f"Upsert {label}: {report['inserted']} inseriti, {report['updated']} aggiornati, "
+              f"{report['unchanged']} invariati")
+        return report
+
+    @_query_budget(8)
+    @_unit_of_work
+    def replace_intent_isa_levels(self,
                                 intent_id: int = None,
                                 intent_name: str = None,
                                 levels: ISA95LevelEnum = None):
         """
         Sostituisce completamente i livelli ISA95 di un intent.
+        Vengono scritti solo i link aggiunti / rimossi rispetto ai livelli attuali.
         
         Args:
             intent_id: ID dell'intent (opzionale)
@@ -197,26 +1155,45 @@ class RepositoryLayer():
             identifier = intent_id if intent_id else intent_name
             raise ValueError(f"Intent '{identifier}' non trovato nel database")
         
-        # Rimuovi tutti i link esistenti
-        self.session.query(IntentISA95Link)\
-            .filter(IntentISA95Link.intent_id == intent.id)\
-            .delete()
-        
-        # Aggiungi i nuovi livelli
-        for level_obj in levels:
-            level = self.session.query(ISA95Level).filter_by(name=level_obj.value).first()
-            if not level:
-                self.session.rollback()
-                raise ValueError(f"Livello ISA95 '{level_obj.value}' non trovato")
-            
-            link = IntentISA95Link(intent_id=intent.id, isa95_id=level.id)
-            self.session.add(link)
+        # Scrive solo le differenze rispetto ai livelli attuali
+        wanted = self._resolve_level_ids(levels)
+        current = set(self.session.execute(
+            select(IntentISA95Link.isa95_id).where(IntentISA95Link.intent_id == intent.id)).scalars())
+        level_mask = self._levels_mask(levels)
+        self._apply_level_changes(IntentISA95Link.__table__, "intent_id", "intent", {intent.id: (current, wanted)},
+                                  rewritten=[intent.id] if intent.level_mask != level_mask else [])
+        intent.level_mask = level_mask
         
-        self.session.commit()
+        self._commit()
         
-        print(f"Livelli sostituiti per intent '{intent.name}': {', '.join(level.value for level in levels)}")
+        print(f"Livelli sostituiti per intent '{intent.name}': {', '.join(getattr(level, 'value', level) for level in levels)}")
         return intent
 
+    @_unit_of_work
+    def replace_intents_isa_levels(self,
+                                   levels_by_intent: dict,
+                                   chunk_size: int = None):
+        """
+        Sostituisce i livelli ISA95 di molti intenti, scrivendo solo le differenze.
+        
+        Args:
+            levels_by_intent: {id o nome dell'intent: livello | [livelli]}
+            chunk_size: intenti per statement (default BULK_CHUNK_SIZE)
+        
+        Returns:
+            dict: {"updated": int, "unchanged": int}
+        
+        Raises:
+            ValueError: Se un intent o un livello non esiste (nessuna modifica viene scritta)
+        
+        Example:
+            replace_intents_isa_levels({"start_machine": ["SCADA", "MES"], 183: ISA95LevelEnum.LEVEL_4})
+        """
+        return self._replace_isa_levels(Intent, IntentISA95Link, "intent_id",
+                                        levels_by_intent, "intent", chunk_size)
+
+    @_query_budget(8)
+    @_unit_of_work
     def add_intent_isa_levels(self, 
                             intent_id: int = None,
                             intent_name: str = None,
@@ -250,11 +1227,14 @@ class RepositoryLayer():
         if not isinstance(levels, list):
             levels = [levels]
         
-        # Trova l'intent
+        # Trova l'intent con i suoi link (i livelli ISA95 restano nella sessione:
+        # link.isa95_level non fa altre query)
+        level_objects = self._load_isa95_levels()
+        query = self.session.query(Intent).options(selectinload(Intent.isa95_links))
         if intent_id is not None:
-            intent = self.session.query(Intent).filter_by(id=intent_id).first()
+            intent = query.filter_by(id=intent_id).first()
         else:
-            intent = self.session.query(Intent).filter_by(name=intent_name).first()
+            intent = query.filter_by(name=intent_name).first()
         
         if not intent:
             identifier = intent_id if intent_id else intent_name
@@ -262,28 +1242,33 @@ class RepositoryLayer():
         
         # Aggiungi livelli
         added_count = 0
+        added = []
         skipped = []
+        current_ids = {link.isa95_id for link in intent.isa95_links}
         
         for level_obj in levels:
-            level = self.session.query(ISA95Level).filter_by(name=level_obj.value).first()
-            if not level:
-                self.session.rollback()
-                raise ValueError(f"Livello ISA95 '{level_obj.value}' non trovato")
-            
-            # Controlla se il link già esiste
-            existing = self.session.query(IntentISA95Link).filter_by(
-                intent_id=intent.id,
-                isa95_id=level.id
-            ).first()
+            # livelli come ISA95LevelEnum o come nomi: nei messaggi il nome
+            level_value = getattr(level_obj, "value", level_obj)
+            level_id = self._get_isa95_level_id(level_obj)
+            if level_id is None:
+                self._rollback()
+                raise ValueError(f"Livello ISA95 '{level_value}' non trovato")
             
-            if not existing:
-                link = IntentISA95Link(intent_id=intent.id, isa95_id=level.id)
-                self.session.add(link)
+            # Controlla se il link già esiste (link già caricati)
+            if level_id not in current_ids:
+                intent.isa95_links.append(IntentISA95Link(isa95_level=level_objects[level_id]))
+                current_ids.add(level_id)
+                added.append(level_obj)
                 added_count += 1
             else:
-                skipped.append(level_obj.value)
+                skipped.append(level_value)
+        old_mask = intent.level_mask
+        self._change_level_mask(intent, IntentISA95Link.intent_id, added=added)
+        if added or intent.level_mask != old_mask:
+            # level_mask e updated_at cambiano nelle letture di tutti i livelli del concetto
+            self._touch_levels("intent", current_ids)
         
-        self.session.commit()
+        self._commit()
         
         # Messaggi
         if added_count > 0:
@@ -297,6 +1282,8 @@ class RepositoryLayer():
         
         return intent
 
+    @_query_budget(8)
+    @_unit_of_work
     def remove_intent_isa_levels(self, 
                                 intent_id: int = None,
                                 intent_name: str = None,
@@ -329,11 +1316,14 @@ class RepositoryLayer():
         if not isinstance(levels, list):
             levels = [levels]
         
-        # Trova l'intent
+        # Trova l'intent con i suoi link (i livelli ISA95 restano nella sessione:
+        # link.isa95_level non fa altre query)
+        level_objects = self._load_isa95_levels()
+        query = self.session.query(Intent).options(selectinload(Intent.isa95_links))
         if intent_id is not None:
-            intent = self.session.query(Intent).filter_by(id=intent_id).first()
+            intent = query.filter_by(id=intent_id).first()
         else:
-            intent = self.session.query(Intent).filter_by(name=intent_name).first()
+            intent = query.filter_by(name=intent_name).first()
         
         if not intent:
             identifier = intent_id if intent_id else intent_name
@@ -341,23 +1331,34 @@ class RepositoryLayer():
         
         # Rimuovi livelli
         removed_count = 0
+        removed = []
         not_found = []
+        current = {link.isa95_id: link for link in intent.isa95_links}
+        old_level_ids = set(current)
         
         for level_obj in levels:
-            level = self.session.query(ISA95Level).filter_by(name=level_obj.value).first()
-            if not level:
-                not_found.append(level_obj.value)
+            level_value = getattr(level_obj, "value", level_obj)
+            level_id = self._get_isa95_level_id(level_obj)
+            if level_id is None:
+                not_found.append(level_value)
                 continue
             
-            # Rimuovi il link
-            deleted = self.session.query(IntentISA95Link).filter_by(
-                intent_id=intent.id,
-                isa95_id=level.id
-            ).delete()
+            # Rimuovi il link (delete-orphan: DELETE al flush, uno solo per tutti i link)
+            link = current.pop(level_id, None)
+            deleted = 0
+            if link is not None:
+                intent.isa95_links.remove(link)
+                deleted = 1
+            if deleted:
+                removed.append(level_obj)
             
             removed_count += deleted
+        old_mask = intent.level_mask
+        self._change_level_mask(intent, IntentISA95Link.intent_id, removed=removed)
+        if removed or intent.level_mask != old_mask:
+            self._touch_levels("intent", old_level_ids)
         
-        self.session.commit()
+        self._commit()
         
         # Messaggi
         if removed_count > 0:
@@ -377,12 +1378,15 @@ class RepositoryLayer():
         
         return intent
 
+    @_query_budget(8)
+    @_unit_of_work
     def replace_entity_isa_levels(self, 
                              entity_id: int = None,
                              entity_name: str = None,
                              levels: ISA95LevelEnum = None):
         """
         Sostituisce completamente i livelli ISA95 di un'entità.
+        Vengono scritti solo i link aggiunti / rimossi rispetto ai livelli attuali.
         
         Args:
             entity_id: ID dell'entity (opzionale)
@@ -419,27 +1423,152 @@ class RepositoryLayer():
             identifier = entity_id if entity_id else entity_name
             raise ValueError(f"Entity '{identifier}' non trovata nel database")
         
-        # Rimuovi tutti i link esistenti
-        self.session.query(EntityISA95Link)\
-            .filter(EntityISA95Link.entity_id == entity.id)\
-            .delete()
+        # Scrive solo le differenze rispetto ai livelli attuali
+        wanted = self._resolve_level_ids(levels)
+        current = set(self.session.execute(
+            select(EntityISA95Link.isa95_id).where(EntityISA95Link.entity_id == entity.id)).scalars())
+        level_mask = self._levels_mask(levels)
+        self._apply_level_changes(EntityISA95Link.__table__, "entity_id", "entity", {entity.id: (current, wanted)},
+                                  rewritten=[entity.id] if entity.level_mask != level_mask else [])
+        entity.level_mask = level_mask
         
-        # Aggiungi i nuovi livelli
-        for level_obj in levels:
-            level = self.session.query(ISA95Level).filter_by(name=level_obj.value).first()
-            if not level:
-                self.session.rollback()
-                raise ValueError(f"Livello ISA95 '{level_obj.value}' non trovato")
-            
-            link = EntityISA95Link(entity_id=entity.id, isa95_id=level.id)
-            self.session.add(link)
+        self._commit()
         
-        self.session.commit()
-        
-        print(f"Livelli sostituiti per entity '{entity.name}': {', '.join(level.value for level in levels)}")
+        print(f"Livelli sostituiti per entity '{entity.name}': {', '.join(getattr(level, 'value', level) for level in levels)}")
         return entity
 
-    def add_entity_isa_levels(self, 
+    @_unit_of_work
+    def replace_entities_isa_levels(self,
+                                    levels_by_entity: dict,
+                                    chunk_size: int = None):
+        '''
+        same as replace_intents_isa_levels, for the entities
+        '''
+        return self._replace_isa_levels(Entity, EntityISA95Link, "entity_id",
+                                        levels_by_entity, "entity", chunk_size)
+
+    def _replace_isa_levels(self,
+                            model,
+                            link_model,
+                            link_fk: str,
+                            levels_by_concept: dict,
+                            label: str,
+                            chunk_size: int = None):
+        """
+        Sostituzione set-based dei livelli ISA95 di molti concetti.
+
+        Per ogni chunk di chunk_size concetti, indipendentemente dal numero di livelli:
+            1 SELECT dei concetti (id, level_mask)
+            1 SELECT dei loro link
+            solo se ci sono differenze:
+                1 DELETE dei link rimossi
+                1 INSERT dei link aggiunti
+                1 UPDATE ... CASE delle level_mask cambiate
+        più 1 COMMIT: riapplicare la stessa classificazione costa 2 statement per chunk.
+        """
+        chunk_size = chunk_size or self.BULK_CHUNK_SIZE
+
+        # Validazione dei livelli prima di qualsiasi scrittura
+        wanted = {}
+        for key, levels in levels_by_concept.items():
+            if not isinstance(levels, (list, tuple, set)):
+                levels = [levels]
+            if not levels:
+                raise ValueError(f"Devi fornire almeno un livello per {label} '{key}'")
+            wanted[key] = (self._resolve_level_ids(levels), self._levels_mask(levels))
+
+        link_table = link_model.__table__
+        link_fk_column = link_table.c[link_fk]
+        report = {"updated": 0, "unchanged": 0}
+
+        try:
+            for chunk in batched(list(wanted), chunk_size):
+                # le chiavi possono essere id o nomi
+                ids = [key for key in chunk if isinstance(key, int)]
+                names = [key for key in chunk if not isinstance(key, int)]
+                found = {}
+                for concept_id, name, level_mask in self.session.execute(
+                        select(model.id, model.name, model.level_mask)
+                        .where(or_(model.id.in_(ids), model.name.in_(names)))):
+                    found[concept_id] = found[name] = (concept_id, level_mask)
+
+                missing = [key for key in chunk if key not in found]
+                if missing:
+                    raise ValueError(f"{model.__name__} '{missing[0]}' non trovato nel database")
+
+                current = {}
+                for concept_id, isa95_id in self.session.execute(
+                        select(link_fk_column, link_table.c.isa95_id)
+                        .where(link_fk_column.in_([found[key][0] for key in chunk]))):
+                    current.setdefault(concept_id, set()).add(isa95_id)
+
+                changes = {}
+                masks = {}
+                for key in chunk:
+                    concept_id, old_mask = found[key]
+                    level_ids, mask = wanted[key]
+                    changes[concept_id] = (current.get(concept_id, set()), level_ids)
+                    if old_mask != mask:
+                        masks[concept_id] = mask
+
+                changed = self._apply_level_changes(link_table, link_fk, label, changes, rewritten=masks)
+                changed |= set(masks)
+                if masks:
+                    self.session.execute(
+                        update(model).where(model.id.in_(list(masks)))
+                        .values(level_mask=case(masks, value=model.id)),
+                        execution_options={"synchronize_session": False})
+
+                report["updated"] += len(changed)
+                report["unchanged"] += len(changes) - len(changed)
+        except Exception:
+            self._rollback()
+            raise
+
+        self._commit()
+
+        print(f"Livelli sostituiti {label}: {report['updated']} aggiornati, {report['unchanged']} invariati")
+        return report
+
+    def _resolve_level_ids(self, levels):
+        '''
+        returns the set of ids of the given ISA95 levels, raises ValueError if one does not exist
+        '''
+        level_ids = set()
+        for level in levels:
+            level_id = self._get_isa95_level_id(level)
+            if level_id is None:
+                raise ValueError(f"Livello ISA95 '{getattr(level, 'value', level)}' non trovato")
+            level_ids.add(level_id)
+        return level_ids
+
+    def _apply_level_changes(self, link_table, link_fk: str, label: str, changes, rewritten=()):
+        '''
+        applies {concept_id: (current level ids, wanted level ids)} with at most
+        1 DELETE of the removed links and 1 INSERT of the added ones,
+        returns the ids of the concepts whose links changed.
+        all the old and new levels of the changed concepts and of the rewritten ones
+        (e.g. a new level_mask) are touched, their cached rows are stale
+        '''
+        link_fk_column = link_table.c[link_fk]
+        removed = [(concept_id, level_id) for concept_id, (current, wanted) in changes.items()
+                   for level_id in current - wanted]
+        added = [{link_fk: concept_id, "isa95_id": level_id} for concept_id, (current, wanted) in changes.items()
+                 for level_id in wanted - current]
+
+        if removed:
+            self.session.execute(
+                delete(link_table).where(tuple_(link_fk_column, link_table.c.isa95_id).in_(removed)))
+        if added:
+            self.session.execute(insert(link_table), added)
+        changed = {concept_id for concept_id, (current, wanted) in changes.items() if current != wanted}
+        self._touch_levels(label, {level_id for concept_id in changed | set(rewritten)
+                                   for level_id in changes[concept_id][0] | changes[concept_id][1]})
+        return changed
+
+    @_query_budget(8)
+    @_unit_of_work
+    def add_entity_isa_levels(self, 
                             entity_id: int = None,
                             entity_name: str = None,
                             levels: ISA95LevelEnum = None):
@@ -471,11 +1600,14 @@ class RepositoryLayer():
         if not isinstance(levels, list):
             levels = [levels]
         
-        # Trova l'entity
+        # Trova l'entity con i suoi link (i livelli ISA95 restano nella sessione:
+        # link.isa95_level non fa altre query)
+        level_objects = self._load_isa95_levels()
+        query = self.session.query(Entity).options(selectinload(Entity.isa95_links))
         if entity_id is not None:
-            entity = self.session.query(Entity).filter_by(id=entity_id).first()
+            entity = query.filter_by(id=entity_id).first()
         else:
-            entity = self.session.query(Entity).filter_by(name=entity_name).first()
+            entity = query.filter_by(name=entity_name).first()
         
         if not entity:
             identifier = entity_id if entity_id else entity_name
@@ -483,28 +1615,33 @@ class RepositoryLayer():
         
         # Aggiungi livelli
         added_count = 0
+        added = []
         skipped = []
+        current_ids = {link.isa95_id for link in entity.isa95_links}
         
         for level_obj in levels:
-            level = self.session.query(ISA95Level).filter_by(name=level_obj.value).first()
-            if not level:
-                self.session.rollback()
-                raise ValueError(f"Livello ISA95 '{level_obj.value}' non trovato")
+            # livelli come ISA95LevelEnum o come nomi: nei messaggi il nome
+            level_value = getattr(level_obj, "value", level_obj)
+            level_id = self._get_isa95_level_id(level_obj)
+            if level_id is None:
+                self._rollback()
+                raise ValueError(f"Livello ISA95 '{level_value}' non trovato")
             
-            # Controlla se il link già esiste
-            existing = self.session.query(EntityISA95Link).filter_by(
-                entity_id=entity.id,
-                isa95_id=level.id
-            ).first()
-            
-            if not existing:
-                link = EntityISA95Link(entity_id=entity.id, isa95_id=level.id)
-                self.session.add(link)
+            # Controlla se il link già esiste (link già caricati)
+            if level_id not in current_ids:
+                entity.isa95_links.append(EntityISA95Link(isa95_level=level_objects[level_id]))
+                current_ids.add(level_id)
+                added.append(level_obj)
                 added_count += 1
             else:
-                skipped.append(level_obj.value)
+                skipped.append(level_value)
+        old_mask = entity.level_mask
+        self._change_level_mask(entity, EntityISA95Link.entity_id, added=added)
+        if added or entity.level_mask != old_mask:
+            # level_mask e updated_at cambiano nelle letture di tutti i livelli del concetto
+            self._touch_levels("entity", current_ids)
         
-        self.session.commit()
+        self._commit()
         
         # Messaggi
         if added_count > 0:
@@ -518,6 +1655,8 @@ class RepositoryLayer():
         
         return entity
 
+    @_query_budget(8)
+    @_unit_of_work
     def remove_entity_isa_levels(self, 
                                 entity_id: int = None,
                                 entity_name: str = None,
@@ -550,11 +1689,14 @@ class RepositoryLayer():
         if not isinstance(levels, list):
             levels = [levels]
         
-        # Trova l'entity
+        # Trova l'entity con i suoi link (i livelli ISA95 restano nella sessione:
+        # link.isa95_level non fa altre query)
+        level_objects = self._load_isa95_levels()
+        query = self.session.query(Entity).options(selectinload(Entity.isa95_links))
         if entity_id is not None:
-            entity = self.session.query(Entity).filter_by(id=entity_id).first()
+            entity = query.filter_by(id=entity_id).first()
         else:
-            entity = self.session.query(Entity).filter_by(name=entity_name).first()
+            entity = query.filter_by(name=entity_name).first()
         
         if not entity:
             identifier = entity_id if entity_id else entity_name
@@ -562,23 +1704,34 @@ class RepositoryLayer():
         
         # Rimuovi livelli
         removed_count = 0
+        removed = []
         not_found = []
+        current = {link.isa95_id: link for link in entity.isa95_links}
+        old_level_ids = set(current)
         
         for level_obj in levels:
-            level = self.session.query(ISA95Level).filter_by(name=level_obj.value).first()
-            if not level:
-                not_found.append(level_obj.value)
+            level_value = getattr(level_obj, "value", level_obj)
+            level_id = self._get_isa95_level_id(level_obj)
+            if level_id is None:
+                not_found.append(level_value)
                 continue
             
-            # Rimuovi il link
-            deleted = self.session.query(EntityISA95Link).filter_by(
-                entity_id=entity.id,
-                isa95_id=level.id
-            ).delete()
+            # Rimuovi il link (delete-orphan: DELETE al flush, uno solo per tutti i link)
+            link = current.pop(level_id, None)
+            deleted = 0
+            if link is not None:
+                entity.isa95_links.remove(link)
+                deleted = 1
+            if deleted:
+                removed.append(level_obj)
             
             removed_count += deleted
+        old_mask = entity.level_mask
+        self._change_level_mask(entity, EntityISA95Link.entity_id, removed=removed)
+        if removed or entity.level_mask != old_mask:
+            self._touch_levels("entity", old_level_ids)
         
-        self.session.commit()
+        self._commit()
         
         # Messaggi
         if removed_count > 0:
@@ -598,18 +1751,27 @@ class RepositoryLayer():
         
         return entity
         
+    @_unit_of_work
     def remove_intents(self, 
                     intent_ids: list[int] = None,
-                    intent_names: list[str] = None):
+                    intent_names: list[str] = None,
+                    bulk: bool = False,
+                    chunk_size: int = None):
         """
         Rimuove uno o più intenti dal database.
         Grazie al CASCADE, elimina automaticamente anche:
         - Link con livelli ISA95
         - Relazioni di matching con altri intenti
+        Link e relazioni non caricati nella sessione vengono eliminati dal ON DELETE CASCADE
+        del db (passive_deletes), anche senza bulk: le foreign key devono essere attive
+        (con SQLite PRAGMA foreign_keys=ON, impostato dagli engine di engine_factory).
         
         Args:
             intent_ids: Lista di ID degli intenti da rimuovere (opzionale)
             intent_names: Lista di nomi degli intenti da rimuovere (opzionale)
+            bulk: True per eliminare lato server con DELETE ... WHERE id IN (...),
+                  senza caricare gli intenti nella sessione (vedi _bulk_delete)
+            chunk_size: Valori per singolo DELETE in modalità bulk (default BULK_CHUNK_SIZE)
         
         Returns:
             int: Numero di intenti rimossi
@@ -623,6 +1785,9 @@ class RepositoryLayer():
             
             # Rimuovi singolo intent
             remove_intents(intent_ids=[180])
+            
+            # Purge di molti intenti
+            remove_intents(intent_names=deprecated_names, bulk=True)
         """
         
         # Validazione: almeno un parametro deve essere fornito
@@ -634,6 +1799,15 @@ class RepositoryLayer():
             print("Entrambi intent_ids e intent_names forniti, uso solo intent_ids")
             intent_names = None
         
+        if bulk:
+            if intent_ids is not None:
+                count = self._bulk_delete(Intent.id, intent_ids, chunk_size)
+            else:
+                count = self._bulk_delete(Intent.name, intent_names, chunk_size)
+            self._invalidate_relation_indexes("intent")
+            print(f"{count} intent/i eliminato/i")
+            return count
+        
         query = self.session.query(Intent)
         
         # Filtra per ID
@@ -657,26 +1831,36 @@ class RepositoryLayer():
             return 0
         
         # Elimina tutti gli intenti trovati (CASCADE elimina link e match)
+        self._touch_concept_levels("intent", Intent.id, [intent.id for intent in intents])
         for intent in intents:
             self.session.delete(intent)
         
-        self.session.commit()
+        self._commit()
+        self._invalidate_relation_indexes("intent")
         
         print(f"{count} intent/i eliminato/i")
         return count
 
+    @_unit_of_work
     def remove_entities(self,
                         entity_ids: list[int]=None,
-                        entity_names: list[str]=None):
+                        entity_names: list[str]=None,
+                        bulk: bool = False,
+                        chunk_size: int = None):
         """
         Rimuove uno o più entità dal database.
         Grazie al CASCADE, elimina automaticamente anche:
         - Link con livelli ISA95
         - Relazioni di matching con altre entità
+        Link e relazioni non caricati nella sessione vengono eliminati dal ON DELETE CASCADE
+        del db (passive_deletes), anche senza bulk: le foreign key devono essere attive
+        (con SQLite PRAGMA foreign_keys=ON, impostato dagli engine di engine_factory).
         
         Args:
             entity_ids: Lista di ID delle entità da rimuovere (opzionale)
             entity_names: Lista di nomi delle entità da rimuovere (opzionale)
+            bulk: True per eliminare lato server con DELETE ... WHERE id IN (...) (vedi _bulk_delete)
+            chunk_size: Valori per singolo DELETE in modalità bulk (default BULK_CHUNK_SIZE)
         
         Returns:
             int: Numero di entità rimosse
@@ -691,6 +1875,15 @@ class RepositoryLayer():
             print("Entrambi intent_ids e intent_names forniti, uso solo intent_ids")
             entity_names = None
         
+        if bulk:
+            if entity_ids is not None:
+                count = self._bulk_delete(Entity.id, entity_ids, chunk_size)
+            else:
+                count = self._bulk_delete(Entity.name, entity_names, chunk_size)
+            self._invalidate_relation_indexes("entity")
+            print(f"{count} entities eliminati")
+            return count
+        
         query = self.session.query(Entity)
     
         # Filtra per ID
@@ -714,14 +1907,57 @@ class RepositoryLayer():
             return 0
         
         # Elimina tutti gli intenti trovati (CASCADE elimina link e match)
+        self._touch_concept_levels("entity", Entity.id, [entity.id for entity in entities])
         for entity in entities:
             self.session.delete(entity)
         
-        self.session.commit()
+        self._commit()
+        self._invalidate_relation_indexes("entity")
         
         print(f"{count} entities eliminati")
         return count
 
+    def _bulk_delete(self, key_column, keys, chunk_size: int = None):
+        """
+        Eliminazione set-based: un DELETE ... WHERE key_column IN (...) per ogni chunk,
+        senza caricare le righe nella sessione.
+        Link ISA95 e match vengono eliminati dal database (ON DELETE CASCADE,
+        relationship con passive_deletes): su SQLite serve PRAGMA foreign_keys=ON,
+        impostato dagli engine di engine_factory.
+        
+        Statement: ceil(len(keys) / chunk_size) DELETE + 1 COMMIT
+        
+        Args:
+            key_column: colonna del filtro, es. Intent.id / Intent.name
+            keys: valore o lista di valori
+            chunk_size: valori per statement (default BULK_CHUNK_SIZE)
+        
+        Returns:
+            int: Numero di righe eliminate
+        """
+        if not isinstance(keys, (list, tuple, set)):
+            keys = [keys]
+        keys = list(dict.fromkeys(keys))
+        chunk_size = chunk_size or self.BULK_CHUNK_SIZE
+        model = key_column.class_
+
+        count = 0
+        try:
+            self._touch_concept_levels("intent" if model is Intent else "entity", key_column, keys)
+            for chunk in batched(keys, chunk_size):
+                result = self.session.execute(
+                    delete(model).where(key_column.in_(chunk)),
+                    execution_options={"synchronize_session": False})
+                count += result.rowcount
+        except Exception:
+            self._rollback()
+            raise
+
+        self._commit()
+        return count
+
+    @_query_budget(6)
+    @_unit_of_work
     def modify_intent_description(self, 
                                 intent_id: int = None,
                                 intent_name: str = None,
@@ -769,13 +2005,16 @@ class RepositoryLayer():
         
         # Modifica la descrizione
         intent.description = new_description
+        self._touch_concept_levels("intent", Intent.id, [intent.id])
         
-        self.session.commit()
+        self._commit()
         
         print(f"Descrizione modificata per intent '{intent.name}'")
         
         return intent
 
+    @_query_budget(6)
+    @_unit_of_work
     def modify_entity_description(self, 
                                 entity_id: int = None,
                                 entity_name: str = None,
@@ -823,14 +2062,17 @@ class RepositoryLayer():
         
         # Modifica la descrizione
         entity.description = new_description
+        self._touch_concept_levels("entity", Entity.id, [entity.id])
         
-        self.session.commit()
+        self._commit()
         
         print(f"Descrizione modificata per entity '{entity.name}'")
         
         return entity
 
     # intent and entity relations management
+    @_query_budget(6)
+    @_unit_of_work
     def define_intents_relation(self,
                                 id_intent_a,
                                 id_intent_b,
@@ -871,24 +2113,21 @@ class RepositoryLayer():
         if intent_a_obj.id == intent_b_obj.id:
             raise ValueError(f"Non è possibile creare una relazione di un intent con se stesso")
         
-        # Controlla se la relazione già esiste (in entrambe le direzioni)
+        # Controlla se la relazione già esiste (in entrambe le direzioni):
+        # un solo accesso all'indice unique_intent_pair
         existing_match = self.session.query(IntentMatch).filter(
-            or_(
-                and_(IntentMatch.intent_a_id == id_intent_a, IntentMatch.intent_b_id == id_intent_b),
-                and_(IntentMatch.intent_a_id == id_intent_b, IntentMatch.intent_b_id == id_intent_a)
-            )
+            IntentMatch.min_id == min(id_intent_a, id_intent_b),
+            IntentMatch.max_id == max(id_intent_a, id_intent_b)
         ).first()
         
         if existing_match:
-            inverted_match = self.session.query(IntentMatch).filter(
-                and_(IntentMatch.intent_a_id == id_intent_b, IntentMatch.intent_b_id == id_intent_a)
-            ).first()
-            if inverted_match:
-                existing_match.intent_a_id = id_intent_a
-                existing_match.intent_b_id = id_intent_b
+            # Normalizza sempre nella direzione richiesta
+            existing_match.intent_a_id = id_intent_a
+            existing_match.intent_b_id = id_intent_b
             existing_match.relation_type = relation_type
             existing_match.confidence = confidence
-            self.session.commit()
+            self._commit()
+            self._notify_relation_indexes("intent", "set_edge", id_intent_a, id_intent_b, relation_type, confidence)
             print(f"Relation updated")
             return existing_match
 
@@ -901,11 +2140,14 @@ class RepositoryLayer():
         )
         
         self.session.add(match)
-        self.session.commit()
+        self._commit()
+        self._notify_relation_indexes("intent", "set_edge", id_intent_a, id_intent_b, relation_type, confidence)
         
         print(f"relation created: {intent_a_obj.name} → {intent_b_obj.name} ({relation_type.value}, conf: {confidence})")
         return match
 
+    @_query_budget(6)
+    @_unit_of_work
     def define_entities_relation(self,
                                 id_entity_a,
                                 id_entity_b,
@@ -945,28 +2187,22 @@ class RepositoryLayer():
         if entity_a_obj.id == entity_b_obj.id:
             raise ValueError(f"Non è possibile creare una relazione di una entity con se stessa")
         
-        # Controlla se la relazione già esiste (in entrambe le direzioni)
+        # Controlla se la relazione già esiste (in entrambe le direzioni):
+        # un solo accesso all'indice unique_entity_pair
         existing_match = self.session.query(EntityMatch).filter(
-            or_(
-                and_(EntityMatch.entity_a_id == id_entity_a, EntityMatch.entity_b_id == id_entity_b),
-                and_(EntityMatch.entity_a_id == id_entity_b, EntityMatch.entity_b_id == id_entity_a)
-            )
+            EntityMatch.min_id == min(id_entity_a, id_entity_b),
+            EntityMatch.max_id == max(id_entity_a, id_entity_b)
         ).first()
         
         if existing_match:
             # Normalizza sempre nella direzione richiesta
-            
-            inverted_match = self.session.query(IntentMatch).filter(
-                and_(EntityMatch.entity_a_id == id_entity_b, EntityMatch.entity_b_id == id_entity_a)
-            ).first()
-                
-            if inverted_match:
-                existing_match.entity_a_id = id_entity_a
-                existing_match.entity_b_id = id_entity_b
+            existing_match.entity_a_id = id_entity_a
+            existing_match.entity_b_id = id_entity_b
 
             existing_match.relation_type = relation_type
             existing_match.confidence = confidence
-            self.session.commit()
+            self._commit()
+            self._notify_relation_indexes("entity", "set_edge", id_entity_a, id_entity_b, relation_type, confidence)
             print(f"Relation updated: {entity_a_obj.name} ↔ {entity_b_obj.name}")
             return existing_match
         
@@ -979,11 +2215,172 @@ class RepositoryLayer():
         )
         
         self.session.add(match)
-        self.session.commit()
+        self._commit()
+        self._notify_relation_indexes("entity", "set_edge", id_entity_a, id_entity_b, relation_type, confidence)
         
         print(f"Relation created: {entity_a_obj.name} → {entity_b_obj.name} ({relation_type.value}, conf: {confidence})")
         return match
 
+    @_unit_of_work
+    def define_intents_relations(self,
+                                 pairs,
+                                 batch_size: int = None,
+                                 chunk_size: int = None):
+        """
+        Versione batch di define_intents_relation, per molte coppie alla volta.
+        
+        Args:
+            pairs: iterabile di (id_intent_a, id_intent_b, relation_type, confidence),
+                   confidence può essere omessa (default 1.0)
+            batch_size: coppie per transazione (default BULK_CHUNK_SIZE)
+            chunk_size: coppie per statement (default BULK_CHUNK_SIZE)
+        
+        Returns:
+            dict: {"inserted": int, "updated": int, "unchanged": int}
+        
+        Raises:
+            ValueError: Se un intent non esiste o una coppia non è valida
+                        (i batch precedenti restano nel db)
+        
+        Example:
+            define_intents_relations((a, b, RelationType.EQUIVALENT, score)
+                                     for a, b, score in matcher_output)
+        """
+        return self._define_relations(Intent, IntentMatch, "intent_a_id", "intent_b_id",
+                                      pairs, "intent", batch_size, chunk_size)
+
+    @_unit_of_work
+    def define_entities_relations(self,
+                                  pairs,
+                                  batch_size: int = None,
+                                  chunk_size: int = None):
+        '''
+        batch version of define_entities_relation, see define_intents_relations
+        '''
+        return self._define_relations(Entity, EntityMatch, "entity_a_id", "entity_b_id",
+                                      pairs, "entity", batch_size, chunk_size)
+
+    def _define_relations(self,
+                          model,
+                          match_model,
+                          a_column: str,
+                          b_column: str,
+                          pairs,
+                          label: str,
+                          batch_size: int = None,
+                          chunk_size: int = None):
+        """
+        Crea o aggiorna relazioni in modo set-based, con la stessa semantica di
+        define_intents_relation: una coppia ha al più una relazione, in qualunque
+        direzione sia salvata, e la direzione viene allineata a quella richiesta.
+        Se la stessa coppia compare più volte in un chunk vale l'ultima.
+
+        Per ogni chunk di chunk_size coppie:
+            1 SELECT degli id esistenti (validazione)
+            1 SELECT delle relazioni esistenti (indice unique_*_pair)
+            solo se ci sono modifiche:
+                1 INSERT ... ON DUPLICATE KEY UPDATE (ON CONFLICT su SQLite) sulla
+                  coppia canonica (min_id, max_id), che aggiorna anche la direzione
+        più 1 COMMIT ogni batch_size coppie.
+
+        Args:
+            model: Intent o Entity
+            match_model: IntentMatch o EntityMatch
+            a_column / b_column: colonne FK del match ("intent_a_id" / "intent_b_id")
+            pairs: iterabile di (a, b, relation_type[, confidence])
+            label: "intent" / "entity", usato nei messaggi
+            batch_size: coppie per transazione (default BULK_CHUNK_SIZE)
+            chunk_size: coppie per statement (default BULK_CHUNK_SIZE)
+
+        Returns:
+            dict: {"inserted": int, "updated": int, "unchanged": int}
+        """
+        batch_size = batch_size or self.BULK_CHUNK_SIZE
+        chunk_size = min(chunk_size or self.BULK_CHUNK_SIZE, batch_size)
+
+        match_table = match_model.__table__
+        a_id = match_table.c[a_column]
+        b_id = match_table.c[b_column]
+        match_upsert = self._upsert_statement(match_table, ["min_id", "max_id"],
+                                              [a_column, b_column, "relation_type", "confidence"])
+
+        report = {"inserted": 0, "updated": 0, "unchanged": 0}
+
+        for batch in batched(pairs, batch_size):
+            written = []
+            try:
+                for chunk in batched(batch, chunk_size):
+                    chunk_report = self._define_relations_chunk(model, match_model, a_id, b_id,
+                                                                match_upsert, chunk, label, written)
+                    for key, value in chunk_report.items():
+                        report[key] += value
+            except Exception:
+                self._rollback()
+                raise
+            self._commit()
+
+            for values in written:
+                self._notify_relation_indexes(label, "set_edge", values[a_column], values[b_column],
+                                      values["relation_type"], values["confidence"])
+
+        print(f"Relazioni {label}: {report['inserted']} create, {report['updated']} aggiornate, "
+              f"{report['unchanged']} invariate")
+        return report
+
+    def _define_relations_chunk(self, model, match_model, a_id, b_id, match_upsert, chunk, label: str,
+                                written: list):
+        '''
+        validates and writes one chunk of pairs, see _define_relations.
+        the written rows are appended to written
+        '''
+        # Normalizzazione: una sola richiesta per coppia non ordinata
+        requested = {}
+        for pair in chunk:
+            a, b, relation_type, *rest = pair
+            confidence = rest[0] if rest else 1.0
+            if not isinstance(relation_type, RelationType):
+                relation_type = RelationType(relation_type)
+            if not 0.0 <= confidence <= 1.0:
+                raise ValueError(f"Confidence must be between 0.0 e 1.0, got: {confidence}")
+            if a == b:
+                raise ValueError(f"Non è possibile creare una relazione di un {label} con se stesso ({a})")
+            requested[(min(a, b), max(a, b))] = (a, b, relation_type, confidence)
+
+        # Validazione esistenza, una query per tutto il chunk
+        ids = {concept_id for key in requested for concept_id in key}
+        found = set(self.session.execute(select(model.id).where(model.id.in_(ids))).scalars())
+        missing = ids - found
+        if missing:
+            raise ValueError(f"{label} con ID {sorted(missing)} non trovati nel database")
+
+        # Relazioni già presenti, in qualunque direzione: ricerca sulla coppia canonica
+        existing = {}
+        for min_id, max_id, a, relation_type, confidence in self.session.execute(
+                select(match_model.min_id, match_model.max_id, a_id,
+                       match_model.relation_type, match_model.confidence)
+                .where(tuple_(match_model.min_id, match_model.max_id).in_(list(requested)))):
+            existing[(min_id, max_id)] = (a, relation_type, confidence)
+
+        report = {"inserted": 0, "updated": 0, "unchanged": 0}
+        to_upsert = []
+        for key, (a, b, relation_type, confidence) in requested.items():
+            if key not in existing:
+                report["inserted"] += 1
+            elif existing[key] == (a, relation_type, confidence):
+                report["unchanged"] += 1
+                continue
+            else:
+                report["updated"] += 1
+            to_upsert.append({a_id.key: a, b_id.key: b,
+                              "relation_type": relation_type, "confidence": confidence})
+
+        if to_upsert:
+            self.session.execute(match_upsert, to_upsert)
+        written += to_upsert
+        return report
+
+    @_query_budget(4)
+    @_unit_of_work
     def remove_intents_relation(self,  
                            id_intent_a: int = None,
                            id_intent_b: int = None,
@@ -1008,38 +2405,41 @@ class RepositoryLayer():
             # Rimuovi tutte le relazioni BROADER tra due intent specifici
             remove_intents_relation(id_intent_a=180, id_intent_b=181, relation_type=RelationType.BROADER)
         """
-        query = self.session.query(IntentMatch)
         # Validazione: almeno un parametro deve essere fornito
         if match_id is None and (id_intent_a is None or id_intent_b is None):
             raise ValueError("Devi fornire o 'match_id' oppure sia 'id_intent_a' che 'id_intent_b'")
     
         # Caso 1: Rimuovi per match_id specifico
         if match_id is not None:
-            query = query.filter(IntentMatch.id == match_id)
+            condition = IntentMatch.id == match_id
         
         # Caso 2: Rimuovi per coppia di intent (bidirezionale)
         else: #  id_intent_a is not None and id_intent_b is not None:
-            query = query.filter(
-                and_(IntentMatch.intent_a_id == id_intent_a, IntentMatch.intent_b_id == id_intent_b)
-            )
+            condition = and_(IntentMatch.intent_a_id == id_intent_a, IntentMatch.intent_b_id == id_intent_b)
+        
+        # Coppia della relazione, serve solo per aggiornare gli indici registrati
+        pair = (id_intent_a, id_intent_b)
+        if match_id is not None and self._relation_indexes["intent"]:
+            pair = self.session.execute(
+                select(IntentMatch.intent_a_id, IntentMatch.intent_b_id).where(condition)).first()
         
-        # Esegui la query
-        matches = query.all()
-        count = len(matches)
+        # Un solo DELETE lato server, senza caricare le relazioni
+        count = self.session.execute(delete(IntentMatch).where(condition),
+                                     execution_options={"synchronize_session": False}).rowcount
         
         if count == 0:
             print("Nessuna relazione trovata con i criteri specificati")
             return 0
         
-        # Elimina tutte le relazioni trovate
-        for match in matches:
-            self.session.delete(match)
-        
-        self.session.commit()
+        self._commit()
+        if pair is not None:
+            self._notify_relation_indexes("intent", "remove_edge", *pair)
         
         print(f"{count} relazione/i rimossa/e")
         return count
 
+    @_query_budget(4)
+    @_unit_of_work
     def remove_entities_relation(self,
                                  id_entity_a: int=None,
                                  id_entity_b: int=None,
@@ -1047,38 +2447,42 @@ class RepositoryLayer():
         '''
         removes entity relations ...
         '''
-        query = self.session.query(EntityMatch)
         # Validazione: almeno un parametro deve essere fornito
         if match_id is None and (id_entity_a is None or id_entity_b is None):
             raise ValueError("Devi fornire o 'match_id' oppure sia 'id_entity_a' che 'id_entity_b'")
     
         # Caso 1: Rimuovi per match_id specifico
         if match_id is not None:
-            query = query.filter(EntityMatch.id == match_id)
+            condition = EntityMatch.id == match_id
         else:
-            query = query.filter(
-                # devi rimuovere esattamente la combinazione [id_entity_a, id_entity_b]
-                # non il contrario, la direzione è importante
-                and_(EntityMatch.entity_a_id == id_entity_a, EntityMatch.entity_b_id == id_entity_b)
-            )
+            # devi rimuovere esattamente la combinazione [id_entity_a, id_entity_b]
+            # non il contrario, la direzione è importante
+            condition = and_(EntityMatch.entity_a_id == id_entity_a, EntityMatch.entity_b_id == id_entity_b)
 
-        # Esegui la query
-        matches = query.all()
-        count = len(matches)
+        # Coppia della relazione, serve solo per aggiornare gli indici registrati
+        pair = (id_entity_a, id_entity_b)
+        if match_id is not None and self._relation_indexes["entity"]:
+            pair = self.session.execute(
+                select(EntityMatch.entity_a_id, EntityMatch.entity_b_id).where(condition)).first()
+        
+        # Un solo DELETE lato server, senza caricare le relazioni
+        count = self.session.execute(delete(EntityMatch).where(condition),
+                                     execution_options={"synchronize_session": False}).rowcount
         
         if count == 0:
             print("Nessuna relazione trovata con i criteri specificati")
             return 0
         
-        # Elimina tutte le relazioni trovate
-        for match in matches:
-            self.session.delete(match)
-        
-        self.session.commit()
+        self._commit()
+        if pair is not None:
+            self._notify_relation_indexes("entity", "remove_edge", *pair)
         
         print(f"{count} relazione/i rimossa/e")
         return count
 
+    @_cached_by_level
+    @_query_budget(2)
+    @_unit_of_work
     def get_intents_by_isa95_level(self, level: ISA95LevelEnum):
         """
         Recupera tutti gli intenti associati a un livello ISA95 specifico.
@@ -1098,22 +2502,25 @@ class RepositoryLayer():
                 print(f"{intent.name}: {intent.description}")
         """
         # Trova il livello ISA95
-        level = self.session.query(ISA95Level).filter_by(name=level.value).first()
+        level_id = self._get_isa95_level_id(level)
         
-        if not level:
-            raise ValueError(f"Livello ISA95 '{level.name}' non trovato. "
+        if level_id is None:
+            raise ValueError(f"Livello ISA95 '{level.value}' non trovato. "
                             f"Livelli disponibili: DEFAULT, PLC, SCADA, MES, ERP")
         
         # Query per trovare gli intenti associati
         intents = self.session.query(Intent)\
             .join(IntentISA95Link)\
-            .filter(IntentISA95Link.isa95_id == level.id)\
+            .filter(IntentISA95Link.isa95_id == level_id)\
             .all()
         
-        print(f"Trovati {len(intents)} intent/i per livello '{level.name}'")
+        print(f"Trovati {len(intents)} intent/i per livello '{level.value}'")
         
         return intents
 
+    @_cached_by_level
+    @_query_budget(2)
+    @_unit_of_work
     def get_entities_by_isa95_level(self, level: ISA95LevelEnum):
         """
         Recupera tutte le entità associati a un livello ISA95 specifico.
@@ -1133,67 +2540,658 @@ class RepositoryLayer():
                 print(f"{entity.name}: {entity.description}")
         """
         # Trova il livello ISA95
-        level = self.session.query(ISA95Level).filter_by(name=level.value).first()
+        level_id = self._get_isa95_level_id(level)
         
-        if not level:
-            raise ValueError(f"Livello ISA95 '{level.name}' non trovato. "
+        if level_id is None:
+            raise ValueError(f"Livello ISA95 '{level.value}' non trovato. "
                             f"Livelli disponibili: DEFAULT, PLC, SCADA, MES, ERP")
         
         # Query per trovare gli intenti associati
         entities = self.session.query(Entity)\
             .join(EntityISA95Link)\
-            .filter(EntityISA95Link.isa95_id == level.id)\
+            .filter(EntityISA95Link.isa95_id == level_id)\
             .all()
         
-        print(f"Trovati {len(entities)} intent/i per livello '{level.name}'")
+        print(f"Trovati {len(entities)} intent/i per livello '{level.value}'")
         
         return entities
 
-import url
-
-# Crea il motore SQLAlchemy
-engine = create_engine(url.url, echo=True)
-Base.metadata.create_all(engine)
-
-repository_obj = RepositoryLayer(engine)
-repository_obj.populate_default_db_configuration()
-# repository_obj.populate_default_db_configuration()
-# repository_obj.define_intents_relation(180, 181, RelationType.DEPRECATED)
-# repository_obj.define_intents_relation(181, 182, RelationType.DEPRECATED)
-# repository_obj.define_intents_relation(182, 183, RelationType.DEPRECATED)
-# repository_obj.define_intents_relation(180, 181, RelationType.BROADER)
-# repository_obj.define_entities_relation(74, 75, RelationType.EQUIVALENT)
-# repository_obj.remove_intents_relation(match_id=8)
-# repository_obj.remove_intents_relation(182, 183)
-#
-# repository_obj.define_entities_relation(75, 90, RelationType.DEPRECATED)
-# repository_obj.define_entities_relation(90, 77, RelationType.DEPRECATED)
-# repository_obj.define_entities_relation(78, 79, RelationType.DEPRECATED)
-# repository_obj.define_entities_relation(80, 82, RelationType.DEPRECATED)
-# repository_obj.remove_entities_relation(match_id=4)
-# repository_obj.define_intents_relation(181, 182, RelationType.EQUIVALENT)
-# repository_obj.remove_intents(intent_ids=[181, 182])
-# repository_obj.remove_entities(entity_ids=[75, 78])
-# repository_obj.remove_entities(entity_names=['logical_entity', 'failure_mode'])
-
-
-# out = repository_obj.get_intents_by_isa95_level(ISA95LevelEnum.LEVEL_2)
-# print([elem.id for elem in out])
-# out = repository_obj.get_entities_by_isa95_level(ISA95LevelEnum.LEVEL_2)
-# print([elem.id for elem in out])
-
-# repository_obj.add_intent_isa_levels(183, levels= ISA95LevelEnum.LEVEL_0)
-# repository_obj.remove_intent_isa_levels(183, levels= ISA95LevelEnum.LEVEL_0)
-# repository_obj.replace_intent_isa_levels(183, levels= [ISA95LevelEnum.LEVEL_0,ISA95LevelEnum.LEVEL_4,ISA95LevelEnum.LEVEL_3])
-
-
-# repository_obj.add_entity_isa_levels(77, levels=[ISA95LevelEnum.LEVEL_0,ISA95LevelEnum.LEVEL_4,ISA95LevelEnum.LEVEL_3])
-# repository_obj.replace_entity_isa_levels(77, levels=[ISA95LevelEnum.LEVEL_0])
-
-# repository_obj.remove_entity_isa_levels(77, levels=[ISA95LevelEnum.LEVEL_4,ISA95LevelEnum.LEVEL_3])
-
-# repository_obj.modify_intent_description(intent_id=183, new_description="andiamo a mangiare")
-# repository_obj.modify_intent_description(intent_name="check_production_status", new_description="le tagliatelle")
-
-# repository_obj.modify_entity_description(entity_id=77, new_description="andiamo a mangiare")
-# repository_obj.modify_entity_description(entity_name="measurement_value_scada", new_description="le tagliatelle")
+    # transitive closure of the relations
+    def get_intent_closure(self, threshold: float = 0.0):
+        """
+        Restituisce un indice in memoria delle classi di equivalenza e della
+        gerarchia BROADER / NARROWER degli intenti (vedi relation_closure).
+        L'indice viene caricato alla prima interrogazione e poi aggiornato arco per arco
+        dai metodi di questo repository che modificano le relazioni.
+        Le modifiche fatte da altri processi vengono rilevate tramite ontology_version
+        (vedi check_ontology_version); quelle annullate dal chiamante in use_session
+        no: in quel caso usare closure.invalidate().
+        Le chiamate con lo stesso threshold restituiscono la stessa closure: può essere
+        richiesta a ogni uso senza che il repository accumuli indici da aggiornare.
+        
+        Args:
+            threshold: confidence minima di un arco EQUIVALENT per unire due classi
+        
+        Returns:
+            RelationClosure: condivisa tra le chiamate con lo stesso threshold
+        
+        Example:
+            closure = repository.get_intent_closure(threshold=0.8)
+            closure.members(180)          # tutti gli intenti equivalenti a 180
+            closure.same_class(180, 183)
+        """
+        return self._get_closure("intent", IntentMatch, "intent_a_id", "intent_b_id", threshold)
+
+    def get_entity_closure(self, threshold: float = 0.0):
+        '''
+        same as get_intent_closure, for the entities
+        '''
+        return self._get_closure("entity", EntityMatch, "entity_a_id", "entity_b_id", threshold)
+
+    def _get_closure(self, label: str, match_model, a_column: str, b_column: str, threshold: float):
+        '''
+        returns the registered closure of (label, threshold), creating and registering it once
+        '''
+        with self._relation_indexes_lock:
+            closure = self._closures.get((label, threshold))
+            if closure is None:
+                closure = RelationClosure(lambda: self._get_relation_edges(match_model, a_column, b_column),
+                                          threshold, refresh=self.check_ontology_version)
+                self._closures[(label, threshold)] = closure
+                self._relation_indexes[label].append(closure)
+            return closure
+
+    @_unit_of_work
+    def _get_relation_edges(self, match_model, a_column: str, b_column: str):
+        '''
+        returns all the (a, b, relation_type, confidence) edges, with a single query
+        '''
+        return self.session.execute(
+            select(getattr(match_model, a_column), getattr(match_model, b_column),
+                   match_model.relation_type, match_model.confidence)).all()
+
+    def _notify_relation_indexes(self, label: str, method_name: str, *args):
+        for index in self._relation_indexes[label]:
+            getattr(index, method_name)(*args)
+
+    def _invalidate_relation_indexes(self, label: str):
+        for index in self._relation_indexes[label]:
+            index.invalidate()
+
+    # deprecation resolution
+    def get_intent_deprecation_resolver(self):
+        """
+        Restituisce un resolver in memoria dei nomi di intent deprecati verso il
+        loro successore attuale (vedi deprecation_resolver).
+        La mappa viene costruita con una query alla prima risoluzione e ricostruita
+        dopo ogni modifica di una relazione DEPRECATED fatta da questo repository.
+        Ogni chiamata restituisce lo stesso resolver.
+        
+        Returns:
+            DeprecationResolver: condiviso tra le chiamate
+        
+        Example:
+            resolver = repository.get_intent_deprecation_resolver()
+            intent_name = resolver.resolve(incoming_name)
+        """
+        return self._get_deprecation_resolver("intent", Intent, IntentMatch, "intent_a_id", "intent_b_id")
+
+    def get_entity_deprecation_resolver(self):
+        '''
+        same as get_intent_deprecation_resolver, for the entities
+        '''
+        return self._get_deprecation_resolver("entity", Entity, EntityMatch, "entity_a_id", "entity_b_id")
+
+    def _get_deprecation_resolver(self, label: str, model, match_model, a_column: str, b_column: str):
+        '''
+        returns the registered resolver of label, creating and registering it once
+        '''
+        with self._relation_indexes_lock:
+            resolver = self._deprecation_resolvers.get(label)
+            if resolver is None:
+                resolver = DeprecationResolver(
+                    lambda: self._get_deprecation_edges(model, match_model, a_column, b_column),
+                    refresh=self.check_ontology_version)
+                self._deprecation_resolvers[label] = resolver
+                self._relation_indexes[label].append(resolver)
+            return resolver
+
+    @_unit_of_work
+    def _get_deprecation_edges(self, model, match_model, a_column: str, b_column: str):
+        '''
+        returns the (a_id, b_id, a_name, b_name, confidence) DEPRECATED edges, with a single query
+        '''
+        concept_a = aliased(model)
+        concept_b = aliased(model)
+        a_id = getattr(match_model, a_column)
+        b_id = getattr(match_model, b_column)
+        return self.session.execute(
+            select(a_id, b_id, concept_a.name, concept_b.name, match_model.confidence)
+            .join(concept_a, concept_a.id == a_id)
+            .join(concept_b, concept_b.id == b_id)
+            .where(match_model.relation_type == RelationType.DEPRECATED)).all()
+
+    # recursive relation queries
+    @_unit_of_work
+    def get_intent_replacement(self,
+                               intent_id: int = None,
+                               intent_name: str = None,
+                               max_depth: int = 32):
+        """
+        Segue la catena DEPRECATED (a -> b: a è sostituito da b) fino all'intent
+        attuale, con una sola query WITH RECURSIVE.
+        
+        Args:
+            intent_id: ID dell'intent (opzionale)
+            intent_name: Nome dell'intent (opzionale)
+            max_depth: lunghezza massima della catena
+        
+        Returns:
+            RelationPathRecord: intent finale con profondità, prodotto delle confidence
+                                e path degli id; None se l'intent non è deprecato
+                                (o la catena è ciclica / più lunga di max_depth)
+        
+        Example:
+            get_intent_replacement(180)    # 180 -> 181 -> 182 -> 183: intent 183, depth 3
+        """
+        rows = self._walk_relations(Intent, IntentMatch, "intent_a_id", "intent_b_id",
+                                    intent_id, intent_name, [RelationType.DEPRECATED], [], max_depth,
+                                    terminal_only=True)
+        return rows[0] if rows else None
+
+    @_unit_of_work
+    def get_intent_descendants(self,
+                               intent_id: int = None,
+                               intent_name: str = None,
+                               max_depth: int = 10):
+        """
+        Tutti gli intenti più specifici (NARROWER, o BROADER nel verso opposto)
+        fino a max_depth livelli, con una sola query WITH RECURSIVE.
+        
+        Args:
+            intent_id: ID dell'intent (opzionale)
+            intent_name: Nome dell'intent (opzionale)
+            max_depth: profondità massima
+        
+        Returns:
+            list[RelationPathRecord]: un record per intent (il percorso più corto),
+                                      ordinati per profondità
+        """
+        return self._walk_relations(Intent, IntentMatch, "intent_a_id", "intent_b_id",
+                                    intent_id, intent_name,
+                                    [RelationType.NARROWER], [RelationType.BROADER], max_depth)
+
+    @_unit_of_work
+    def get_intent_ancestors(self,
+                             intent_id: int = None,
+                             intent_name: str = None,
+                             max_depth: int = 10):
+        '''
+        all the broader intents up to max_depth levels, see get_intent_descendants
+        '''
+        return self._walk_relations(Intent, IntentMatch, "intent_a_id", "intent_b_id",
+                                    intent_id, intent_name,
+                                    [RelationType.BROADER], [RelationType.NARROWER], max_depth)
+
+    @_unit_of_work
+    def get_entity_replacement(self,
+                               entity_id: int = None,
+                               entity_name: str = None,
+                               max_depth: int = 32):
+        '''
+        same as get_intent_replacement, for the entities
+        '''
+        rows = self._walk_relations(Entity, EntityMatch, "entity_a_id", "entity_b_id",
+                                    entity_id, entity_name, [RelationType.DEPRECATED], [], max_depth,
+                                    terminal_only=True)
+        return rows[0] if rows else None
+
+    @_unit_of_work
+    def get_entity_descendants(self,
+                               entity_id: int = None,
+                               entity_name: str = None,
+                               max_depth: int = 10):
+        '''
+        same as get_intent_descendants, for the entities
+        '''
+        return self._walk_relations(Entity, EntityMatch, "entity_a_id", "entity_b_id",
+                                    entity_id, entity_name,
+                                    [RelationType.NARROWER], [RelationType.BROADER], max_depth)
+
+    @_unit_of_work
+    def get_entity_ancestors(self,
+                             entity_id: int = None,
+                             entity_name: str = None,
+                             max_depth: int = 10):
+        '''
+        same as get_intent_ancestors, for the entities
+        '''
+        return self._walk_relations(Entity, EntityMatch, "entity_a_id", "entity_b_id",
+                                    entity_id, entity_name,
+                                    [RelationType.BROADER], [RelationType.NARROWER], max_depth)
+
+    def _walk_relations(self,
+                        model,
+                        match_model,
+                        a_column: str,
+                        b_column: str,
+                        concept_id: int,
+                        concept_name: str,
+                        forward_types: list,
+                        backward_types: list,
+                        max_depth: int,
+                        terminal_only: bool = False):
+        """
+        Visita lato server del grafo delle relazioni con una CTE ricorsiva (MySQL 8, SQLite).
+        Un arco (a, b, t) si percorre da a verso b se t è in forward_types,
+        da b verso a se t è in backward_types.
+
+        Per ogni concetto raggiunto si tengono la profondità, il prodotto delle confidence
+        e il path ",id,id,...,": un concetto già nel path non viene rivisitato
+        (protezione dai cicli), e la visita si ferma a max_depth.
+        Di ogni concetto resta il percorso più corto (ROW_NUMBER).
+
+        Args:
+            terminal_only: solo i concetti senza archi uscenti (es. la fine di una
+                           catena DEPRECATED), il più vicino per primo
+
+        Returns:
+            list[RelationPathRecord]
+        """
+        if concept_id is None and concept_name is None:
+            raise ValueError(f"Devi fornire l'ID o il nome del concetto")
+        if concept_id is None:
+            start = select(model.id).where(model.name == concept_name).scalar_subquery()
+        else:
+            start = literal(concept_id)
+
+        a_id = getattr(match_model, a_column)
+        b_id = getattr(match_model, b_column)
+
+        # archi orientati nel verso della visita
+        steps = [select(a_id.label("source_id"), b_id.label("target_id"), match_model.confidence)
+                 .where(match_model.relation_type.in_(forward_types))]
+        if backward_types:
+            steps.append(select(b_id.label("source_id"), a_id.label("target_id"), match_model.confidence)
+                         .where(match_model.relation_type.in_(backward_types)))
+        edges = union_all(*steps).cte("edges")
+
+        # ancora: gli archi uscenti dal concetto di partenza
+        # (il CAST fissa la larghezza del path: su MySQL il tipo viene dalla parte non ricorsiva)
+        walk = select(
+            edges.c.target_id.label("concept_id"),
+            literal(1).label("depth"),
+            edges.c.confidence.label("confidence"),
+            cast("," + cast(edges.c.source_id, String) + "," + cast(edges.c.target_id, String) + ",",
+                 String(4000)).label("path"),
+        ).where(edges.c.source_id == start, edges.c.target_id != edges.c.source_id
+        ).cte("walk", recursive=True)
+
+        walk = walk.union_all(
+            select(
+                edges.c.target_id,
+                walk.c.depth + 1,
+                walk.c.confidence * edges.c.confidence,
+                walk.c.path + cast(edges.c.target_id, String) + ",",
+            ).join(edges, edges.c.source_id == walk.c.concept_id)
+            .where(walk.c.depth < max_depth,
+                   ~walk.c.path.contains("," + cast(edges.c.target_id, String) + ","))
+        )
+
+        ranked = select(
+            walk.c.concept_id, walk.c.depth, walk.c.confidence, walk.c.path,
+            func.row_number().over(partition_by=walk.c.concept_id,
+                                   order_by=(walk.c.depth, walk.c.confidence.desc())).label("position"),
+        )
+        if terminal_only:
+            ranked = ranked.where(~exists().where(edges.c.source_id == walk.c.concept_id))
+        ranked = ranked.subquery("ranked")
+
+        rows = self.session.execute(
+            select(ranked.c.concept_id, model.name, ranked.c.depth, ranked.c.confidence, ranked.c.path)
+            .join(model, model.id == ranked.c.concept_id)
+            .where(ranked.c.position == 1)
+            .order_by(ranked.c.depth, ranked.c.concept_id))
+
+        return [RelationPathRecord(concept_id, name, depth, confidence,
+                                   tuple(int(step) for step in path.strip(",").split(",")))
+                for concept_id, name, depth, confidence, path in rows]
+
+    # full graph reads
+    @_unit_of_work
+    def get_intent_full(self,
+                        intent_id: int = None,
+                        intent_name: str = None):
+        """
+        Recupera un intent con livelli ISA95 e match (in entrambe le direzioni) già caricati.
+        
+        Args:
+            intent_id: ID dell'intent (opzionale)
+            intent_name: Nome dell'intent (opzionale)
+        
+        Returns:
+            Intent: intent con isa95_links[].isa95_level, matches_as_a[].intent_b
+                    e matches_as_b[].intent_a caricati (4 query)
+        
+        Raises:
+            ValueError: Se intent non trovato o parametri invalidi
+        
+        Example:
+            intent = get_intent_full(intent_name="start_machine")
+            print([link.isa95_level.name for link in intent.isa95_links])
+        """
+        if intent_id is None and intent_name is None:
+            raise ValueError("Devi fornire 'intent_id' o 'intent_name'")
+
+        if intent_id is not None:
+            intents = self._get_full(Intent, Intent.id, [intent_id])
+        else:
+            intents = self._get_full(Intent, Intent.name, [intent_name])
+
+        if not intents:
+            identifier = intent_id if intent_id else intent_name
+            raise ValueError(f"Intent '{identifier}' non trovato nel database")
+        return intents[0]
+
+    @_unit_of_work
+    def get_intents_full(self, intent_names: list[str]):
+        """
+        Versione batch di get_intent_full.
+        Il numero di query non dipende dal numero di intenti né dai loro link e match:
+        4 query per ogni chunk di BULK_CHUNK_SIZE nomi.
+        
+        Args:
+            intent_names: Lista di nomi degli intenti
+        
+        Returns:
+            list[Intent]: intenti trovati, nell'ordine di intent_names
+        """
+        return self._get_full(Intent, Intent.name, intent_names)
+
+    @_unit_of_work
+    def get_entity_full(self,
+                        entity_id: int = None,
+                        entity_name: str = None):
+        """
+        Recupera un'entità con livelli ISA95 e match (in entrambe le direzioni) già caricati.
+        
+        Args:
+            entity_id: ID dell'entity (opzionale)
+            entity_name: Nome dell'entity (opzionale)
+        
+        Returns:
+            Entity: entity con isa95_links[].isa95_level, matches_as_a[].entity_b
+                    e matches_as_b[].entity_a caricati (4 query)
+        
+        Raises:
+            ValueError: Se entity non trovata o parametri invalidi
+        """
+        if entity_id is None and entity_name is None:
+            raise ValueError("Devi fornire 'entity_id' o 'entity_name'")
+
+        if entity_id is not None:
+            entities = self._get_full(Entity, Entity.id, [entity_id])
+        else:
+            entities = self._get_full(Entity, Entity.name, [entity_name])
+
+        if not entities:
+            identifier = entity_id if entity_id else entity_name
+            raise ValueError(f"Entity '{identifier}' non trovata nel database")
+        return entities[0]
+
+    @_unit_of_work
+    def get_entities_full(self, entity_names: list[str]):
+        """
+        Versione batch di get_entity_full.
+        4 query per ogni chunk di BULK_CHUNK_SIZE nomi.
+        
+        Args:
+            entity_names: Lista di nomi delle entità
+        
+        Returns:
+            list[Entity]: entità trovate, nell'ordine di entity_names
+        """
+        return self._get_full(Entity, Entity.name, entity_names)
+
+    def _get_full(self, model, key_column, keys):
+        '''
+        loads the concepts with key_column IN keys together with their graph:
+            1 SELECT dei concetti
+            1 SELECT dei link (join con isa95_level)
+            1 SELECT dei match_as_a (join con il concetto b)
+            1 SELECT dei match_as_b (join con il concetto a)
+        '''
+        if model is Intent:
+            match_model, other_a, other_b = IntentMatch, IntentMatch.intent_a, IntentMatch.intent_b
+            link_model = IntentISA95Link
+        else:
+            match_model, other_a, other_b = EntityMatch, EntityMatch.entity_a, EntityMatch.entity_b
+            link_model = EntityISA95Link
+
+        options = (
+            selectinload(model.isa95_links).joinedload(link_model.isa95_level),
+            selectinload(model.matches_as_a).joinedload(other_b),
+            selectinload(model.matches_as_b).joinedload(other_a),
+        )
+
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        for start in range(0, len(keys), self.BULK_CHUNK_SIZE):
+            chunk = keys[start:start + self.BULK_CHUNK_SIZE]
+            for concept in self.session.execute(
+                    select(model).where(key_column.in_(chunk)).options(*options)).scalars():
+                found[getattr(concept, key_column.key)] = concept
+
+        return [found[key] for key in keys if key in found]
+
+    # read-only projections
+    @_cached_by_level
+    @_query_budget(2)
+    @_unit_of_work
+    def get_intent_records_by_isa95_level(self, level: ISA95LevelEnum):
+        """
+        Come get_intents_by_isa95_level, ma seleziona solo le colonne necessarie
+        e restituisce record immutabili non legati alla sessione.
+        
+        Args:
+            level: livello ISA95 (ISA95LevelEnum)
+        
+        Returns:
+            list[IntentRecord]: record (id, name, description) degli intenti del livello
+        
+        Raises:
+            ValueError: Se il livello ISA95 non esiste
+        """
+        return self._get_records_by_isa95_level(Intent, IntentISA95Link.intent_id, IntentRecord, level)
+
+    @_cached_by_level
+    @_query_budget(2)
+    @_unit_of_work
+    def get_entity_records_by_isa95_level(self, level: ISA95LevelEnum):
+        """
+        Come get_entities_by_isa95_level, ma seleziona solo le colonne necessarie
+        e restituisce record immutabili non legati alla sessione.
+        
+        Args:
+            level: livello ISA95 (ISA95LevelEnum)
+        
+        Returns:
+            list[EntityRecord]: record (id, name, description) delle entità del livello
+        
+        Raises:
+            ValueError: Se il livello ISA95 non esiste
+        """
+        return self._get_records_by_isa95_level(Entity, EntityISA95Link.entity_id, EntityRecord, level)
+
+    def _get_records_by_isa95_level(self, model, link_fk_column, record_class, level: ISA95LevelEnum):
+        level_id = self._get_isa95_level_id(level)
+        if level_id is None:
+            raise ValueError(f"Livello ISA95 '{level.value}' non trovato. "
+                            f"Livelli disponibili: DEFAULT, PLC, SCADA, MES, ERP")
+
+        link_table = link_fk_column.table
+        rows = self.session.execute(
+            select(model.id, model.name, model.description)
+            .join(link_table, link_fk_column == model.id)
+            .where(link_table.c.isa95_id == level_id))
+
+        return [record_class(*row) for row in rows]
+
+    @_unit_of_work
+    def get_intent_records_by_levels(self, any_of=(), all_of=(), none_of=()):
+        """
+        Intenti filtrati per insiemi di livelli ISA95 con un solo predicato bitwise
+        su level_mask, senza join con intent_isa95_link.
+        
+        Args:
+            any_of: almeno uno di questi livelli
+            all_of: tutti questi livelli
+            none_of: nessuno di questi livelli
+        
+        Returns:
+            list[IntentRecord]: record (id, name, description) degli intenti
+        
+        Example:
+            # intenti SCADA o MES, ma non ERP
+            get_intent_records_by_levels(any_of=[ISA95LevelEnum.LEVEL_2, ISA95LevelEnum.LEVEL_3],
+                                         none_of=[ISA95LevelEnum.LEVEL_4])
+        """
+        return self._get_records_by_levels(Intent, IntentRecord, any_of, all_of, none_of)
+
+    @_unit_of_work
+    def get_entity_records_by_levels(self, any_of=(), all_of=(), none_of=()):
+        '''
+        same as get_intent_records_by_levels, for the entities
+        '''
+        return self._get_records_by_levels(Entity, EntityRecord, any_of, all_of, none_of)
+
+    def _get_records_by_levels(self, model, record_class, any_of, all_of, none_of):
+        rows = self.session.execute(
+            select(model.id, model.name, model.description)
+            .where(level_mask_filter(model, any_of, all_of, none_of)))
+        return [record_class(*row) for row in rows]
+
+    # in-memory snapshot
+    def load_snapshot(self, force: bool = False):
+        """
+        Legge intenti, entità, livelli ISA95, link e relazioni con poche SELECT bulk
+        (una per tabella, nella stessa transazione) e costruisce una snapshot
+        immutabile in memoria (vedi ontology_snapshot): lookup per nome / id, maschere
+        dei livelli e adiacenze delle relazioni, senza più accessi al db.
+        La snapshot caricata sostituisce repository.snapshot con un solo assegnamento,
+        solo quando è completa: i thread che stanno leggendo la precedente non ne sono toccati.
+        
+        Args:
+            force: ricarica anche se ontology_version non è cambiata dalla snapshot corrente
+                   (necessario dopo scritture fatte senza passare dal RepositoryLayer)
+        
+        Returns:
+            OntologySnapshot: la snapshot corrente
+        
+        Example:
+            snapshot = repository.load_snapshot()
+            intent_id = snapshot.intents.id_of("start_machine")
+            snapshot.intents.has_level(intent_id, ISA95LevelEnum.LEVEL_2)
+        """
+        current = self.snapshot
+        if not force and current is not None and current.version == self._get_ontology_version():
+            return current
+
+        snapshot = self._read_snapshot()
+        with self._snapshot_lock:
+            # un caricamento concorrente più recente non viene sostituito da uno più vecchio
+            if self.snapshot is None or self.snapshot.version <= snapshot.version:
+                self.snapshot = snapshot
+            return self.snapshot
+
+    @_unit_of_work
+    def _read_snapshot(self):
+        '''
+        reads the whole ontology with one SELECT per table and builds an OntologySnapshot
+        '''
+        self._begin_consistent_read()
+        version = self._get_ontology_version()
+        level_of_id = {}
+        for level_id, level_name in self.session.execute(select(ISA95Level.id, ISA95Level.name)):
+            try:
+                level_of_id[level_id] = ISA95LevelEnum(level_name)
+            except ValueError:
+                # livello non previsto dall'enum, non rappresentabile nella maschera
+                continue
+
+        intents = self._read_concept_snapshot(Intent, IntentISA95Link.intent_id, IntentMatch,
+                                              "intent_a_id", "intent_b_id", level_of_id)
+        entities = self._read_concept_snapshot(Entity, EntityISA95Link.entity_id, EntityMatch,
+                                               "entity_a_id", "entity_b_id", level_of_id)
+        return OntologySnapshot(version, intents, entities)
+
+    def _begin_consistent_read(self):
+        '''
+        the SELECTs of the current unit of work must see the same state of the db:
+        sqlite (pysqlite / aiosqlite) opens a transaction only before a write, so without
+        an explicit BEGIN each SELECT would see the commits made after the previous one
+        (InnoDB fixes the snapshot at the first read of the transaction)
+        '''
+        connection = self.session.connection()
+        if connection.dialect.name == "sqlite" and not connection.connection.driver_connection.in_transaction:
+            connection.exec_driver_sql("BEGIN")
+
+    def _read_concept_snapshot(self, model, link_fk_column, match_model, a_column: str, b_column: str,
+                               level_of_id):
+        concepts = self.session.execute(select(model.id, model.name).order_by(model.id))
+        link_table = link_fk_column.table
+        links = ((concept_id, level_of_id[level_id]) for concept_id, level_id in
+                 self.session.execute(select(link_fk_column, link_table.c.isa95_id))
+                 if level_id in level_of_id)
+        return ConceptSnapshot(concepts, links, self._get_relation_edges(match_model, a_column, b_column))
+
+
+if __name__ == "__main__":
+    from engine_factory import get_engine
+
+    # Crea il motore SQLAlchemy (pool configurato in url.py)
+    engine = get_engine(echo=True)
+    Base.metadata.create_all(engine)
+
+    repository_obj = RepositoryLayer(engine)
+    repository_obj.populate_default_db_configuration()
+    # repository_obj.populate_default_db_configuration()
+    # repository_obj.define_intents_relation(180, 181, RelationType.DEPRECATED)
+    # repository_obj.define_intents_relation(181, 182, RelationType.DEPRECATED)
+    # repository_obj.define_intents_relation(182, 183, RelationType.DEPRECATED)
+    # repository_obj.define_intents_relation(180, 181, RelationType.BROADER)
+    # repository_obj.define_entities_relation(74, 75, RelationType.EQUIVALENT)
+    # repository_obj.remove_intents_relation(match_id=8)
+    # repository_obj.remove_intents_relation(182, 183)
+    #
+    # repository_obj.define_entities_relation(75, 90, RelationType.DEPRECATED)
+    # repository_obj.define_entities_relation(90, 77, RelationType.DEPRECATED)
+    # repository_obj.define_entities_relation(78, 79, RelationType.DEPRECATED)
+    # repository_obj.define_entities_relation(80, 82, RelationType.DEPRECATED)
+    # repository_obj.remove_entities_relation(match_id=4)
+    # repository_obj.define_intents_relation(181, 182, RelationType.EQUIVALENT)
+    # repository_obj.remove_intents(intent_ids=[181, 182])
+    # repository_obj.remove_entities(entity_ids=[75, 78])
+    # repository_obj.remove_entities(entity_names=['logical_entity', 'failure_mode'])
+
+
+    # out = repository_obj.get_intents_by_isa95_level(ISA95LevelEnum.LEVEL_2)
+    # print([elem.id for elem in out])
+    # out = repository_obj.get_entities_by_isa95_level(ISA95LevelEnum.LEVEL_2)
+    # print([elem.id for elem in out])
+
+    # repository_obj.add_intent_isa_levels(183, levels= ISA95LevelEnum.LEVEL_0)
+    # repository_obj.remove_intent_isa_levels(183, levels= ISA95LevelEnum.LEVEL_0)
+    # repository_obj.replace_intent_isa_levels(183, levels= [ISA95LevelEnum.LEVEL_0,ISA95LevelEnum.LEVEL_4,ISA95LevelEnum.LEVEL_3])
+
+
+    # repository_obj.add_entity_isa_levels(77, levels=[ISA95LevelEnum.LEVEL_0,ISA95LevelEnum.LEVEL_4,ISA95LevelEnum.LEVEL_3])
+    # repository_obj.replace_entity_isa_levels(77, levels=[ISA95LevelEnum.LEVEL_0])
+
+    # repository_obj.remove_entity_isa_levels(77, levels=[ISA95LevelEnum.LEVEL_4,ISA95LevelEnum.LEVEL_3])
+
+    # repository_obj.modify_intent_description(intent_id=183, new_description="andiamo a mangiare")
+    # repository_obj.modify_intent_description(intent_name="check_production_status", new_description="le tagliatelle")
+
+    # repository_obj.modify_entity_description(entity_id=77, new_description="andiamo a mangiare")
+    # repository_obj.modify_entity_description(entity_name="measurement_value_scada", new_description="le tagliatelle")
@@ -1,5 +1,5 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, selectinload
 from models import Base, ISA95Level, Intent, Entity, IntentISA95Link, EntityISA95Link, IntentMatch, EntityMatch, RelationType
 
 # Setup database
@@ -279,7 +279,13 @@ def query_equivalent_intents(intent_name):
 def query_intent_full_info(intent_name):
     """Mostra tutte le informazioni su un intent"""
     
-    intent = session.query(Intent).filter_by(name=intent_name).first()
+    # carica livelli e match insieme all'intent (4 query invece di una per link/match)
+    intent = session.query(Intent)\
+        .options(selectinload(Intent.isa95_links).joinedload(IntentISA95Link.isa95_level),
+                 selectinload(Intent.matches_as_a).joinedload(IntentMatch.intent_b),
+                 selectinload(Intent.matches_as_b).joinedload(IntentMatch.intent_a))\
+        .filter_by(name=intent_name)\
+        .first()
     
     if not intent:
         print(f"Intent {intent_name} non trovato")
@@ -0,0 +1,239 @@
+'''
+variante asyncio del RepositoryLayer, basata su sqlalchemy.ext.asyncio.
+
+le operazioni non sono riscritte: ogni chiamata apre una AsyncSession e vi esegue,
+con AsyncSession.run_sync, il metodo corrispondente del RepositoryLayer sincrono
+(in modalità use_session). l'I/O passa dal driver asincrono (aiomysql, aiosqlite),
+quindi l'event loop non viene mai bloccato durante i round trip verso il db.
+
+tutte le chiamate condividono un solo RepositoryLayer sincrono (cache dei livelli,
+indici in memoria, versione dell'ontologia); ogni chiamata usa una propria sessione
+(e connessione), quindi le letture indipendenti possono essere eseguite in parallelo
+con asyncio.gather.
+
+    engine = get_async_engine()     # oppure get_async_engine("sqlite+aiosqlite:///ontology.db")
+    repository = AsyncRepositoryLayer(engine)
+    mes, erp = await asyncio.gather(
+        repository.get_intent_records_by_isa95_level(ISA95LevelEnum.LEVEL_3),
+        repository.get_intent_records_by_isa95_level(ISA95LevelEnum.LEVEL_4))
+'''
+import importlib
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from tables_definition import *
+
+RepositoryLayer = importlib.import_module("3-repository").RepositoryLayer
+
+
+class AsyncRepositoryLayer():
+    def __init__(self, engine=None, session_factory=None, metrics=None):
+        '''
+        engine: AsyncEngine, or session_factory: async_sessionmaker
+        metrics: optional query_metrics.QueryMetrics (see RepositoryLayer)
+        '''
+        if engine is None and session_factory is None:
+            raise ValueError("Devi fornire 'engine' o 'session_factory'")
+
+        if session_factory is None:
+            session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        self.session_factory = session_factory
+        self.engine = engine if engine is not None else session_factory.kw["bind"]
+        self.metrics = metrics
+        # lo stato della unità di lavoro è per contesto: ogni run_sync ha il suo
+        self.repository = RepositoryLayer(self.engine.sync_engine, metrics=metrics)
+
+    async def _run(self, method_name: str, *args, **kwargs):
+        '''
+        runs RepositoryLayer.<method_name> in a new AsyncSession and commits it
+        '''
+        def call(sync_session):
+            with self.repository.use_session(sync_session):
+                return getattr(self.repository, method_name)(*args, **kwargs)
+
+        async with self.session_factory() as session:
+            async with session.begin():
+                return await session.run_sync(call)
+
+    # intents and entities management
+    async def create_intents_with_levels(self, intent_list, bulk: bool = False, chunk_size: int = None):
+        '''see RepositoryLayer.create_intents_with_levels'''
+        return await self._run("create_intents_with_levels", intent_list, bulk=bulk, chunk_size=chunk_size)
+
+    async def create_entities_with_levels(self, entity_list, bulk: bool = False, chunk_size: int = None):
+        '''see RepositoryLayer.create_entities_with_levels'''
+        return await self._run("create_entities_with_levels", entity_list, bulk=bulk, chunk_size=chunk_size)
+
+    async def upsert_intents_with_levels(self, intent_list, chunk_size: int = None):
+        '''see RepositoryLayer.upsert_intents_with_levels'''
+        return await self._run("upsert_intents_with_levels", intent_list, chunk_size=chunk_size)
+
+    async def upsert_entities_with_levels(self, entity_list, chunk_size: int = None):
+        '''see RepositoryLayer.upsert_entities_with_levels'''
+        return await self._run("upsert_entities_with_levels", entity_list, chunk_size=chunk_size)
+
+    async def remove_intents(self, intent_ids: list[int] = None, intent_names: list[str] = None,
+                             bulk: bool = False, chunk_size: int = None):
+        '''see RepositoryLayer.remove_intents'''
+        return await self._run("remove_intents", intent_ids=intent_ids, intent_names=intent_names,
+                               bulk=bulk, chunk_size=chunk_size)
+
+    async def remove_entities(self, entity_ids: list[int] = None, entity_names: list[str] = None,
+                             bulk: bool = False, chunk_size: int = None):
+        '''see RepositoryLayer.remove_entities'''
+        return await self._run("remove_entities", entity_ids=entity_ids, entity_names=entity_names,
+                               bulk=bulk, chunk_size=chunk_size)
+
+    async def modify_intent_description(self, intent_id: int = None, intent_name: str = None,
+                                        new_description: str = None):
+        '''see RepositoryLayer.modify_intent_description'''
+        return await self._run("modify_intent_description", intent_id=intent_id, intent_name=intent_name,
+                               new_description=new_description)
+
+    async def modify_entity_description(self, entity_id: int = None, entity_name: str = None,
+                                        new_description: str = None):
+        '''see RepositoryLayer.modify_entity_description'''
+        return await self._run("modify_entity_description", entity_id=entity_id, entity_name=entity_name,
+                               new_description=new_description)
+
+    # ISA95 links management
+    async def add_intent_isa_levels(self, intent_id: int = None, intent_name: str = None,
+                                    levels: ISA95LevelEnum = None):
+        '''see RepositoryLayer.add_intent_isa_levels'''
+        return await self._run("add_intent_isa_levels", intent_id=intent_id, intent_name=intent_name,
+                               levels=levels)
+
+    async def replace_intent_isa_levels(self, intent_id: int = None, intent_name: str = None,
+                                        levels: ISA95LevelEnum = None):
+        '''see RepositoryLayer.replace_intent_isa_levels'''
+        return await self._run("replace_intent_isa_levels", intent_id=intent_id, intent_name=intent_name,
+                               levels=levels)
+
+    async def replace_intents_isa_levels(self, levels_by_intent: dict, chunk_size: int = None):
+        '''see RepositoryLayer.replace_intents_isa_levels'''
+        return await self._run("replace_intents_isa_levels", levels_by_intent, chunk_size=chunk_size)
+
+    async def remove_intent_isa_levels(self, intent_id: int = None, intent_name: str = None,
+                                       levels: ISA95LevelEnum = None):
+        '''see RepositoryLayer.remove_intent_isa_levels'''
+        return await self._run("remove_intent_isa_levels", intent_id=intent_id, intent_name=intent_name,
+                               levels=levels)
+
+    async def add_entity_isa_levels(self, entity_id: int = None, entity_name: str = None,
+                                    levels: ISA95LevelEnum = None):
+        '''see RepositoryLayer.add_entity_isa_levels'''
+        return await self._run("add_entity_isa_levels", entity_id=entity_id, entity_name=entity_name,
+                               levels=levels)
+
+    async def replace_entity_isa_levels(self, entity_id: int = None, entity_name: str = None,
+                                        levels: ISA95LevelEnum = None):
+        '''see RepositoryLayer.replace_entity_isa_levels'''
+        return await self._run("replace_entity_isa_levels", entity_id=entity_id, entity_name=entity_name,
+                               levels=levels)
+
+    async def replace_entities_isa_levels(self, levels_by_entity: dict, chunk_size: int = None):
+        '''see RepositoryLayer.replace_entities_isa_levels'''
+        return await self._run("replace_entities_isa_levels", levels_by_entity, chunk_size=chunk_size)
+
+    async def remove_entity_isa_levels(self, entity_id: int = None, entity_name: str = None,
+                                       levels: ISA95LevelEnum = None):
+        '''see RepositoryLayer.remove_entity_isa_levels'''
+        return await self._run("remove_entity_isa_levels", entity_id=entity_id, entity_name=entity_name,
+                               levels=levels)
+
+    # intent and entity relations management
+    async def define_intents_relation(self, id_intent_a, id_intent_b, relation_type: RelationType,
+                                      confidence: float = 1.0):
+        '''see RepositoryLayer.define_intents_relation'''
+        return await self._run("define_intents_relation", id_intent_a, id_intent_b, relation_type, confidence)
+
+    async def define_entities_relation(self, id_entity_a, id_entity_b, relation_type: RelationType,
+                                       confidence: float = 1.0):
+        '''see RepositoryLayer.define_entities_relation'''
+        return await self._run("define_entities_relation", id_entity_a, id_entity_b, relation_type, confidence)
+
+    async def define_intents_relations(self, pairs, batch_size: int = None, chunk_size: int = None):
+        '''see RepositoryLayer.define_intents_relations'''
+        return await self._run("define_intents_relations", list(pairs), batch_size=batch_size,
+                               chunk_size=chunk_size)
+
+    async def define_entities_relations(self, pairs, batch_size: int = None, chunk_size: int = None):
+        '''see RepositoryLayer.define_entities_relations'''
+        return await self._run("define_entities_relations", list(pairs), batch_size=batch_size,
+                               chunk_size=chunk_size)
+
+    async def remove_intents_relation(self, id_intent_a: int = None, id_intent_b: int = None,
+                                      match_id: int = None):
+        '''see RepositoryLayer.remove_intents_relation'''
+        return await self._run("remove_intents_relation", id_intent_a=id_intent_a, id_intent_b=id_intent_b,
+                               match_id=match_id)
+
+    async def remove_entities_relation(self, id_entity_a: int = None, id_entity_b: int = None,
+                                       match_id: int = None):
+        '''see RepositoryLayer.remove_entities_relation'''
+        return await self._run("remove_entities_relation", id_entity_a=id_entity_a, id_entity_b=id_entity_b,
+                               match_id=match_id)
+
+    # level queries
+    async def get_intents_by_isa95_level(self, level: ISA95LevelEnum):
+        '''see RepositoryLayer.get_intents_by_isa95_level'''
+        return await self._run("get_intents_by_isa95_level", level)
+
+    async def get_entities_by_isa95_level(self, level: ISA95LevelEnum):
+        '''see RepositoryLayer.get_entities_by_isa95_level'''
+        return await self._run("get_entities_by_isa95_level", level)
+
+    async def get_intent_records_by_isa95_level(self, level: ISA95LevelEnum):
+        '''see RepositoryLayer.get_intent_records_by_isa95_level'''
+        return await self._run("get_intent_records_by_isa95_level", level)
+
+    async def get_entity_records_by_isa95_level(self, level: ISA95LevelEnum):
+        '''see RepositoryLayer.get_entity_records_by_isa95_level'''
+        return await self._run("get_entity_records_by_isa95_level", level)
+
+    async def get_intent_records_by_levels(self, any_of=(), all_of=(), none_of=()):
+        '''see RepositoryLayer.get_intent_records_by_levels'''
+        return await self._run("get_intent_records_by_levels", any_of=any_of, all_of=all_of, none_of=none_of)
+
+    async def get_entity_records_by_levels(self, any_of=(), all_of=(), none_of=()):
+        '''see RepositoryLayer.get_entity_records_by_levels'''
+        return await self._run("get_entity_records_by_levels", any_of=any_of, all_of=all_of, none_of=none_of)
+
+    async def get_intents_full(self, intent_names: list[str]):
+        '''see RepositoryLayer.get_intents_full'''
+        return await self._run("get_intents_full", intent_names)
+
+    async def get_entities_full(self, entity_names: list[str]):
+        '''see RepositoryLayer.get_entities_full'''
+        return await self._run("get_entities_full", entity_names)
+
+    # recursive relation queries
+    async def get_intent_replacement(self, intent_id: int = None, intent_name: str = None, max_depth: int = 32):
+        '''see RepositoryLayer.get_intent_replacement'''
+        return await self._run("get_intent_replacement", intent_id=intent_id, intent_name=intent_name,
+                               max_depth=max_depth)
+
+    async def get_intent_descendants(self, intent_id: int = None, intent_name: str = None, max_depth: int = 10):
+        '''see RepositoryLayer.get_intent_descendants'''
+        return await self._run("get_intent_descendants", intent_id=intent_id, intent_name=intent_name,
+                               max_depth=max_depth)
+
+    async def get_intent_ancestors(self, intent_id: int = None, intent_name: str = None, max_depth: int = 10):
+        '''see RepositoryLayer.get_intent_ancestors'''
+        return await self._run("get_intent_ancestors", intent_id=intent_id, intent_name=intent_name,
+                               max_depth=max_depth)
+
+    async def get_entity_replacement(self, entity_id: int = None, entity_name: str = None, max_depth: int = 32):
+        '''see RepositoryLayer.get_entity_replacement'''
+        return await self._run("get_entity_replacement", entity_id=entity_id, entity_name=entity_name,
+                               max_depth=max_depth)
+
+    async def get_entity_descendants(self, entity_id: int = None, entity_name: str = None, max_depth: int = 10):
+        '''see RepositoryLayer.get_entity_descendants'''
+        return await self._run("get_entity_descendants", entity_id=entity_id, entity_name=entity_name,
+                               max_depth=max_depth)
+
+    async def get_entity_ancestors(self, entity_id: int = None, entity_name: str = None, max_depth: int = 10):
+        '''see RepositoryLayer.get_entity_ancestors'''
+        return await self._run("get_entity_ancestors", entity_id=entity_id, entity_name=entity_name,
+                               max_depth=max_depth)
@@ -0,0 +1,69 @@
+'''
+confronto tra get_intents_by_isa95_level (oggetti ORM) e
+get_intent_records_by_isa95_level (record immutabili) su 100k righe:
+tempo della lettura, picco di memoria e memoria trattenuta dal risultato.
+
+    python benchmark_records.py              # SQLite in memoria
+    python benchmark_records.py --rows 500000
+    python benchmark_records.py --mysql      # database configurato in url.py (tabelle vuote!)
+'''
+import argparse
+import gc
+import importlib
+import time
+import tracemalloc
+
+from engine_factory import get_engine
+from tables_definition import *
+
+RepositoryLayer = importlib.import_module("3-repository").RepositoryLayer
+
+
+def measure(read):
+    '''
+    returns (seconds, peak bytes, bytes retained by the result) of read()
+    '''
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = read()
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, retained, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--mysql", action="store_true", help="usa il database di url.py")
+    args = parser.parse_args()
+
+    # engine di engine_factory: con SQLite attiva le foreign key (e i loro ON DELETE CASCADE)
+    engine = get_engine() if args.mysql else get_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    repository = RepositoryLayer(engine)
+    repository._populate_isa95_levels()
+    repository.create_intents_with_levels(
+        [[f"bench_intent_{i}", f"benchmark intent number {i}", ISA95LevelEnum.LEVEL_3.value]
+         for i in range(args.rows)],
+        bulk=True)
+
+    readers = {
+        "ORM": lambda repository: repository.get_intents_by_isa95_level(ISA95LevelEnum.LEVEL_3),
+        "records": lambda repository: repository.get_intent_records_by_isa95_level(ISA95LevelEnum.LEVEL_3),
+    }
+
+    results = {}
+    for name, read in readers.items():
+        # ogni chiamata usa una sessione nuova: identity map vuoto per ogni misura
+        results[name] = measure(lambda: read(repository))
+
+    print(f"\n{'path':<10}{'rows':>10}{'time [s]':>12}{'peak [MB]':>12}{'retained [MB]':>16}")
+    for name, (elapsed, peak, retained, rows) in results.items():
+        print(f"{name:<10}{rows:>10}{elapsed:>12.3f}{peak / 2**20:>12.1f}{retained / 2**20:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+'''
+benchmark delle operazioni del RepositoryLayer a diverse dimensioni dell'ontologia.
+
+per ogni dimensione N (concetti) parte da un database vuoto, lo popola con un'ontologia
+sintetica di N intenti + N entità (genera_ontologia) e misura, per intenti ed entità:
+    populate_default_db_configuration          l'ontologia generata
+    create_*_with_levels                       bulk di N concetti e --ops inserimenti singoli
+    add / replace / remove_*_isa_levels        --ops chiamate su concetti casuali
+    replace_*_isa_levels                       batch su tutti gli N concetti
+    define_*_relations                         batch degli archi generati
+    define_*_relation / remove_*_relation      --ops coppie nuove, aggiunte e poi rimosse
+    get_*_by_isa95_level, get_*_records_...    --ops letture (ORM e record)
+    get_*_replacement / descendants / ancestors   --ops percorsi WITH RECURSIVE
+    get_*_closure, get_*_deprecation_resolver  caricamento e --ops lookup in memoria
+    remove_*                                   --ops rimozioni singole e bulk di N / 10
+riportando throughput, latenza p50 / p99, statement eseguiti (query_metrics) e picco
+di memoria Python (tracemalloc). i risultati vengono scritti in JSON: con --baseline
+il run viene confrontato con uno precedente e l'exit code è 1 se c'è una regressione.
+restano fuori i metodi di manutenzione (check_level_masks, migrazioni), gli upsert e le
+varianti async, che usano gli stessi percorsi delle versioni misurate.
+
+    python benchmark_repository.py                                  # SQLite in memoria, 1k e 10k
+    python benchmark_repository.py --sizes 1000 100000 1000000 --file
+    python benchmark_repository.py --mysql-url mysql+pymysql://root@localhost/bench_db
+    python benchmark_repository.py --baseline main.json --max-slowdown 0.2
+
+con --mysql-url le tabelle del database vengono eliminate e ricreate per ogni dimensione:
+usare un database dedicato. tracemalloc rallenta le operazioni: --no-memory per latenze pulite.
+'''
+import argparse
+import contextlib
+import gc
+import importlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import sqlalchemy
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+from engine_factory import get_engine, _enable_sqlite_foreign_keys
+from genera_ontologia import entity_name, intent_name, iter_edges, write_ontology
+from query_metrics import QueryMetrics
+from tables_definition import *
+
+RepositoryLayer = importlib.import_module("3-repository").RepositoryLayer
+
+LEVELS = list(ISA95LevelEnum)
+
+
+def percentile(sorted_values, fraction: float):
+    '''nearest-rank percentile of an already sorted list'''
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, round(fraction * (len(sorted_values) - 1)))]
+
+
+class BenchmarkRun():
+    def __init__(self, repository, metrics, trace_memory: bool = True):
+        self.repository = repository
+        self.metrics = metrics
+        self.trace_memory = trace_memory
+        self.results = []
+
+    def measure(self, name: str, size: int, operations, rows_per_operation: int = 1):
+        '''
+        runs the zero-argument callables of operations one after the other and
+        records throughput (rows / s), latency percentiles, statements and peak memory
+        '''
+        gc.collect()
+        self.metrics.reset()
+        if self.trace_memory:
+            tracemalloc.start()
+
+        latencies = []
+        # i metodi del repository stampano un messaggio per chiamata
+        with contextlib.redirect_stdout(io.StringIO()):
+            for operation in operations:
+                start = time.perf_counter()
+                operation()
+                latencies.append(time.perf_counter() - start)
+
+        peak = 0
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        latencies.sort()
+        seconds = sum(latencies)
+        statements = sum(stats["statements"] for stats in self.metrics.snapshot().values())
+        rows = len(latencies) * rows_per_operation
+        result = {"benchmark": name,
+                  "size": size,
+                  "operations": len(latencies),
+                  "rows": rows,
+                  "seconds": seconds,
+                  "throughput": rows / seconds if seconds else 0.0,
+                  "p50_ms": percentile(latencies, 0.50) * 1000,
+                  "p99_ms": percentile(latencies, 0.99) * 1000,
+                  "statements": statements,
+                  "statements_per_operation": statements / len(latencies) if latencies else 0.0,
+                  "peak_memory_mb": peak / 2**20 if self.trace_memory else None}
+        self.results.append(result)
+        print(f"{size:>9} {name:<40}{result['throughput']:>12.1f}{result['p50_ms']:>10.2f}"
+              f"{result['p99_ms']:>10.2f}{result['statements_per_operation']:>10.1f}"
+              + (f"{result['peak_memory_mb']:>10.1f}" if self.trace_memory else ""))
+        return result
+
+
+def create_database(args, size: int, directory: str):
+    '''
+    returns a new engine over an empty database for one size
+    (with --file the database is created inside directory)
+    '''
+    if args.mysql_url:
+        engine = get_engine(args.mysql_url)
+        Base.metadata.drop_all(engine)
+    elif args.file:
+        engine = get_engine(f"sqlite:///{os.path.join(directory, f'benchmark_{size}.db')}")
+    else:
+        # get_engine("sqlite://") restituisce un engine condiviso: qui serve un db nuovo per dimensione
+        engine = _enable_sqlite_foreign_keys(create_engine("sqlite://", poolclass=StaticPool))
+
+    Base.metadata.create_all(engine)
+    return engine
+
+
+# metodi e nomi generati di intenti / entità, per misurare le stesse operazioni sui due lati
+CONCEPTS = {
+    "intent": {"name_of": intent_name, "singular": "intent", "plural": "intents",
+               "create": "create_intents_with_levels", "remove": "remove_intents",
+               "closure": "get_intent_closure", "resolver": "get_intent_deprecation_resolver"},
+    "entity": {"name_of": entity_name, "singular": "entity", "plural": "entities",
+               "create": "create_entities_with_levels", "remove": "remove_entities",
+               "closure": "get_entity_closure", "resolver": "get_entity_deprecation_resolver"},
+}
+
+
+def run_concept(run, repository, concept: str, size: int, ops: int, edges_source: str, rng):
+    '''
+    runs the benchmarks of one side (intents or entities) on the populated database
+    '''
+    spec = CONCEPTS[concept]
+    singular, plural = spec["singular"], spec["plural"]
+    method = lambda name: getattr(repository, name.format(singular=singular, plural=plural))
+    names = [spec["name_of"](i) for i in range(size)]
+    sample = lambda: rng.sample(names, ops)
+    # i concetti deprecati sono gli ultimi generati (genera_ontologia.generate_edges)
+    deprecated = names[size - max(1, int(size * 0.05)):]
+
+    # creazione
+    run.measure(f"{spec['create']}[bulk]", size,
+                [lambda: method(spec["create"])(
+                    [[f"bulk_{concept}_{i}", f"bulk {concept}", rng.sample(LEVELS, 2)] for i in range(size)],
+                    bulk=True)],
+                rows_per_operation=size)
+    run.measure(spec["create"], size,
+                [lambda i=i: method(spec["create"])([[f"single_{concept}_{i}", f"single {concept}", "MES"]])
+                 for i in range(ops)])
+
+    # livelli ISA95
+    for operation, levels in (("add", lambda: [rng.choice(LEVELS)]),
+                              ("replace", lambda: rng.sample(LEVELS, 2)),
+                              ("remove", lambda: [rng.choice(LEVELS)])):
+        run.measure(f"{operation}_{singular}_isa_levels", size,
+                    [lambda name=name: method(f"{operation}_{{singular}}_isa_levels")(
+                        **{f"{singular}_name": name, "levels": levels()})
+                     for name in sample()])
+    run.measure(f"replace_{plural}_isa_levels[batch]", size,
+                [lambda: method("replace_{plural}_isa_levels")({name: rng.sample(LEVELS, 2) for name in names})],
+                rows_per_operation=size)
+
+    # relazioni: gli archi generati in batch, poi coppie singole aggiunte e rimosse
+    snapshot = repository.load_snapshot()
+    concepts = snapshot.intents if concept == "intent" else snapshot.entities
+    ids = [concepts.id_of(name) for name in names]
+    edges = [(concepts.id_of(a), concepts.id_of(b), relation_type, confidence)
+             for a, b, relation_type, confidence in iter_edges(edges_source)]
+    run.measure(f"define_{plural}_relations[batch]", size,
+                [lambda: method("define_{plural}_relations")(edges)], rows_per_operation=len(edges))
+
+    existing = {frozenset(edge[:2]) for edge in edges}
+    pairs = set()
+    while len(pairs) < ops:
+        pair = frozenset(rng.sample(ids, 2))
+        if pair not in existing:
+            pairs.add(pair)
+    pairs = [tuple(pair) for pair in pairs]
+    run.measure(f"define_{plural}_relation", size,
+                [lambda a=a, b=b: method("define_{plural}_relation")(a, b, rng.choice(list(RelationType)))
+                 for a, b in pairs])
+    run.measure(f"remove_{plural}_relation", size,
+                [lambda a=a, b=b: method("remove_{plural}_relation")(
+                    **{f"id_{singular}_a": a, f"id_{singular}_b": b})
+                 for a, b in pairs])
+
+    # letture per livello
+    run.measure(f"get_{plural}_by_isa95_level", size,
+                [lambda level=LEVELS[i % len(LEVELS)]: method("get_{plural}_by_isa95_level")(level)
+                 for i in range(min(ops, 60))])
+    run.measure(f"get_{singular}_records_by_isa95_level", size,
+                [lambda level=LEVELS[i % len(LEVELS)]: method("get_{singular}_records_by_isa95_level")(level)
+                 for i in range(min(ops, 60))])
+
+    # percorsi (WITH RECURSIVE) e indici in memoria
+    run.measure(f"get_{singular}_replacement", size,
+                [lambda name=name: method("get_{singular}_replacement")(**{f"{singular}_name": name})
+                 for name in rng.choices(deprecated, k=ops)])
+    for direction in ("descendants", "ancestors"):
+        run.measure(f"get_{singular}_{direction}", size,
+                    [lambda name=name: method(f"get_{{singular}}_{direction}")(**{f"{singular}_name": name})
+                     for name in sample()])
+    closure = method(spec["closure"])()
+    run.measure(f"{spec['closure']}[load]", size, [closure.reload], rows_per_operation=len(edges))
+    run.measure(f"{spec['closure']}.members", size,
+                [lambda concept_id=concept_id: closure.members(concept_id) for concept_id in rng.sample(ids, ops)])
+    resolver = method(spec["resolver"])()
+    # i nomi delle catene cicliche non hanno un successore (resolve solleva ValueError)
+    redirects = resolver.redirect_map()
+    resolvable = [name for name in deprecated if redirects.get(name) is not None] or names
+    run.measure(f"{spec['resolver']}.resolve", size,
+                [lambda name=name: resolver.resolve(name) for name in rng.choices(resolvable, k=ops)])
+
+    # rimozioni
+    run.measure(spec["remove"], size,
+                [lambda i=i: method(spec["remove"])(**{f"{singular}_names": [f"single_{concept}_{i}"]})
+                 for i in range(ops)])
+    bulk_names = [f"bulk_{concept}_{i}" for i in range(size // 10)]
+    run.measure(f"{spec['remove']}[bulk]", size,
+                [lambda: method(spec["remove"])(**{f"{singular}_names": bulk_names}, bulk=True)],
+                rows_per_operation=len(bulk_names))
+
+
+def run_size(args, size: int):
+    '''
+    runs all the benchmarks on a new database of size concepts, returns the results.
+    the generated ontology (and the --file database) live in a temporary directory
+    removed at the end
+    '''
+    rng = random.Random(args.seed)
+    metrics = QueryMetrics()
+    ops = min(args.ops, size)
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_database(args, size, directory)
+        try:
+            report = write_ontology(directory, intents=size, entities=size, seed=args.seed)
+            repository = RepositoryLayer(engine, intents_source=report["intents"][0],
+                                         entities_source=report["entities"][0], metrics=metrics)
+            run = BenchmarkRun(repository, metrics, trace_memory=not args.no_memory)
+
+            run.measure("populate_default_db_configuration", size,
+                        [repository.populate_default_db_configuration], rows_per_operation=2 * size)
+            run_concept(run, repository, "intent", size, ops, report["intent_matches"][0], rng)
+            run_concept(run, repository, "entity", size, ops, report["entity_matches"][0], rng)
+        finally:
+            # il file del db (--file) viene rimosso con la directory solo dopo aver chiuso il pool
+            engine.dispose()
+
+    return run.results
+
+
+def compare(results, baseline_path: str, max_slowdown: float):
+    '''
+    prints the regressions against a previous JSON output, returns their number:
+    throughput lower than baseline * (1 - max_slowdown) or more statements per operation
+    '''
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = {(result["benchmark"], result["size"]): result for result in json.load(file)["results"]}
+
+    regressions = 0
+    for result in results:
+        previous = baseline.get((result["benchmark"], result["size"]))
+        if previous is None:
+            continue
+        if result["throughput"] < previous["throughput"] * (1 - max_slowdown):
+            regressions += 1
+            print(f"REGRESSIONE {result['benchmark']} [{result['size']}]: throughput "
+                  f"{previous['throughput']:.1f} -> {result['throughput']:.1f}")
+        if result["statements_per_operation"] > previous["statements_per_operation"]:
+            regressions += 1
+            print(f"REGRESSIONE {result['benchmark']} [{result['size']}]: statement per operazione "
+                  f"{previous['statements_per_operation']:.1f} -> {result['statements_per_operation']:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000], help="numero di concetti")
+    parser.add_argument("--ops", type=int, default=200, help="chiamate per le operazioni singole")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--file", action="store_true", help="SQLite su file temporaneo invece che in memoria")
+    parser.add_argument("--mysql-url", help="database MySQL dedicato (le tabelle vengono ricreate)")
+    parser.add_argument("--no-memory", action="store_true", help="non misura il picco di memoria")
+    parser.add_argument("--output", default="benchmark_repository.json")
+    parser.add_argument("--baseline", help="JSON di un run precedente da confrontare")
+    parser.add_argument("--max-slowdown", type=float, default=0.2,
+                        help="calo di throughput tollerato rispetto alla baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    print(f"{'size':>9} {'benchmark':<40}{'rows/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'stmt/op':>10}"
+          + ("" if args.no_memory else f"{'peak MB':>10}"))
+    results = []
+    for size in args.sizes:
+        results += run_size(args, size)
+
+    database = "mysql" if args.mysql_url else ("sqlite-file" if args.file else "sqlite-memory")
+    output = {"meta": {"database": database,
+                       "sizes": args.sizes,
+                       "ops": args.ops,
+                       "seed": args.seed,
+                       "python": platform.python_version(),
+                       "sqlalchemy": sqlalchemy.__version__,
+                       "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+              "results": results}
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(output, file, indent=2)
+    print(f"\nrisultati scritti in {args.output}")
+
+    if args.baseline and compare(results, args.baseline, args.max_slowdown):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+'''
+risoluzione dei nomi deprecati verso il loro successore attuale.
+
+gli archi DEPRECATED (a -> b: a è sostituito da b) formano catene come
+180 -> 181 -> 182 -> 183: la mappa nome -> successore finale viene costruita una volta,
+con path compression, e poi ogni risoluzione è un accesso a dizionario.
+
+la mappa ha una versione: ogni modifica di un arco DEPRECATED (notificata dal
+RepositoryLayer che ha creato il resolver, vedi get_intent_deprecation_resolver)
+incrementa la versione e la mappa viene ricostruita alla risoluzione successiva.
+'''
+import threading
+
+from tables_definition import RelationType
+
+
+class DeprecationResolver():
+    def __init__(self, loader, refresh=None):
+        '''
+        loader: callable returning the DEPRECATED edges as
+                (a_id, b_id, a_name, b_name, confidence) rows
+        refresh: optional callable run before each resolution (it may call invalidate)
+        '''
+        self.loader = loader
+        self.refresh = refresh
+        self._lock = threading.RLock()
+        # versione delle modifiche note / versione da cui è stata costruita la mappa
+        self.version = 0
+        self._built_version = None
+        self._deprecated_pairs = set()
+        self._redirects = {}
+        self.cycles = []
+
+    # building
+    def _build(self):
+        '''
+        loads the edges and computes name -> final successor, detecting the cycles
+        '''
+        version = self.version
+        successor = {}
+        confidence_of = {}
+        deprecated_pairs = set()
+        for a_id, b_id, a_name, b_name, confidence in self.loader():
+            deprecated_pairs.add((min(a_id, b_id), max(a_id, b_id)))
+            # più successori per lo stesso nome: vince la confidence più alta
+            if a_name not in successor or confidence > confidence_of[a_name]:
+                successor[a_name] = b_name
+                confidence_of[a_name] = confidence
+
+        redirects = {}
+        cycles = []
+        for name in successor:
+            if name in redirects:
+                continue
+            # segue la catena fino a un nome già risolto o non deprecato
+            chain = []
+            position = {}
+            current = name
+            while current in successor and current not in redirects:
+                if current in position:
+                    cycle = chain[position[current]:]
+                    cycles.append(cycle)
+                    for member in cycle:
+                        redirects[member] = None
+                    break
+                position[current] = len(chain)
+                chain.append(current)
+                current = successor[current]
+            final = redirects.get(current, current)
+            # path compression: tutta la catena punta al successore finale
+            for member in chain:
+                redirects.setdefault(member, final)
+
+        self._deprecated_pairs = deprecated_pairs
+        self._redirects = redirects
+        self.cycles = cycles
+        self._built_version = version
+
+    def _ensure_current(self):
+        if self._built_version != self.version:
+            self._build()
+
+    def _refresh(self):
+        if self.refresh is not None:
+            self.refresh()
+
+    # invalidation
+    def invalidate(self):
+        '''
+        forces a rebuild at the next resolution
+        '''
+        with self._lock:
+            self.version += 1
+
+    def set_edge(self, a: int, b: int, relation_type: RelationType, confidence: float = 1.0):
+        '''
+        a relation was created / updated: the map changes only if the pair is or was DEPRECATED
+        '''
+        with self._lock:
+            if (relation_type == RelationType.DEPRECATED
+                    or (min(a, b), max(a, b)) in self._deprecated_pairs):
+                self.version += 1
+
+    def remove_edge(self, a: int, b: int):
+        '''
+        a relation was removed
+        '''
+        with self._lock:
+            if (min(a, b), max(a, b)) in self._deprecated_pairs:
+                self.version += 1
+
+    # resolution
+    def resolve(self, name: str):
+        """
+        Restituisce il nome attuale di name: il successore finale della catena
+        DEPRECATED, o name stesso se non è deprecato.
+
+        Raises:
+            ValueError: Se name fa parte di una catena ciclica
+
+        Example:
+            resolver = repository.get_intent_deprecation_resolver()
+            resolver.resolve("old_start_machine")   # "start_machine"
+        """
+        self._refresh()
+        with self._lock:
+            self._ensure_current()
+            final = self._redirects.get(name, name)
+        if final is None:
+            raise ValueError(f"Catena DEPRECATED ciclica per '{name}'")
+        return final
+
+    def redirect_map(self):
+        '''
+        copy of the {deprecated name: final successor} map (None for the names in a cycle)
+        '''
+        self._refresh()
+        with self._lock:
+            self._ensure_current()
+            return dict(self._redirects)
@@ -0,0 +1,163 @@
+'''
+factory condivisa degli engine SQLAlchemy.
+
+ogni script creava il proprio engine con create_engine(url.url, echo=True) e le
+impostazioni di default del pool: con più thread si esaurivano le connessioni e,
+dopo il wait_timeout di MySQL, il pool restituiva connessioni già chiuse dal server.
+qui l'engine viene creato una volta per url (e parametri) e condiviso nel processo,
+con il pool configurato in url.py.
+'''
+import threading
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import StaticPool
+
+import url
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(database_url: str = None,
+               echo: bool = False,
+               pool_size: int = None,
+               max_overflow: int = None,
+               pool_timeout: int = None,
+               pool_recycle: int = None,
+               pool_pre_ping: bool = None):
+    """
+    Restituisce l'engine condiviso per database_url, creandolo alla prima chiamata.
+    
+    Args:
+        database_url: stringa di connessione (default url.url)
+        echo: stampa ogni statement (solo per debug, rallenta)
+        pool_size, max_overflow, pool_timeout, pool_recycle, pool_pre_ping:
+            parametri del pool (default quelli di url.py)
+    
+    Returns:
+        Engine: lo stesso oggetto per chiamate con gli stessi parametri
+    
+    Example:
+        engine = get_engine()
+        engine = get_engine("sqlite:///ontology.db", pool_size=4)
+    """
+    database_url = database_url or url.url
+    pool_options = {
+        "pool_size": url.pool_size if pool_size is None else pool_size,
+        "max_overflow": url.max_overflow if max_overflow is None else max_overflow,
+        "pool_timeout": url.pool_timeout if pool_timeout is None else pool_timeout,
+        "pool_recycle": url.pool_recycle if pool_recycle is None else pool_recycle,
+        "pool_pre_ping": url.pool_pre_ping if pool_pre_ping is None else pool_pre_ping,
+    }
+
+    key = (database_url, echo, tuple(sorted(pool_options.items())))
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _create_engine(database_url, echo, pool_options)
+            _engines[key] = engine
+    return engine
+
+
+def _create_engine(database_url: str, echo: bool, pool_options: dict):
+    if database_url in ("sqlite://", "sqlite:///:memory:"):
+        # un db in memoria esiste solo nella sua connessione: una sola connessione condivisa
+        return _enable_sqlite_foreign_keys(
+            create_engine(database_url,
+                          echo=echo,
+                          poolclass=StaticPool,
+                          connect_args={"check_same_thread": False}))
+
+    if database_url.startswith("sqlite"):
+        # la connessione sqlite viene usata dal thread che la prende dal pool
+        return _enable_sqlite_foreign_keys(
+            create_engine(database_url,
+                          echo=echo,
+                          connect_args={"check_same_thread": False},
+                          **pool_options))
+
+    return create_engine(database_url, echo=echo, **pool_options)
+
+
+def _enable_sqlite_foreign_keys(engine):
+    '''
+    sqlite ignores the foreign keys (and their ON DELETE CASCADE) unless enabled
+    on each connection: the bulk deletes of the repository rely on them
+    '''
+    @event.listens_for(engine, "connect")
+    def set_foreign_keys(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    return engine
+
+
+def get_async_engine(database_url: str = None,
+                     echo: bool = False,
+                     pool_size: int = None,
+                     max_overflow: int = None,
+                     pool_timeout: int = None,
+                     pool_recycle: int = None,
+                     pool_pre_ping: bool = None):
+    """
+    Come get_engine, ma restituisce un AsyncEngine (driver asincrono).
+    
+    Args:
+        database_url: stringa di connessione asincrona (default url.async_url),
+                      es. "sqlite+aiosqlite:///ontology.db"
+    
+    Returns:
+        AsyncEngine: condiviso per gli stessi parametri
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    database_url = database_url or url.async_url
+    pool_options = {
+        "pool_size": url.pool_size if pool_size is None else pool_size,
+        "max_overflow": url.max_overflow if max_overflow is None else max_overflow,
+        "pool_timeout": url.pool_timeout if pool_timeout is None else pool_timeout,
+        "pool_recycle": url.pool_recycle if pool_recycle is None else pool_recycle,
+        "pool_pre_ping": url.pool_pre_ping if pool_pre_ping is None else pool_pre_ping,
+    }
+
+    key = ("async", database_url, echo, tuple(sorted(pool_options.items())))
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            if database_url in ("sqlite+aiosqlite://", "sqlite+aiosqlite:///:memory:"):
+                engine = create_async_engine(database_url, echo=echo, poolclass=StaticPool)
+            else:
+                engine = create_async_engine(database_url, echo=echo, **pool_options)
+            if database_url.startswith("sqlite"):
+                _enable_sqlite_foreign_keys(engine.sync_engine)
+            _engines[key] = engine
+    return engine
+
+
+def get_session_factory(engine=None):
+    '''
+    sessionmaker for the engine (default get_engine()), see RepositoryLayer
+    '''
+    return sessionmaker(bind=engine if engine is not None else get_engine(),
+                        expire_on_commit=False)
+
+
+def get_thread_session(engine=None):
+    '''
+    scoped_session: one session per thread, for the scripts that use the ORM directly.
+    call .remove() at the end of the work of the thread
+    '''
+    return scoped_session(get_session_factory(engine))
+
+
+def dispose_engines():
+    '''
+    closes the pools of all the shared engines (e.g. after a fork)
+    '''
+    with _engines_lock:
+        for engine in _engines.values():
+            # per gli AsyncEngine si chiude il pool dell'engine sincrono sottostante
+            getattr(engine, "sync_engine", engine).dispose()
+        _engines.clear()
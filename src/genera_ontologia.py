@@ -0,0 +1,338 @@
+'''
+generatore di ontologie sintetiche per test di carico e capacity planning.
+
+scrive, nella forma letta da populate_default_db_configuration / ontology_loader:
+    intents.json           {"intents": {"<name>": {"description", "function", "domain"}}}
+    entities.json          {"entities": {"<name>": {"description", "level"}}}
+e le relazioni come JSON Lines, un arco per riga (per nome, gli id dipendono dal db):
+    intent_matches.jsonl   {"a": "<name>", "b": "<name>", "relation_type": "equivalent", "confidence": 0.87}
+    entity_matches.jsonl
+
+le relazioni imitano quelle reali:
+    - grado a coda lunga: il numero di archi di un concetto segue una Pareto e i vicini
+      sono scelti con preferenza per i concetti "vecchi" (indici bassi), che diventano hub
+    - EQUIVALENT con confidence tra 0.5 e 1, BROADER / NARROWER sempre verso l'hub
+      (la gerarchia non ha cicli), una sola relazione per coppia non ordinata
+    - una quota di concetti deprecati, in catene DEPRECATED a -> b -> ... -> concetto attivo;
+      una parte delle catene si chiude su se stessa (cicli, vedi DeprecationResolver.cycles)
+
+tutto viene generato e scritto in streaming (la memoria non cresce con il numero di concetti)
+e dipende solo da --seed: la stessa riga di comando produce gli stessi file byte per byte.
+
+    python genera_ontologia.py --output ./ontologia_sintetica --intents 100000 --entities 50000
+    python genera_ontologia.py --output ./ontologia_1m --intents 1000000 --entities 1000000 --gzip
+    ONTOLOGY_DIR=./ontologia_sintetica python ...      # usata da populate_default_db_configuration
+
+per caricare anche le relazioni in un db già popolato: define_relations_from_edges.
+'''
+import argparse
+import gzip
+import json
+import os
+import random
+import time
+from array import array
+
+from ontology_loader import open_ontology_source
+from tables_definition import ISA95LevelEnum, RelationType
+
+VERBS = ("start", "stop", "pause", "resume", "reset", "check", "read", "set", "monitor", "report",
+         "schedule", "dispatch", "calibrate", "inspect", "load", "unload", "track", "confirm")
+OBJECTS = ("machine", "line", "batch", "order", "recipe", "sensor", "valve", "pump", "motor", "alarm",
+           "shift", "material", "lot", "tool", "conveyor", "oven", "robot", "tank")
+ATTRIBUTES = ("id", "status", "temperature", "pressure", "speed", "quantity", "code", "operator",
+              "timestamp", "threshold", "setpoint", "counter", "location", "version")
+FUNCTIONS = ("command", "query", "configuration", "notification", "planning")
+
+# distribuzione dei livelli ISA95 dei concetti generati (pesi relativi)
+LEVEL_WEIGHTS = {ISA95LevelEnum.DEFAULT: 5,
+                 ISA95LevelEnum.LEVEL_0: 10,
+                 ISA95LevelEnum.LEVEL_1: 15,
+                 ISA95LevelEnum.LEVEL_2: 25,
+                 ISA95LevelEnum.LEVEL_3: 30,
+                 ISA95LevelEnum.LEVEL_4: 15}
+
+# tipi degli archi tra concetti attivi (pesi relativi)
+RELATION_WEIGHTS = {RelationType.EQUIVALENT: 60,
+                    RelationType.BROADER: 20,
+                    RelationType.NARROWER: 20}
+
+
+def intent_name(index: int):
+    '''name of the index-th generated intent (unique, deterministic)'''
+    return f"{VERBS[index % len(VERBS)]}_{OBJECTS[index // len(VERBS) % len(OBJECTS)]}_{index}"
+
+
+def entity_name(index: int):
+    '''name of the index-th generated entity (unique, deterministic)'''
+    return f"{OBJECTS[index % len(OBJECTS)]}_{ATTRIBUTES[index // len(OBJECTS) % len(ATTRIBUTES)]}_{index}"
+
+
+def _rng(seed, stream: str):
+    # un generatore per file: i file non dipendono dall'ordine in cui vengono scritti
+    return random.Random(f"{seed}:{stream}")
+
+
+def _levels(rng, count: int):
+    return rng.choices([level.value for level in LEVEL_WEIGHTS], weights=list(LEVEL_WEIGHTS.values()), k=count)
+
+
+def generate_intents(count: int, seed=0):
+    '''
+    yields (name, data) for count intents, data as in intents.json
+    '''
+    rng = _rng(seed, "intents")
+    for index in range(count):
+        name = intent_name(index)
+        verb, concept = name.split("_")[:2]
+        yield name, {"description": f"{verb} the {concept} (synthetic intent {index})",
+                     "function": rng.choice(FUNCTIONS),
+                     "domain": _levels(rng, 1)[0]}
+
+
+def generate_entities(count: int, seed=0):
+    '''
+    yields (name, data) for count entities, data as in entities.json
+    '''
+    rng = _rng(seed, "entities")
+    for index in range(count):
+        name = entity_name(index)
+        concept, attribute = name.split("_")[:2]
+        yield name, {"description": f"{attribute} of the {concept} (synthetic entity {index})",
+                     "level": _levels(rng, 1)[0]}
+
+
+def generate_edges(count: int,
+                   name_of,
+                   seed=0,
+                   stream: str = "edges",
+                   mean_degree: float = 3.0,
+                   max_degree: int = 1000,
+                   skew: float = 3.0,
+                   deprecated_fraction: float = 0.05,
+                   max_chain: int = 8,
+                   cycle_fraction: float = 0.1):
+    """
+    Genera le relazioni tra count concetti, come (a, b, relation_type, confidence) con a e b nomi.
+
+    I concetti 0..n-1 sono divisi in attivi (i primi) e deprecati (gli ultimi count * deprecated_fraction).
+    Ogni concetto attivo i ha un numero di archi estratto da una Pareto di media mean_degree
+    verso concetti j < i, scelti come int(i * random() ** skew): più skew è alto, più gli archi
+    si concentrano sui primi concetti. Ogni coppia non ordinata compare una sola volta
+    (è generata solo dal suo concetto con indice maggiore).
+    I deprecati formano catene di 1..max_chain concetti che terminano su un concetto attivo;
+    cycle_fraction delle catene di almeno 3 concetti si chiude invece sul primo concetto
+    (una catena di 2 chiusa ripeterebbe la stessa coppia).
+
+    Args:
+        count: numero di concetti
+        name_of: funzione indice -> nome (intent_name / entity_name)
+        seed: seme del generatore
+        stream: nome del flusso casuale (file diversi, flussi indipendenti)
+
+    Returns:
+        generator: tuple (nome_a, nome_b, RelationType, confidence)
+
+    Example:
+        for a, b, relation_type, confidence in generate_edges(1000, intent_name, seed=42): ...
+    """
+    if not 0 <= deprecated_fraction < 1:
+        raise ValueError("deprecated_fraction deve essere tra 0 (compreso) e 1")
+    rng = _rng(seed, stream)
+    relation_types = list(RELATION_WEIGHTS)
+    relation_weights = list(RELATION_WEIGHTS.values())
+    # Pareto(alpha) - 1 ha media 1 / (alpha - 1): scalata per avere media mean_degree
+    alpha = 2.0
+
+    active = count - int(count * deprecated_fraction)
+    for index in range(1, active):
+        degree = min(max_degree, index, int((rng.paretovariate(alpha) - 1) * mean_degree * (alpha - 1) + 0.5))
+        targets = set()
+        for _ in range(2 * degree):
+            if len(targets) >= degree:
+                break
+            targets.add(int(index * rng.random() ** skew))
+
+        for target in sorted(targets):
+            relation_type = rng.choices(relation_types, weights=relation_weights)[0]
+            if relation_type == RelationType.EQUIVALENT:
+                pair = (index, target) if rng.random() < 0.5 else (target, index)
+                yield name_of(pair[0]), name_of(pair[1]), relation_type, round(rng.uniform(0.5, 1.0), 3)
+            elif relation_type == RelationType.BROADER:
+                # (a, b, BROADER): b più generico, cioè l'hub
+                yield name_of(index), name_of(target), relation_type, 1.0
+            else:
+                yield name_of(target), name_of(index), relation_type, 1.0
+
+    index = active
+    while index < count:
+        length = min(count - index, max_chain, int(rng.paretovariate(1.5)))
+        chain = range(index, index + length)
+        for deprecated, successor in zip(chain, chain[1:]):
+            yield name_of(deprecated), name_of(successor), RelationType.DEPRECATED, 1.0
+        if length >= 3 and rng.random() < cycle_fraction:
+            yield name_of(chain[-1]), name_of(chain[0]), RelationType.DEPRECATED, 1.0
+        elif active:
+            yield name_of(chain[-1]), name_of(int(active * rng.random() ** skew)), RelationType.DEPRECATED, 1.0
+        index += length
+
+
+def _open_output(path: str):
+    if path.endswith(".gz"):
+        # mtime fisso: l'header gzip non cambia tra due run con lo stesso seed
+        return gzip.GzipFile(path, "wb", mtime=0)
+    return open(path, "wb")
+
+
+def write_json_section(path: str, section: str, items):
+    '''
+    writes {section: {name: data, ...}} one concept at a time, returns the number of concepts
+    '''
+    written = 0
+    with _open_output(path) as file:
+        file.write(f'{{"{section}": {{'.encode("utf-8"))
+        for name, data in items:
+            separator = "," if written else ""
+            file.write(f"{separator}\n{json.dumps(name)}: {json.dumps(data)}".encode("utf-8"))
+            written += 1
+        file.write(b"\n}}\n")
+    return written
+
+
+def write_edges(path: str, edges):
+    '''
+    writes the edges as JSON Lines, returns {relation_type value: count}
+    '''
+    counts = {relation_type.value: 0 for relation_type in RelationType}
+    with _open_output(path) as file:
+        for a, b, relation_type, confidence in edges:
+            file.write((json.dumps({"a": a, "b": b, "relation_type": relation_type.value,
+                                    "confidence": confidence}) + "\n").encode("utf-8"))
+            counts[relation_type.value] += 1
+    return counts
+
+
+def iter_edges(source):
+    '''
+    yields (a name, b name, RelationType, confidence) from an edge list written by write_edges
+    '''
+    with open_ontology_source(source) as file:
+        for line in file:
+            if line.strip():
+                edge = json.loads(line)
+                yield edge["a"], edge["b"], RelationType(edge["relation_type"]), edge["confidence"]
+
+
+def define_relations_from_edges(repository, source, concept: str = "intent", batch_size: int = None):
+    """
+    Carica una lista di archi (write_edges) nel db tramite define_intents_relations /
+    define_entities_relations, traducendo i nomi in id con una snapshot dell'ontologia.
+
+    Args:
+        repository: RepositoryLayer con i concetti già presenti
+        source: path (anche .gz) o file object della lista di archi
+        concept: "intent" o "entity"
+        batch_size: coppie per transazione (default BULK_CHUNK_SIZE del repository)
+
+    Returns:
+        dict: {"inserted": int, "updated": int, "unchanged": int}
+
+    Raises:
+        ValueError: se un nome della lista non è nel db
+    """
+    if concept not in ("intent", "entity"):
+        raise ValueError("concept deve essere 'intent' o 'entity'")
+    snapshot = repository.load_snapshot()
+    concepts = snapshot.intents if concept == "intent" else snapshot.entities
+    define = repository.define_intents_relations if concept == "intent" else repository.define_entities_relations
+
+    def pairs():
+        for a, b, relation_type, confidence in iter_edges(source):
+            a_id, b_id = concepts.id_of(a), concepts.id_of(b)
+            if a_id is None or b_id is None:
+                raise ValueError(f"Concetto non trovato: {a if a_id is None else b}")
+            yield a_id, b_id, relation_type, confidence
+
+    return define(pairs(), batch_size=batch_size)
+
+
+def write_ontology(directory: str,
+                   intents: int,
+                   entities: int,
+                   seed=0,
+                   compress: bool = False,
+                   relations: bool = True,
+                   **edge_options):
+    '''
+    writes the synthetic ontology into directory, returns {file kind: (path, counts)}.
+    edge_options are passed to generate_edges
+    '''
+    os.makedirs(directory, exist_ok=True)
+    suffix = ".gz" if compress else ""
+    path = lambda file_name: os.path.join(directory, file_name + suffix)
+
+    report = {"intents": (path("intents.json"), write_json_section(path("intents.json"), "intents",
+                                                                     generate_intents(intents, seed))),
+              "entities": (path("entities.json"), write_json_section(path("entities.json"), "entities",
+                                                                       generate_entities(entities, seed)))}
+    if relations:
+        report["intent_matches"] = (path("intent_matches.jsonl"),
+                                    write_edges(path("intent_matches.jsonl"),
+                                                generate_edges(intents, intent_name, seed, "intent_matches",
+                                                               **edge_options)))
+        report["entity_matches"] = (path("entity_matches.jsonl"),
+                                    write_edges(path("entity_matches.jsonl"),
+                                                generate_edges(entities, entity_name, seed, "entity_matches",
+                                                               **edge_options)))
+    return report
+
+
+def degree_summary(source):
+    '''
+    max and mean degree of the concepts of an edge list (keeps one counter per concept)
+    '''
+    index_of = {}
+    degrees = array("l")
+    for a, b, _, _ in iter_edges(source):
+        for name in (a, b):
+            position = index_of.setdefault(name, len(index_of))
+            if position == len(degrees):
+                degrees.append(0)
+            degrees[position] += 1
+    if not degrees:
+        return {"concepts": 0, "max": 0, "mean": 0.0}
+    return {"concepts": len(degrees), "max": max(degrees), "mean": sum(degrees) / len(degrees)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", required=True, help="directory dei file generati")
+    parser.add_argument("--intents", type=int, default=10_000)
+    parser.add_argument("--entities", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mean-degree", type=float, default=3.0, help="archi medi per concetto attivo")
+    parser.add_argument("--max-degree", type=int, default=1000)
+    parser.add_argument("--skew", type=float, default=3.0, help="concentrazione degli archi sugli hub (1 = uniforme)")
+    parser.add_argument("--deprecated", type=float, default=0.05, help="quota di concetti deprecati")
+    parser.add_argument("--max-chain", type=int, default=8, help="lunghezza massima delle catene DEPRECATED")
+    parser.add_argument("--cycles", type=float, default=0.1, help="quota di catene DEPRECATED chiuse in ciclo")
+    parser.add_argument("--no-relations", action="store_true", help="solo intents.json / entities.json")
+    parser.add_argument("--gzip", action="store_true", help="file compressi .gz")
+    parser.add_argument("--degrees", action="store_true", help="stampa grado massimo e medio (rilegge gli archi)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    report = write_ontology(args.output, args.intents, args.entities, seed=args.seed, compress=args.gzip,
+                            relations=not args.no_relations,
+                            mean_degree=args.mean_degree, max_degree=args.max_degree, skew=args.skew,
+                            deprecated_fraction=args.deprecated, max_chain=args.max_chain,
+                            cycle_fraction=args.cycles)
+    for kind, (path, counts) in report.items():
+        print(f"{kind:<16}{path}: {counts}")
+        if args.degrees and kind.endswith("_matches"):
+            print(f"{'':<16}grado: {degree_summary(path)}")
+    print(f"generata in {time.perf_counter() - start:.1f} s (seed {args.seed})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+'''
+migrazione dei db esistenti alla coppia canonica di intent_match / entity_match.
+
+le tabelle create prima di questa versione non hanno le colonne min_id / max_id
+né l'indice unique_*_pair (create_all non modifica tabelle esistenti). per ogni tabella:
+    1. elimina i duplicati (a, b) / (b, a), tenendo la relazione più recente (id maggiore)
+    2. aggiunge le colonne generate min_id / max_id (VIRTUAL, come in tables_definition)
+    3. crea l'indice unique_*_pair su (min_id, max_id)
+la migrazione è idempotente: i passi già eseguiti vengono saltati.
+
+    python migrazione_coppie_canoniche.py                              # database di url.py
+    python migrazione_coppie_canoniche.py sqlite:///ontology.db
+'''
+import sys
+
+from sqlalchemy import inspect, text
+
+from engine_factory import get_engine
+from tables_definition import *
+
+
+def migrate_match_table(connection, match_model):
+    '''
+    migrates one match table, returns the number of duplicated relations removed
+    '''
+    table = match_model.__table__
+    index_name = next(index.name for index in table.indexes if index.name.endswith("_pair"))
+    a_column, b_column = [column.name for column in table.c if column.name.endswith(("_a_id", "_b_id"))]
+    min_expression = f"CASE WHEN {a_column} < {b_column} THEN {a_column} ELSE {b_column} END"
+    max_expression = f"CASE WHEN {a_column} < {b_column} THEN {b_column} ELSE {a_column} END"
+
+    # 1. duplicati: resta una relazione per coppia non ordinata
+    # (la tabella derivata serve a MySQL, che non permette di leggere la tabella in cui cancella)
+    removed = connection.execute(text(
+        f"DELETE FROM {table.name} WHERE id NOT IN ("
+        f"SELECT id FROM (SELECT MAX(id) AS id FROM {table.name} "
+        f"GROUP BY {min_expression}, {max_expression}) AS keep)")).rowcount
+
+    # 2. colonne generate
+    inspector = inspect(connection)
+    columns = {column["name"] for column in inspector.get_columns(table.name)}
+    for column_name, expression in (("min_id", min_expression), ("max_id", max_expression)):
+        if column_name not in columns:
+            connection.execute(text(
+                f"ALTER TABLE {table.name} ADD COLUMN {column_name} INTEGER "
+                f"GENERATED ALWAYS AS ({expression}) VIRTUAL"))
+
+    # 3. indice unique sulla coppia canonica
+    indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+    if index_name not in indexes:
+        connection.execute(text(f"CREATE UNIQUE INDEX {index_name} ON {table.name} (min_id, max_id)"))
+
+    print(f"{table.name}: {removed} relazioni duplicate rimosse, coppia canonica attiva")
+    return removed
+
+
+def main():
+    engine = get_engine(sys.argv[1]) if len(sys.argv) > 1 else get_engine()
+
+    # una transazione per tutta la migrazione (su MySQL gli ALTER fanno commit implicito)
+    with engine.begin() as connection:
+        for match_model in (IntentMatch, EntityMatch):
+            migrate_match_table(connection, match_model)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+'''
+migrazione dei db esistenti alla colonna level_mask di intent / entity.
+
+le tabelle create prima di questa versione non hanno la colonna (create_all non modifica
+tabelle esistenti) e il RepositoryLayer non può leggerle finché non viene aggiunta:
+    1. aggiunge level_mask (INTEGER NULL) a intent ed entity
+    2. crea la tabella ontology_version, se manca: la riparazione la incrementa
+       come ogni scrittura del RepositoryLayer
+    3. calcola le maschere dai link ISA95 (RepositoryLayer.check_level_masks(repair=True))
+la migrazione è idempotente: la colonna e la tabella già presenti non vengono ricreate e
+vengono ricalcolate solo le maschere NULL o non coerenti.
+
+    python migrazione_level_mask.py                              # database di url.py
+    python migrazione_level_mask.py sqlite:///ontology.db
+'''
+import importlib
+import sys
+
+from sqlalchemy import inspect, text
+
+from engine_factory import get_engine
+from tables_definition import *
+
+RepositoryLayer = importlib.import_module("3-repository").RepositoryLayer
+
+
+def add_level_mask_column(connection, model):
+    '''
+    adds the level_mask column to the table of model, returns False if already there
+    '''
+    table_name = model.__tablename__
+    columns = {column["name"] for column in inspect(connection).get_columns(table_name)}
+    if "level_mask" in columns:
+        return False
+    connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN level_mask INTEGER NULL"))
+    print(f"{table_name}: colonna level_mask aggiunta")
+    return True
+
+
+def main():
+    engine = get_engine(sys.argv[1]) if len(sys.argv) > 1 else get_engine()
+
+    with engine.begin() as connection:
+        for model in (Intent, Entity):
+            add_level_mask_column(connection, model)
+        OntologyVersion.__table__.create(connection, checkfirst=True)
+
+    report = RepositoryLayer(engine).check_level_masks(repair=True)
+    print(f"level_mask coerente: {len(report['intent'])} intent e {len(report['entity'])} entity ricalcolati")
+
+
+if __name__ == "__main__":
+    main()
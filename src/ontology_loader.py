@@ -0,0 +1,308 @@
+'''
+lettura in streaming delle ontologie (intents.json / entities.json).
+
+il file json ha la forma
+    {"intents": {"<name>": {...}, "<name>": {...}, ...}}
+e viene percorso una chiave alla volta: in memoria resta solo il concetto corrente,
+quindi il consumo non dipende dalla dimensione del file.
+
+in alternativa è supportato il formato JSON Lines (.jsonl), un concetto per riga:
+    {"name": "<name>", "description": "...", "domain": "..."}
+
+una sorgente può essere:
+    - un path (.json / .jsonl, eventualmente compresso .gz / .zst)
+    - "-" per leggere da stdin
+    - un file object (testo o binario)
+    - una directory di shard, ognuno dei quali è una sorgente a sé
+'''
+import gzip
+import io
+import json
+import os
+import sys
+
+# directory delle ontologie di default, configurabile con la variabile d'ambiente ONTOLOGY_DIR
+# (altrimenti config/ontology nella radice del repository)
+DEFAULT_ONTOLOGY_DIR = os.environ.get(
+    "ONTOLOGY_DIR",
+    os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "config", "ontology")))
+
+_COMPRESSION_SUFFIXES = (".gz", ".zst")
+_ONTOLOGY_SUFFIXES = (".json", ".jsonl")
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",}]"
+
+
+class _JSONStream():
+    '''
+    minimal incremental reader over a text file object:
+    it keeps in memory only the part of the file not consumed yet
+    '''
+    def __init__(self, fp, read_size: int = 1 << 16):
+        self.fp = fp
+        self.read_size = read_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        '''reads the next block of the file, returns False at the end of the file'''
+        if self.eof:
+            return False
+        data = self.fp.read(self.read_size)
+        if not data:
+            self.eof = True
+            return False
+        # scarta la parte già consumata
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        '''returns the next non whitespace char without consuming it ('' at the end of the file)'''
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON non valido: atteso '{char}', trovato '{found or 'EOF'}'")
+        self.pos += 1
+
+    def value(self):
+        '''decodes the next json value'''
+        if self.peek() not in '{["':
+            # numeri e literal non hanno un terminatore: si legge fino al primo delimitatore
+            while not any(char in self.buffer[self.pos:] for char in _DELIMITERS) and self._fill():
+                pass
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            self.pos = end
+            return value
+
+    def skip(self):
+        '''skips the next json value without materializing objects and arrays'''
+        char = self.peek()
+        if char == "{":
+            for _ in self.members():
+                self.skip()
+        elif char == "[":
+            self.pos += 1
+            if self.peek() == "]":
+                self.pos += 1
+                return
+            while True:
+                self.skip()
+                if self.peek() == ",":
+                    self.pos += 1
+                    continue
+                self.expect("]")
+                return
+        else:
+            self.value()
+
+    def members(self):
+        '''
+        iterates the keys of the next json object; after each key the caller
+        must consume the value (value() or skip())
+        '''
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("}")
+            return
+
+
+def iter_json_section(fp, section: str):
+    '''
+    yields (name, data) for each key of fp[section] reading the file incrementally
+
+    Args:
+        fp: file object aperto in modalità testo
+        section: "intents" / "entities"
+    '''
+    stream = _JSONStream(fp)
+    for key in stream.members():
+        if key != section:
+            stream.skip()
+            continue
+        for name in stream.members():
+            yield name, stream.value()
+
+
+def iter_jsonl(fp):
+    '''
+    yields (name, data) for each line of a JSON Lines file
+    (empty lines are ignored)
+    '''
+    for line_number, line in enumerate(fp, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        data = json.loads(line)
+        if "name" not in data:
+            raise ValueError(f"Riga {line_number}: manca il campo 'name'")
+        name = data.pop("name")
+        yield name, data
+
+
+def default_ontology_sources():
+    '''
+    returns {"intents": path, "entities": path} inside DEFAULT_ONTOLOGY_DIR
+    '''
+    return {"intents": os.path.join(DEFAULT_ONTOLOGY_DIR, "intents.json"),
+            "entities": os.path.join(DEFAULT_ONTOLOGY_DIR, "entities.json")}
+
+
+def _source_name(source):
+    '''file name of a source without the compression suffix, '' if unknown'''
+    if isinstance(source, (str, os.PathLike)):
+        name = os.fspath(source)
+    else:
+        name = getattr(source, "name", "")
+        name = name if isinstance(name, str) else ""
+    for suffix in _COMPRESSION_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def open_ontology_source(source):
+    '''
+    opens a source (path, "-" or file object) as a utf-8 text file object.
+    file objects are not closed when the returned object is closed
+
+    Raises:
+        ImportError: per i file .zst se il pacchetto 'zstandard' non è installato
+    '''
+    if source == "-":
+        return _NotClosing(sys.stdin)
+
+    if not isinstance(source, (str, os.PathLike)):
+        if isinstance(source, io.TextIOBase):
+            return _NotClosing(source)
+        return _NotClosing(io.TextIOWrapper(source, encoding='utf-8'), detach=True)
+
+    path = os.fspath(source)
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f"Per leggere '{path}' occorre installare il pacchetto 'zstandard'")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')),
+                                encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+class _NotClosing():
+    '''
+    context manager around a file object owned by the caller:
+    the file object is not closed at the end of the with block.
+    detach=True is for the text wrappers created around a binary file object
+    '''
+    def __init__(self, fp, detach: bool = False):
+        self.fp = fp
+        self.detach = detach
+
+    def __enter__(self):
+        return self.fp
+
+    def __exit__(self, *exc_info):
+        if self.detach:
+            # il wrapper creato qui non deve chiudere il file binario del chiamante
+            self.fp.detach()
+        return False
+
+
+def iter_ontology_source(source, section: str, jsonl: bool = None):
+    '''
+    yields (name, data) from a source, reading it incrementally
+
+    Args:
+        source: path, "-" o file object
+        section: "intents" / "entities"
+        jsonl: formato JSON Lines; se None viene dedotto dall'estensione
+    '''
+    if jsonl is None:
+        jsonl = _source_name(source).endswith(".jsonl")
+
+    with open_ontology_source(source) as f:
+        if jsonl:
+            yield from iter_jsonl(f)
+        else:
+            yield from iter_json_section(f, section)
+
+
+def load_ontology_source(source, section: str):
+    '''
+    returns the (name, data) pairs of a source loading it whole with json.load
+    (faster than iter_ontology_source, but the memory grows with the file)
+    '''
+    if _source_name(source).endswith(".jsonl"):
+        return list(iter_ontology_source(source, section, jsonl=True))
+
+    with open_ontology_source(source) as f:
+        data = json.load(f)
+    return list(data[section].items())
+
+
+def list_shards(source):
+    '''
+    returns the list of sources: the ontology files of a directory (sorted by name)
+    or [source] for any other source
+
+    Raises:
+        ValueError: se il path non esiste o la directory non contiene file di ontologia
+    '''
+    if not isinstance(source, (str, os.PathLike)) or source == "-":
+        return [source]
+    if not os.path.exists(source):
+        raise ValueError(f"Sorgente di ontologia '{os.fspath(source)}' non trovata: impostare la variabile "
+                         f"d'ambiente ONTOLOGY_DIR o passare intents_source / entities_source")
+    if not os.path.isdir(source):
+        return [source]
+
+    shards = []
+    for file_name in sorted(os.listdir(source)):
+        if _source_name(file_name).endswith(_ONTOLOGY_SUFFIXES):
+            shards.append(os.path.join(source, file_name))
+    if not shards:
+        raise ValueError(f"Nessun file di ontologia trovato in '{os.fspath(source)}'")
+    return shards
+
+
+def batched(iterable, size: int):
+    '''
+    groups iterable in lists of at most size elements
+    '''
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
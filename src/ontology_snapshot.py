@@ -0,0 +1,262 @@
+'''
+fotografia immutabile dell'ontologia in memoria, per le letture che non devono toccare il db
+(es. il percorso NLP).
+
+    snapshot = repository.load_snapshot()
+    snapshot.intents.id_of("start_machine")
+    snapshot.intents.levels_of("start_machine")          # [ISA95LevelEnum.LEVEL_2, ...]
+    snapshot.intents.with_level(ISA95LevelEnum.LEVEL_3)  # id degli intenti MES
+    snapshot.entities.related(74, RelationType.EQUIVALENT)
+    snapshot.memory_footprint()
+
+per intenti ed entità:
+    - ogni concetto ha una posizione densa 0..n-1 (in ordine di id): ids, names e
+      level_masks sono array paralleli indicizzati per posizione
+    - name -> posizione e id -> posizione sono dizionari: ogni lookup costa un accesso
+    - i livelli ISA95 sono una maschera di un byte per concetto
+      (bit in tables_definition.ISA95_LEVEL_BITS)
+    - le relazioni sono liste di adiacenza compresse (CSR): gli archi di un concetto sono
+      contigui negli array targets / relation codes / confidences, tra offsets[p] e offsets[p + 1]
+
+la snapshot non può essere modificata (attributi bloccati, array esposti come memoryview
+in sola lettura), quindi può essere letta da più thread senza lock. il RepositoryLayer
+tiene l'ultima snapshot in repository.snapshot e la sostituisce con un solo assegnamento
+quando la nuova è completa: chi legge repository.snapshot una volta lavora su una versione coerente.
+'''
+import sys
+import time
+from array import array
+
+from tables_definition import ISA95LevelEnum, RelationType, ISA95_LEVEL_BITS, mask_to_levels
+
+# codice di un byte per ogni RelationType negli array di adiacenza
+RELATION_TYPES = tuple(RelationType)
+_RELATION_CODES = {relation_type: code for code, relation_type in enumerate(RELATION_TYPES)}
+
+
+class _Frozen():
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} è immutabile")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} è immutabile")
+
+    def _freeze(self, **attributes):
+        for name, value in attributes.items():
+            object.__setattr__(self, name, value)
+
+
+class _Adjacency(_Frozen):
+    '''
+    compressed adjacency lists of the edges leaving each position
+    '''
+    __slots__ = ("offsets", "targets", "codes", "confidences")
+
+    def __init__(self, count: int, edges):
+        '''
+        edges: list of (source position, target id, relation code, confidence)
+        '''
+        # counting sort per posizione di partenza: O(nodi + archi)
+        offsets = array("q", bytes(8 * (count + 1)))
+        for edge in edges:
+            offsets[edge[0] + 1] += 1
+        for position in range(count):
+            offsets[position + 1] += offsets[position]
+
+        targets = array("q", bytes(8 * len(edges)))
+        codes = array("B", bytes(len(edges)))
+        confidences = array("d", bytes(8 * len(edges)))
+        cursor = offsets[:-1]
+        for source, target, code, confidence in edges:
+            slot = cursor[source]
+            cursor[source] = slot + 1
+            targets[slot] = target
+            codes[slot] = code
+            confidences[slot] = confidence
+
+        self._freeze(offsets=offsets, targets=targets, codes=codes, confidences=confidences)
+
+    def edges(self, position: int, code: int = None):
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return tuple((self.targets[slot], RELATION_TYPES[self.codes[slot]], self.confidences[slot])
+                     for slot in range(start, end)
+                     if code is None or self.codes[slot] == code)
+
+    def footprint(self):
+        return sum(sys.getsizeof(column) for column in (self.offsets, self.targets, self.codes, self.confidences))
+
+
+class ConceptSnapshot(_Frozen):
+    '''
+    the intents (or the entities) of a snapshot: names, ISA95 levels and relations
+    '''
+    __slots__ = ("_ids", "_names", "_level_masks", "_position_of_id", "_position_of_name",
+                 "_by_level", "_outgoing", "_incoming")
+
+    def __init__(self, concepts, links, edges):
+        '''
+        concepts: (id, name) rows ordered by id
+        links: (concept id, ISA95LevelEnum) rows
+        edges: (a id, b id, relation_type, confidence) rows
+        '''
+        ids = array("q")
+        names = []
+        for concept_id, name in concepts:
+            ids.append(concept_id)
+            names.append(name)
+        position_of_id = {concept_id: position for position, concept_id in enumerate(ids)}
+        position_of_name = {name: position for position, name in enumerate(names)}
+
+        level_masks = array("B", bytes(len(ids)))
+        for concept_id, level in links:
+            position = position_of_id.get(concept_id)
+            if position is not None:
+                level_masks[position] |= ISA95_LEVEL_BITS[level]
+        by_level = {level: tuple(ids[position] for position, mask in enumerate(level_masks) if mask & bit)
+                    for level, bit in ISA95_LEVEL_BITS.items()}
+
+        outgoing = []
+        incoming = []
+        for a_id, b_id, relation_type, confidence in edges:
+            a_position = position_of_id.get(a_id)
+            b_position = position_of_id.get(b_id)
+            if a_position is None or b_position is None:
+                continue
+            code = _RELATION_CODES[RelationType(relation_type)]
+            outgoing.append((a_position, b_id, code, confidence))
+            incoming.append((b_position, a_id, code, confidence))
+
+        self._freeze(_ids=ids, _names=tuple(names), _level_masks=level_masks,
+                     _position_of_id=position_of_id, _position_of_name=position_of_name,
+                     _by_level=by_level,
+                     _outgoing=_Adjacency(len(ids), outgoing),
+                     _incoming=_Adjacency(len(ids), incoming))
+
+    def _position(self, concept):
+        # concept: id (int) o nome (str)
+        if isinstance(concept, str):
+            return self._position_of_name.get(concept)
+        return self._position_of_id.get(concept)
+
+    # names
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, concept):
+        return self._position(concept) is not None
+
+    def id_of(self, name: str):
+        '''
+        id of a concept name, None if not found
+        '''
+        position = self._position_of_name.get(name)
+        return None if position is None else self._ids[position]
+
+    def name_of(self, concept_id: int):
+        '''
+        name of a concept id, None if not found
+        '''
+        position = self._position_of_id.get(concept_id)
+        return None if position is None else self._names[position]
+
+    @property
+    def ids(self):
+        '''ids of the concepts, by position (read-only)'''
+        return memoryview(self._ids).toreadonly()
+
+    @property
+    def names(self):
+        '''names of the concepts, by position'''
+        return self._names
+
+    # ISA95 levels
+    @property
+    def level_masks(self):
+        '''level bitmasks of the concepts, by position (read-only)'''
+        return memoryview(self._level_masks).toreadonly()
+
+    def level_mask(self, concept):
+        '''
+        level bitmask of a concept (id or name), 0 if not found
+        '''
+        position = self._position(concept)
+        return 0 if position is None else self._level_masks[position]
+
+    def levels_of(self, concept):
+        '''
+        ISA95 levels of a concept (id or name), in enum order
+        '''
+        return mask_to_levels(self.level_mask(concept))
+
+    def has_level(self, concept, level: ISA95LevelEnum):
+        return bool(self.level_mask(concept) & ISA95_LEVEL_BITS[level])
+
+    def with_level(self, level: ISA95LevelEnum):
+        '''
+        ids of the concepts at an ISA95 level (precomputed tuple)
+        '''
+        return self._by_level[level]
+
+    # relations
+    def related(self, concept, relation_type: RelationType = None, incoming: bool = False):
+        """
+        Relazioni di un concetto (id o nome), nella direzione in cui sono state definite.
+
+        Args:
+            concept: id o nome del concetto
+            relation_type: solo le relazioni di questo tipo (None: tutte)
+            incoming: False -> archi (concept, altro), True -> archi (altro, concept)
+
+        Returns:
+            tuple[tuple[int, RelationType, float]]: (id dell'altro concetto, tipo, confidence)
+
+        Example:
+            snapshot.intents.related(180, RelationType.DEPRECATED)   # ((181, DEPRECATED, 1.0),)
+        """
+        position = self._position(concept)
+        if position is None:
+            return ()
+        adjacency = self._incoming if incoming else self._outgoing
+        code = None if relation_type is None else _RELATION_CODES[relation_type]
+        return adjacency.edges(position, code)
+
+    def footprint(self):
+        '''
+        approximate bytes held by this part of the snapshot
+        (containers, plus the strings and ints they reference)
+        '''
+        names = sum(sys.getsizeof(name) for name in self._names)
+        ids = sum(sys.getsizeof(concept_id) for concept_id in self._position_of_id)
+        return {"concepts": len(self._ids),
+                "relations": len(self._outgoing.targets),
+                "arrays": sys.getsizeof(self._ids) + sys.getsizeof(self._level_masks),
+                "names": sys.getsizeof(self._names) + names,
+                "lookups": (sys.getsizeof(self._position_of_id) + sys.getsizeof(self._position_of_name)
+                            + ids),
+                "levels": sum(sys.getsizeof(level_ids) for level_ids in self._by_level.values()),
+                "adjacency": self._outgoing.footprint() + self._incoming.footprint()}
+
+
+class OntologySnapshot(_Frozen):
+    '''
+    intents and entities of the ontology at a given ontology_version, see RepositoryLayer.load_snapshot
+    '''
+    __slots__ = ("version", "loaded_at", "intents", "entities")
+
+    def __init__(self, version: int, intents: ConceptSnapshot, entities: ConceptSnapshot):
+        self._freeze(version=version, loaded_at=time.time(), intents=intents, entities=entities)
+
+    def memory_footprint(self):
+        """
+        Stima della memoria occupata dalla snapshot, in byte.
+
+        Returns:
+            dict: {"intents": {...}, "entities": {...}, "total": int}, con il dettaglio
+                  per componente (array, nomi, dizionari di lookup, livelli, adiacenze)
+        """
+        report = {"intents": self.intents.footprint(), "entities": self.entities.footprint()}
+        report["total"] = sum(value for part in report.values()
+                              for key, value in part.items() if key not in ("concepts", "relations"))
+        return report
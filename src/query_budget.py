@@ -0,0 +1,117 @@
+'''
+limite al numero di statement eseguiti in un blocco, per scoprire gli N+1 nei test e in staging.
+
+    with repository.query_budget(max_statements=3):
+        repository.get_intent_records_by_isa95_level(ISA95LevelEnum.LEVEL_3)
+
+    @repository.query_budget(max_statements=10)
+    def classify(names): ...
+
+a fine blocco, se gli statement eseguiti sull'engine del repository (dal thread / task
+corrente) sono più di max_statements:
+    mode="raise" -> QueryBudgetExceeded, con l'elenco degli statement
+    mode="log"   -> warning sul logger "query_budget" (staging), il blocco prosegue
+i metodi del RepositoryLayer con un budget fisso (decorati con _query_budget) vengono
+controllati solo se la variabile d'ambiente ONTOLOGY_QUERY_BUDGET vale "raise" o "log"
+(es. in CI e in staging): in produzione il controllo non costa nulla.
+'''
+import contextvars
+import functools
+import logging
+import os
+import threading
+import weakref
+
+from sqlalchemy import event
+
+MODES = ("raise", "log")
+
+logger = logging.getLogger("query_budget")
+
+# budget attivi nel contesto corrente (thread / task), dal più esterno
+_active_budgets = contextvars.ContextVar("query_budgets", default=())
+
+_listening_engines = weakref.WeakSet()
+_listening_lock = threading.Lock()
+
+
+def default_mode():
+    '''
+    mode of the pinned repository budgets: ONTOLOGY_QUERY_BUDGET ("raise" / "log"), None if disabled
+    '''
+    mode = os.environ.get("ONTOLOGY_QUERY_BUDGET", "").strip().lower()
+    return mode if mode in MODES else None
+
+
+class QueryBudgetExceeded(RuntimeError):
+    def __init__(self, message, statements):
+        super().__init__(message)
+        self.statements = statements
+
+
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    for budget in _active_budgets.get():
+        if budget.engine is conn.engine:
+            budget.statements.append(statement)
+
+
+def _listen(engine):
+    with _listening_lock:
+        if engine not in _listening_engines:
+            event.listen(engine, "before_cursor_execute", _record_statement)
+            _listening_engines.add(engine)
+
+
+class QueryBudget():
+    def __init__(self, engine, max_statements: int, mode: str = "raise", label: str = None):
+        '''
+        engine: the statements executed on this engine are counted
+        mode: "raise" or "log"
+        label: name shown in the report (the decorated function by default)
+        '''
+        if mode not in MODES:
+            raise ValueError(f"mode deve essere uno tra {', '.join(MODES)}")
+        self.engine = engine
+        self.max_statements = max_statements
+        self.mode = mode
+        self.label = label
+        self.statements = []
+        self._token = None
+
+    def __enter__(self):
+        _listen(self.engine)
+        self.statements = []
+        self._token = _active_budgets.set(_active_budgets.get() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _active_budgets.reset(self._token)
+        # un'eccezione del blocco non viene coperta da quella del budget
+        if exc_type is None:
+            self.check()
+
+    def __call__(self, function):
+        '''
+        decorator form: every call gets its own budget
+        '''
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with QueryBudget(self.engine, self.max_statements, self.mode, self.label or function.__qualname__):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    def check(self):
+        '''
+        raises / logs if the statements recorded so far exceed the budget
+        '''
+        if len(self.statements) <= self.max_statements:
+            return
+        label = f" per {self.label}" if self.label else ""
+        report = "\n".join(f"{'!' if position > self.max_statements else ' '} {position:3d}. {statement}"
+                           for position, statement in enumerate(self.statements, start=1))
+        message = (f"Query budget superato{label}: {len(self.statements)} statement eseguiti, "
+                   f"massimo {self.max_statements} (! = oltre il budget)\n{report}")
+        if self.mode == "raise":
+            raise QueryBudgetExceeded(message, list(self.statements))
+        logger.warning(message)
@@ -0,0 +1,218 @@
+'''
+metriche delle query per metodo del RepositoryLayer, raccolte dagli eventi dell'engine
+(before_cursor_execute / after_cursor_execute) invece che con echo=True.
+
+    metrics = QueryMetrics()
+    repository = RepositoryLayer(engine, metrics=metrics)
+    ...
+    metrics.snapshot()                                   # dict per metodo
+    metrics.write_prometheus("/var/lib/node_exporter/repository.prom")
+
+per ogni metodo (la chiamata più esterna: i metodi annidati contano per il chiamante):
+    - chiamate e durata delle chiamate
+    - statement eseguiti, righe modificate e durata degli statement
+le righe modificate sono il rowcount del driver dei soli INSERT / UPDATE / DELETE: per le
+SELECT il rowcount vale -1 (o 0) e non dice quante righe sono state lette.
+le durate finiscono in istogrammi a bucket fissi: registrare una misura costa una
+bisect e qualche somma sotto un lock, abbastanza poco da lasciarle attive in produzione.
+gli statement eseguiti fuori da un metodo del repository vengono contati sotto OTHER.
+'''
+import contextvars
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+from sqlalchemy import event
+
+# estremi superiori dei bucket, in secondi (come i default dei client Prometheus, più 10 s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+OTHER = "other"
+
+# metodo del repository in esecuzione nel contesto corrente (thread / task)
+current_method = contextvars.ContextVar("repository_method", default=None)
+
+
+class _Histogram():
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)      # ultimo bucket: +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, buckets, value: float):
+        self.counts[bisect_left(buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self, buckets):
+        '''{upper bound: observations <= bound}, "+Inf" included'''
+        result = {}
+        running = 0
+        for bound, count in zip(list(buckets) + ["+Inf"], self.counts):
+            running += count
+            result[bound] = running
+        return result
+
+
+class _MethodStats():
+    __slots__ = ("calls", "statements", "affected_rows", "call_seconds", "statement_seconds")
+
+    def __init__(self, buckets):
+        self.calls = 0
+        self.statements = 0
+        self.affected_rows = 0
+        self.call_seconds = _Histogram(buckets)
+        self.statement_seconds = _Histogram(buckets)
+
+
+class _Measurement():
+    # classe invece di @contextmanager: niente generatore per ogni chiamata
+    __slots__ = ("metrics", "method_name", "token", "start")
+
+    def __init__(self, metrics, method_name):
+        self.metrics = metrics
+        self.method_name = method_name
+
+    def __enter__(self):
+        self.token = current_method.set(self.method_name)
+        self.start = self.metrics.clock()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = self.metrics.clock() - self.start
+        current_method.reset(self.token)
+        self.metrics._record_call(self.method_name, elapsed)
+
+
+class QueryMetrics():
+    def __init__(self, buckets=DEFAULT_BUCKETS, clock=time.perf_counter):
+        '''
+        buckets: upper bounds in seconds of the latency histograms
+        '''
+        self.buckets = tuple(sorted(buckets))
+        self.clock = clock
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._engines = weakref.WeakSet()
+
+    # collection
+    def attach(self, engine):
+        '''
+        installs the statement listeners on engine (once per engine)
+        '''
+        with self._lock:
+            if engine in self._engines:
+                return
+            self._engines.add(engine)
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+
+    def _method_stats(self, method_name):
+        stats = self._stats.get(method_name)
+        if stats is None:
+            stats = self._stats[method_name] = _MethodStats(self.buckets)
+        return stats
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_metrics_start", []).append(self.clock())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = self.clock() - conn.info["query_metrics_start"].pop()
+        rows = 0
+        if context is not None and (context.isinsert or context.isupdate or context.isdelete):
+            # rowcount delle SELECT: -1 o 0, non il numero di righe lette
+            rows = max(cursor.rowcount or 0, 0)
+        method_name = current_method.get() or OTHER
+        with self._lock:
+            stats = self._method_stats(method_name)
+            stats.statements += 1
+            stats.affected_rows += rows
+            stats.statement_seconds.observe(self.buckets, elapsed)
+
+    def _handle_error(self, exception_context):
+        # lo statement fallito non arriva ad after_cursor_execute
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_metrics_start"):
+            connection.info["query_metrics_start"].pop()
+
+    def measure(self, method_name: str):
+        '''
+        context manager that attributes the statements executed inside the block
+        to method_name and records the duration of the call (used by RepositoryLayer._unit_of_work)
+        '''
+        return _Measurement(self, method_name)
+
+    def _record_call(self, method_name: str, elapsed: float):
+        with self._lock:
+            stats = self._method_stats(method_name)
+            stats.calls += 1
+            stats.call_seconds.observe(self.buckets, elapsed)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    # export
+    def snapshot(self):
+        """
+        Copia delle metriche raccolte.
+
+        Returns:
+            dict: {metodo: {"calls", "statements", "affected_rows", "call_seconds", "statement_seconds",
+                   "call_histogram", "statement_histogram"}}, gli istogrammi come
+                   {estremo superiore: osservazioni <= estremo} (cumulativi, "+Inf" compreso);
+                   affected_rows: righe inserite, aggiornate o eliminate (rowcount del driver)
+
+        Example:
+            metrics.snapshot()["add_intent_isa_levels"]["statements"]
+        """
+        with self._lock:
+            return {method_name: {"calls": stats.calls,
+                                  "statements": stats.statements,
+                                  "affected_rows": stats.affected_rows,
+                                  "call_seconds": stats.call_seconds.total,
+                                  "statement_seconds": stats.statement_seconds.total,
+                                  "call_histogram": stats.call_seconds.cumulative(self.buckets),
+                                  "statement_histogram": stats.statement_seconds.cumulative(self.buckets)}
+                    for method_name, stats in self._stats.items()}
+
+    def prometheus_text(self, prefix: str = "ontology_repository"):
+        '''
+        the metrics in the Prometheus text exposition format
+        '''
+        snapshot = self.snapshot()
+        lines = []
+
+        for name, key, help_text in (("calls_total", "calls", "Repository method calls"),
+                                     ("statements_total", "statements", "SQL statements executed"),
+                                     ("affected_rows_total", "affected_rows",
+                                      "Rows inserted, updated or deleted (driver rowcount)")):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for method_name, stats in snapshot.items():
+                lines.append(f'{prefix}_{name}{{method="{method_name}"}} {stats[key]}')
+
+        for name, key, help_text in (("call_duration_seconds", "call", "Repository method call duration"),
+                                     ("statement_duration_seconds", "statement", "SQL statement duration")):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for method_name, stats in snapshot.items():
+                for bound, count in stats[f"{key}_histogram"].items():
+                    lines.append(f'{prefix}_{name}_bucket{{method="{method_name}",le="{bound}"}} {count}')
+                lines.append(f'{prefix}_{name}_sum{{method="{method_name}"}} {stats[f"{key}_seconds"]}')
+                lines.append(f'{prefix}_{name}_count{{method="{method_name}"}} {stats[f"{key}_histogram"]["+Inf"]}')
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, prefix: str = "ontology_repository"):
+        '''
+        writes prometheus_text() to path atomically (e.g. for the node_exporter textfile collector)
+        '''
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(self.prometheus_text(prefix))
+        os.replace(temporary_path, path)
@@ -0,0 +1,97 @@
+'''
+cache read-through per i metodi di lettura del RepositoryLayer.
+
+    cache = LRUTTLCache(maxsize=256, ttl=600)
+    repository = RepositoryLayer(engine, cache=cache)
+    repository.get_intents_by_isa95_level(ISA95LevelEnum.LEVEL_3)   # miss: query
+    repository.get_intents_by_isa95_level(ISA95LevelEnum.LEVEL_3)   # hit
+    cache.stats()
+
+la cache è limitata (LRU) e ogni valore scade dopo ttl secondi; i metodi di scrittura
+del repository invalidano solo le chiavi che hanno modificato.
+qualsiasi oggetto con la stessa interfaccia (lookup / put / invalidate / clear) può
+essere passato al repository al posto di LRUTTLCache.
+'''
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUTTLCache():
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0, clock=time.monotonic):
+        '''
+        maxsize: maximum number of keys, the least recently used is evicted first
+        ttl: seconds after which a value expires (None: no expiration)
+        '''
+        if maxsize <= 0:
+            raise ValueError("maxsize deve essere positivo")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()      # key -> (scadenza, valore)
+        self._lock = threading.Lock()
+        # incrementato a ogni invalidazione: un valore letto prima non viene salvato
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def lookup(self, key):
+        '''
+        returns (True, value) on a hit, (False, token) on a miss:
+        the token must be passed to put together with the loaded value
+        '''
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > self.clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._data[key]
+                self.expirations += 1
+            self.misses += 1
+            return False, self._generation
+
+    def put(self, key, value, token=None):
+        '''
+        stores value, unless an invalidation happened after the lookup that returned token
+        '''
+        with self._lock:
+            if token is not None and token != self._generation:
+                return
+            expires_at = None if self.ttl is None else self.clock() + self.ttl
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, keys):
+        '''
+        drops the given keys
+        '''
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        '''
+        returns the counters of the cache
+        '''
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._data),
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "hit_ratio": self.hits / lookups if lookups else 0.0,
+                    "evictions": self.evictions,
+                    "expirations": self.expirations}
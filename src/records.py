@@ -0,0 +1,34 @@
+'''
+record immutabili per le letture in sola lettura.
+
+a differenza degli oggetti ORM non sono legati alla sessione: niente identity map,
+niente instrumentazione degli attributi, e la memoria viene liberata appena
+il chiamante non li usa più. __slots__ evita il __dict__ per ogni istanza.
+'''
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class IntentRecord():
+    id: int
+    name: str
+    description: str
+
+
+@dataclass(frozen=True, slots=True)
+class EntityRecord():
+    id: int
+    name: str
+    description: str
+
+
+@dataclass(frozen=True, slots=True)
+class RelationPathRecord():
+    '''
+    concept reached walking the relations, see RepositoryLayer.get_intent_replacement
+    '''
+    id: int
+    name: str
+    depth: int
+    confidence: float
+    path: tuple[int, ...]
@@ -0,0 +1,244 @@
+'''
+chiusura transitiva delle relazioni tra intenti / entità, tenuta in memoria.
+
+    - classi di equivalenza: componenti connesse degli archi EQUIVALENT con
+      confidence >= threshold (union-find con compressione dei cammini e unione per
+      dimensione: i membri di ogni classe sono un set mutabile, congelato solo quando
+      viene letto con members)
+    - gerarchia: archi BROADER / NARROWER, letti come in SKOS:
+      (a, b, BROADER) -> b è più generico di a, (a, b, NARROWER) -> b è più specifico di a
+
+"stessa classe?" e "tutti i membri" costano un accesso a dizionario. l'indice viene
+aggiornato arco per arco da define_*_relation(s) / remove_*_relation del RepositoryLayer
+che l'ha creato (vedi RepositoryLayer.get_intent_closure); le operazioni che non
+conoscono gli archi toccati (es. remove_intents) lo segnano da ricaricare.
+'''
+import threading
+
+from tables_definition import RelationType
+
+
+class RelationClosure():
+    def __init__(self, loader, threshold: float = 0.0, refresh=None):
+        '''
+        loader: callable returning the (a, b, relation_type, confidence) edges of the graph
+        threshold: minimum confidence of an EQUIVALENT edge to join two classes
+        refresh: optional callable run before each lookup (it may call invalidate)
+        '''
+        self.loader = loader
+        self.threshold = threshold
+        self.refresh = refresh
+        self._lock = threading.RLock()
+        self._stale = True
+
+    # building
+    def reload(self):
+        '''
+        rebuilds the whole index from loader()
+        '''
+        with self._lock:
+            self._edges = {}            # (min_id, max_id) -> (a, b, relation_type, confidence)
+            self._equivalent = {}       # id -> {id} archi EQUIVALENT sopra soglia
+            self._parents = {}          # id -> {id} più generici
+            self._children = {}         # id -> {id} più specifici
+            self._parent = {}           # id -> id padre nell'union-find (solo classi non singole)
+            self._member_sets = {}      # radice -> set dei membri della classe
+            self._frozen = {}           # radice -> frozenset dei membri, già restituito da members
+            for a, b, relation_type, confidence in self.loader():
+                self._add_edge(a, b, relation_type, confidence)
+            self._stale = False
+
+    def invalidate(self):
+        '''
+        marks the index to be rebuilt at the next lookup
+        '''
+        self._stale = True
+
+    def _ensure_loaded(self):
+        if self._stale:
+            self.reload()
+
+    def _refresh(self):
+        if self.refresh is not None:
+            self.refresh()
+
+    # incremental updates
+    def set_edge(self, a: int, b: int, relation_type: RelationType, confidence: float = 1.0):
+        '''
+        applies a created / updated relation (one relation per unordered pair)
+        '''
+        with self._lock:
+            if self._stale:
+                # verrà ricaricato comunque, l'arco è già nel db
+                return
+            self._remove_edge(a, b)
+            self._add_edge(a, b, relation_type, confidence)
+
+    def remove_edge(self, a: int, b: int):
+        '''
+        applies a removed relation, in any direction
+        '''
+        with self._lock:
+            if not self._stale:
+                self._remove_edge(a, b)
+
+    def _add_edge(self, a, b, relation_type, confidence):
+        if not isinstance(relation_type, RelationType):
+            relation_type = RelationType(relation_type)
+        self._edges[(min(a, b), max(a, b))] = (a, b, relation_type, confidence)
+
+        if relation_type == RelationType.EQUIVALENT:
+            if confidence >= self.threshold:
+                self._equivalent.setdefault(a, set()).add(b)
+                self._equivalent.setdefault(b, set()).add(a)
+                self._union(a, b)
+        elif relation_type == RelationType.BROADER:
+            self._link(child=a, parent=b)
+        elif relation_type == RelationType.NARROWER:
+            self._link(child=b, parent=a)
+
+    def _remove_edge(self, a, b):
+        edge = self._edges.pop((min(a, b), max(a, b)), None)
+        if edge is None:
+            return
+        a, b, relation_type, confidence = edge
+
+        if relation_type == RelationType.EQUIVALENT:
+            if b in self._equivalent.get(a, ()):
+                self._equivalent[a].discard(b)
+                self._equivalent[b].discard(a)
+                self._split(a)
+        elif relation_type == RelationType.BROADER:
+            self._unlink(child=a, parent=b)
+        elif relation_type == RelationType.NARROWER:
+            self._unlink(child=b, parent=a)
+
+    def _find(self, node):
+        '''root of the class of node, compressing the path to it'''
+        root = node
+        while root in self._parent and self._parent[root] != root:
+            root = self._parent[root]
+        while node != root:
+            self._parent[node], node = root, self._parent.get(node, root)
+        return root
+
+    def _union(self, a, b):
+        '''merges the classes of a and b, the smaller set of members into the larger one'''
+        root_a = self._find(a)
+        root_b = self._find(b)
+        if root_a == root_b:
+            return
+        members_a = self._member_sets.get(root_a) or {root_a}
+        members_b = self._member_sets.get(root_b) or {root_b}
+        if len(members_a) < len(members_b):
+            root_a, root_b, members_a, members_b = root_b, root_a, members_b, members_a
+
+        self._parent[root_a] = root_a
+        self._parent[root_b] = root_a
+        members_a |= members_b
+        self._member_sets[root_a] = members_a
+        self._member_sets.pop(root_b, None)
+        self._frozen.pop(root_a, None)
+        self._frozen.pop(root_b, None)
+
+    def _split(self, node):
+        '''recomputes the connected components of the old class of node'''
+        root = self._find(node)
+        old_members = self._member_sets.pop(root, None) or {node}
+        self._frozen.pop(root, None)
+        for member in old_members:
+            self._parent.pop(member, None)
+
+        unvisited = set(old_members)
+        while unvisited:
+            start = unvisited.pop()
+            component = {start}
+            frontier = [start]
+            while frontier:
+                for neighbour in self._equivalent.get(frontier.pop(), ()):
+                    if neighbour in unvisited:
+                        unvisited.discard(neighbour)
+                        component.add(neighbour)
+                        frontier.append(neighbour)
+
+            if len(component) == 1:
+                # classe singola: non serve tenerla nell'indice
+                continue
+            new_root = min(component)
+            for member in component:
+                self._parent[member] = new_root
+            self._member_sets[new_root] = component
+
+    def _link(self, child, parent):
+        self._parents.setdefault(child, set()).add(parent)
+        self._children.setdefault(parent, set()).add(child)
+
+    def _unlink(self, child, parent):
+        self._parents.get(child, set()).discard(parent)
+        self._children.get(parent, set()).discard(child)
+
+    # lookups
+    def class_id(self, concept_id: int):
+        '''
+        representative of the equivalence class of concept_id
+        '''
+        self._refresh()
+        with self._lock:
+            self._ensure_loaded()
+            return self._find(concept_id)
+
+    def same_class(self, id_a: int, id_b: int):
+        """
+        True se i due concetti sono equivalenti, direttamente o tramite una catena.
+
+        Example:
+            closure.same_class(180, 183)
+        """
+        self._refresh()
+        with self._lock:
+            self._ensure_loaded()
+            return self._find(id_a) == self._find(id_b)
+
+    def members(self, concept_id: int):
+        """
+        Restituisce la classe di equivalenza di concept_id (concept_id compreso).
+
+        Returns:
+            frozenset[int]: id dei concetti equivalenti
+        """
+        self._refresh()
+        with self._lock:
+            self._ensure_loaded()
+            root = self._find(concept_id)
+            if root not in self._member_sets:
+                return frozenset((concept_id,))
+            # congelato una volta per versione della classe, non a ogni unione
+            if root not in self._frozen:
+                self._frozen[root] = frozenset(self._member_sets[root])
+            return self._frozen[root]
+
+    def ancestors(self, concept_id: int):
+        '''
+        all the concepts broader than concept_id, through any chain (cycles are ignored)
+        '''
+        return self._walk(concept_id, "_parents")
+
+    def descendants(self, concept_id: int):
+        '''
+        all the concepts narrower than concept_id, through any chain (cycles are ignored)
+        '''
+        return self._walk(concept_id, "_children")
+
+    def _walk(self, concept_id, adjacency_name):
+        self._refresh()
+        with self._lock:
+            self._ensure_loaded()
+            adjacency = getattr(self, adjacency_name)
+            visited = set()
+            frontier = [concept_id]
+            while frontier:
+                for neighbour in adjacency.get(frontier.pop(), ()):
+                    if neighbour not in visited and neighbour != concept_id:
+                        visited.add(neighbour)
+                        frontier.append(neighbour)
+            return frozenset(visited)
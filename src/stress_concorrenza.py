@@ -0,0 +1,98 @@
+'''
+stress test di concorrenza del RepositoryLayer: più thread condividono lo stesso
+repository (una sessione per chiamata) e lo stesso engine (pool di url.py).
+per ogni numero di worker misura il throughput di un carico misto letture / scritture.
+
+    python stress_concorrenza.py                       # SQLite su file temporaneo
+    python stress_concorrenza.py --workers 1 2 4 8 16 --ops 4000
+    python stress_concorrenza.py --mysql               # database di url.py (crea intenti stress_*)
+
+con SQLite le scritture sono serializzate dal lock del file: il throughput cresce
+soprattutto sulle letture. con MySQL cresce finché il pool (pool_size + max_overflow)
+non è saturo.
+'''
+import argparse
+import contextlib
+import importlib
+import io
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from engine_factory import get_engine
+from tables_definition import *
+
+RepositoryLayer = importlib.import_module("3-repository").RepositoryLayer
+
+LEVELS = [level for level in ISA95LevelEnum if level != ISA95LevelEnum.DEFAULT]
+
+
+def run_operation(repository, names, rng, write_ratio):
+    if rng.random() < write_ratio:
+        repository.modify_intent_description(intent_name=rng.choice(names),
+                                             new_description=f"stress {rng.random()}")
+    elif rng.random() < 0.5:
+        repository.get_intent_records_by_isa95_level(rng.choice(LEVELS))
+    else:
+        repository.get_intents_full(rng.sample(names, 10))
+
+
+def run(repository, names, workers, operations, write_ratio):
+    '''
+    runs operations spread over workers threads, returns operations per second
+    '''
+    def worker(worker_id):
+        rng = random.Random(worker_id)
+        for _ in range(operations // workers):
+            run_operation(repository, names, rng, write_ratio)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # result() propaga eventuali errori dei worker (es. pool esaurito)
+        for future in [executor.submit(worker, worker_id) for worker_id in range(workers)]:
+            future.result()
+    return (operations // workers) * workers / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--ops", type=int, default=2000, help="operazioni per ogni numero di worker")
+    parser.add_argument("--concepts", type=int, default=2000)
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    parser.add_argument("--mysql", action="store_true", help="usa il database di url.py")
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        if args.mysql:
+            engine = get_engine()
+        else:
+            # il database temporaneo viene rimosso all'uscita, anche in caso di errore
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+            engine = get_engine(f"sqlite:///{os.path.join(directory, 'stress.db')}")
+        stack.callback(engine.dispose)
+        Base.metadata.create_all(engine)
+
+        repository = RepositoryLayer(engine)
+        names = [f"stress_{i}" for i in range(args.concepts)]
+        rng = random.Random(0)
+
+        # i metodi del repository stampano un messaggio per chiamata
+        with contextlib.redirect_stdout(io.StringIO()):
+            repository._populate_isa95_levels()
+            repository.upsert_intents_with_levels(
+                [[name, "stress intent", [level.value for level in rng.sample(LEVELS, 2)]] for name in names])
+
+            results = {}
+            for workers in args.workers:
+                results[workers] = run(repository, names, workers, args.ops, args.write_ratio)
+
+        print(f"{'workers':>8}{'ops/s':>12}{'speedup':>10}")
+        for workers, throughput in results.items():
+            print(f"{workers:>8}{throughput:>12.1f}{throughput / results[args.workers[0]]:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
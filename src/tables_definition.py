@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, TIMESTAMP, Float, Enum, ForeignKey, PrimaryKeyConstraint, UniqueConstraint
+from sqlalchemy import Column, Integer, String, TIMESTAMP, Float, Enum, ForeignKey, PrimaryKeyConstraint, UniqueConstraint, Computed, Index, and_
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql import func
 import enum
@@ -14,6 +14,38 @@ class ISA95LevelEnum(enum.Enum):
     LEVEL_3 = "MES"
     LEVEL_4 = "ERP"
 
+# Bit di ogni livello nelle maschere di livelli (6 livelli: la maschera sta in un byte)
+ISA95_LEVEL_BITS = {level: 1 << position for position, level in enumerate(ISA95LevelEnum)}
+
+def levels_to_mask(levels):
+    '''bitmask of an iterable of ISA95 levels (ISA95LevelEnum or their names)'''
+    mask = 0
+    for level in levels:
+        mask |= ISA95_LEVEL_BITS[ISA95LevelEnum(level)]
+    return mask
+
+def mask_to_levels(mask: int):
+    '''ISA95LevelEnum members of a bitmask, in enum order'''
+    return [level for level, bit in ISA95_LEVEL_BITS.items() if mask & bit]
+
+def level_mask_filter(model, any_of=(), all_of=(), none_of=()):
+    '''
+    bitwise predicate on model.level_mask (Intent / Entity), e.g. intents at SCADA or MES but not ERP:
+        select(Intent).where(level_mask_filter(Intent, any_of=[LEVEL_2, LEVEL_3], none_of=[LEVEL_4]))
+    rows with a NULL mask never match, see RepositoryLayer.check_level_masks
+    '''
+    predicates = []
+    if any_of:
+        predicates.append(model.level_mask.bitwise_and(levels_to_mask(any_of)) != 0)
+    if all_of:
+        mask = levels_to_mask(all_of)
+        predicates.append(model.level_mask.bitwise_and(mask) == mask)
+    if none_of:
+        predicates.append(model.level_mask.bitwise_and(levels_to_mask(none_of)) == 0)
+    if not predicates:
+        return model.level_mask.is_not(None)
+    return and_(*predicates)
+
 # Enum per le relazioni di matching
 class RelationType(enum.Enum):
     EQUIVALENT = "equivalent"
@@ -41,11 +73,15 @@ class Intent(Base):
     description = Column(String(500))  # Aumentato per più flessibilità
     created_at = Column(TIMESTAMP, server_default=func.now(), nullable=False)
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    # Livelli ISA95 come bitmask (ISA95_LEVEL_BITS), copia denormalizzata dei link
+    # mantenuta dal RepositoryLayer; NULL = non ancora calcolata (vedi check_level_masks)
+    level_mask = Column(Integer, nullable=True)
     
     # Relationships
-    isa95_links = relationship("IntentISA95Link", back_populates="intent", cascade="all, delete-orphan")
-    matches_as_a = relationship("IntentMatch", foreign_keys="IntentMatch.intent_a_id", back_populates="intent_a", cascade="all, delete-orphan")
-    matches_as_b = relationship("IntentMatch", foreign_keys="IntentMatch.intent_b_id", back_populates="intent_b", cascade="all, delete-orphan")
+    # passive_deletes: link e match non caricati vengono eliminati dal ON DELETE CASCADE del db
+    isa95_links = relationship("IntentISA95Link", back_populates="intent", cascade="all, delete-orphan", passive_deletes=True)
+    matches_as_a = relationship("IntentMatch", foreign_keys="IntentMatch.intent_a_id", back_populates="intent_a", cascade="all, delete-orphan", passive_deletes=True)
+    matches_as_b = relationship("IntentMatch", foreign_keys="IntentMatch.intent_b_id", back_populates="intent_b", cascade="all, delete-orphan", passive_deletes=True)
 
 # Tabella Entity
 class Entity(Base):
@@ -56,11 +92,14 @@ class Entity(Base):
     description = Column(String(500))
     created_at = Column(TIMESTAMP, server_default=func.now(), nullable=False)
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    # Livelli ISA95 come bitmask (ISA95_LEVEL_BITS), copia denormalizzata dei link
+    # mantenuta dal RepositoryLayer; NULL = non ancora calcolata (vedi check_level_masks)
+    level_mask = Column(Integer, nullable=True)
     
     # Relationships
-    isa95_links = relationship("EntityISA95Link", back_populates="entity", cascade="all, delete-orphan")
-    matches_as_a = relationship("EntityMatch", foreign_keys="EntityMatch.entity_a_id", back_populates="entity_a", cascade="all, delete-orphan")
-    matches_as_b = relationship("EntityMatch", foreign_keys="EntityMatch.entity_b_id", back_populates="entity_b", cascade="all, delete-orphan")
+    isa95_links = relationship("EntityISA95Link", back_populates="entity", cascade="all, delete-orphan", passive_deletes=True)
+    matches_as_a = relationship("EntityMatch", foreign_keys="EntityMatch.entity_a_id", back_populates="entity_a", cascade="all, delete-orphan", passive_deletes=True)
+    matches_as_b = relationship("EntityMatch", foreign_keys="EntityMatch.entity_b_id", back_populates="entity_b", cascade="all, delete-orphan", passive_deletes=True)
 
 # Tabella di associazione Intent-ISA95 (Many-to-Many)
 class IntentISA95Link(Base):
@@ -105,9 +144,16 @@ class IntentMatch(Base):
     confidence = Column(Float, default=1.0, nullable=False)
     created_at = Column(TIMESTAMP, server_default=func.now(), nullable=False)
     
+    # Coppia canonica (non ordinata), calcolata dal db: la direzione resta in intent_a_id -> intent_b_id
+    # colonne VIRTUAL: MySQL non permette ON DELETE CASCADE sulle colonne base di una colonna STORED
+    min_id = Column(Integer, Computed("CASE WHEN intent_a_id < intent_b_id THEN intent_a_id ELSE intent_b_id END", persisted=False))
+    max_id = Column(Integer, Computed("CASE WHEN intent_a_id < intent_b_id THEN intent_b_id ELSE intent_a_id END", persisted=False))
+    
     # Constraint per evitare duplicati e self-reference
+    # unique_intent_pair: al più una relazione per coppia, in qualunque direzione
     __table_args__ = (
         UniqueConstraint('intent_a_id', 'intent_b_id', name='unique_intent_match'),
+        Index('unique_intent_pair', 'min_id', 'max_id', unique=True),
     )
     
     # Relationships
@@ -125,11 +171,28 @@ class EntityMatch(Base):
     confidence = Column(Float, default=1.0, nullable=False)
     created_at = Column(TIMESTAMP, server_default=func.now(), nullable=False)
     
+    # Coppia canonica (non ordinata), calcolata dal db: la direzione resta in entity_a_id -> entity_b_id
+    # colonne VIRTUAL: MySQL non permette ON DELETE CASCADE sulle colonne base di una colonna STORED
+    min_id = Column(Integer, Computed("CASE WHEN entity_a_id < entity_b_id THEN entity_a_id ELSE entity_b_id END", persisted=False))
+    max_id = Column(Integer, Computed("CASE WHEN entity_a_id < entity_b_id THEN entity_b_id ELSE entity_a_id END", persisted=False))
+    
     # Constraint per evitare duplicati e self-reference
+    # unique_entity_pair: al più una relazione per coppia, in qualunque direzione
     __table_args__ = (
         UniqueConstraint('entity_a_id', 'entity_b_id', name='unique_entity_match'),
+        Index('unique_entity_pair', 'min_id', 'max_id', unique=True),
     )
     
     # Relationships
     entity_a = relationship("Entity", foreign_keys=[entity_a_id], back_populates="matches_as_a")
     entity_b = relationship("Entity", foreign_keys=[entity_b_id], back_populates="matches_as_b")
+
+# Versione dell'ontologia (una sola riga, id = 1)
+# incrementata nella stessa transazione di ogni scrittura del RepositoryLayer:
+# i processi la leggono per capire se le loro cache sono ancora valide
+class OntologyVersion(Base):
+    __tablename__ = "ontology_version"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
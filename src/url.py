@@ -8,3 +8,12 @@ database = "test_db"    # un database che hai creato in phpMyAdmin
 
 # Crea la stringa di connessione
 url = f"mysql+pymysql://{user}:{password}@{host}:{port}/{database}"
+# stessa connessione con il driver asincrono (AsyncRepositoryLayer)
+async_url = f"mysql+aiomysql://{user}:{password}@{host}:{port}/{database}"
+
+# Parametri del pool di connessioni (vedi engine_factory.py)
+pool_size = 10          # connessioni tenute aperte nel pool
+max_overflow = 20       # connessioni aggiuntive concesse nei picchi
+pool_timeout = 30       # secondi di attesa di una connessione libera prima dell'errore
+pool_recycle = 3600     # secondi dopo cui una connessione viene riaperta, < wait_timeout di MySQL
+pool_pre_ping = True    # verifica la connessione prima di usarla (connessioni chiuse dal server)
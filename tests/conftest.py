@@ -0,0 +1,61 @@
+'''
+fixture condivise: ogni test lavora su un database SQLite in memoria nuovo,
+con le foreign key attive come negli engine di engine_factory.
+
+i budget fissi dei metodi del repository (query_budget) sono attivi in modalità "raise"
+in tutti i test: un metodo che supera il suo numero di statement fa fallire la suite.
+'''
+import importlib
+import os
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import StaticPool
+
+# prima di creare i repository: RepositoryLayer legge la modalità in __init__
+os.environ.setdefault("ONTOLOGY_QUERY_BUDGET", "raise")
+
+from engine_factory import _enable_sqlite_foreign_keys
+from tables_definition import *
+
+RepositoryLayer = importlib.import_module("3-repository").RepositoryLayer
+
+
+class StatementCounter():
+    '''
+    records the statements executed on an engine (before_cursor_execute)
+    '''
+    def __init__(self, engine):
+        self.statements = []
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def reset(self):
+        self.statements = []
+
+    def __len__(self):
+        return len(self.statements)
+
+
+@pytest.fixture
+def engine():
+    # get_engine("sqlite://") restituisce un engine condiviso: qui serve un db nuovo per test
+    engine = _enable_sqlite_foreign_keys(create_engine("sqlite://", poolclass=StaticPool,
+                                                       connect_args={"check_same_thread": False}))
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def repository(engine):
+    repository = RepositoryLayer(engine)
+    repository._populate_isa95_levels()
+    return repository
+
+
+@pytest.fixture
+def statements(engine):
+    return StatementCounter(engine)
@@ -0,0 +1,106 @@
+'''
+AsyncRepositoryLayer su aiosqlite: un solo RepositoryLayer sincrono condiviso da tutte
+le chiamate, anche quando le coroutine vengono eseguite in parallelo con asyncio.gather.
+'''
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+
+pytest.importorskip("aiosqlite")
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from async_repository import AsyncRepositoryLayer
+from engine_factory import _enable_sqlite_foreign_keys
+from tables_definition import *
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    # un file: le connessioni di aiosqlite non condividono un database in memoria
+    path = tmp_path / "async.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    return f"sqlite+aiosqlite:///{path}"
+
+
+def run(database_url, scenario):
+    '''runs scenario(repository) on a new AsyncRepositoryLayer and disposes its engine'''
+    async def main():
+        engine = create_async_engine(database_url)
+        _enable_sqlite_foreign_keys(engine.sync_engine)
+        try:
+            repository = AsyncRepositoryLayer(engine)
+            await repository._run("_populate_isa95_levels")
+            return await scenario(repository)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def test_single_sync_repository(database_url):
+    async def scenario(repository):
+        sync_repository = repository.repository
+        await repository.create_intents_with_levels([["a", "a", "MES"]])
+        await repository.get_intent_records_by_isa95_level(ISA95LevelEnum.LEVEL_3)
+        return sync_repository
+
+    sync_repository = run(database_url, scenario)
+
+    assert sync_repository is not None
+    # nessuna sessione rimasta aperta nel contesto del chiamante
+    assert getattr(sync_repository._local, "session", None) is None
+    assert getattr(sync_repository._local, "external_session", None) is None
+
+
+def test_concurrent_reads(database_url):
+    async def scenario(repository):
+        await repository.create_intents_with_levels(
+            [[f"intent_{i}", f"intent {i}", ["MES", "ERP"][i % 2]] for i in range(20)])
+        return await asyncio.gather(
+            *(repository.get_intent_records_by_isa95_level(level)
+              for level in [ISA95LevelEnum.LEVEL_3, ISA95LevelEnum.LEVEL_4] * 5),
+            *(repository.get_intents_full([f"intent_{i}"]) for i in range(20)))
+
+    results = run(database_url, scenario)
+    by_level, full = results[:10], results[10:]
+
+    for index, records in enumerate(by_level):
+        expected = {f"intent_{i}" for i in range(index % 2, 20, 2)}
+        assert {record.name for record in records} == expected
+    # ogni coroutine vede solo il risultato della propria sessione
+    assert [[intent.name for intent in intents] for intents in full] == [[f"intent_{i}"] for i in range(20)]
+
+
+def test_concurrent_writes(database_url):
+    async def scenario(repository):
+        await asyncio.gather(*(repository.create_intents_with_levels([[f"intent_{i}", "intent", "MES"]])
+                               for i in range(10)))
+        await asyncio.gather(*(repository.add_intent_isa_levels(intent_name=f"intent_{i}",
+                                                                levels=[ISA95LevelEnum.LEVEL_4])
+                               for i in range(0, 10, 2)))
+        return await asyncio.gather(repository.get_intent_records_by_isa95_level(ISA95LevelEnum.LEVEL_3),
+                                    repository.get_intent_records_by_isa95_level(ISA95LevelEnum.LEVEL_4))
+
+    mes, erp = run(database_url, scenario)
+
+    assert {record.name for record in mes} == {f"intent_{i}" for i in range(10)}
+    assert {record.name for record in erp} == {f"intent_{i}" for i in range(0, 10, 2)}
+
+
+def test_error_rolls_back_only_its_call(database_url):
+    async def scenario(repository):
+        await repository.create_intents_with_levels([["a", "a", "MES"]])
+        results = await asyncio.gather(repository.modify_intent_description(intent_name="missing",
+                                                                            new_description="x"),
+                                       repository.modify_intent_description(intent_name="a",
+                                                                            new_description="new"),
+                                       return_exceptions=True)
+        return results, await repository.get_intents_full(["a"])
+
+    (failed, _), intents = run(database_url, scenario)
+
+    assert isinstance(failed, ValueError)
+    assert intents[0].description == "new"
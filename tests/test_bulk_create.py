@@ -0,0 +1,55 @@
+'''
+create_*_with_levels(bulk=True): il numero di statement non dipende dal numero di
+concetti né dai loro livelli, solo dal numero di chunk (3 statement per chunk).
+'''
+import pytest
+from sqlalchemy import func, select
+
+from tables_definition import *
+
+LEVELS = list(ISA95LevelEnum)
+
+
+def _intents(count, levels_per_intent, prefix="intent"):
+    return [[f"{prefix}_{i}", "bulk", [LEVELS[(i + k) % len(LEVELS)] for k in range(levels_per_intent)]]
+            for i in range(count)]
+
+
+def _count_bulk_create(repository, statements, concept_list, chunk_size):
+    repository._get_isa95_level_ids()
+    statements.reset()
+    repository.create_intents_with_levels(concept_list, bulk=True, chunk_size=chunk_size)
+    return len(statements)
+
+
+@pytest.mark.parametrize("count, levels_per_intent", [(10, 1), (300, 1), (300, 4)])
+def test_bulk_create_statement_count_is_constant(repository, statements, count, levels_per_intent):
+    baseline = _count_bulk_create(repository, statements, _intents(5, 1, "baseline"), chunk_size=1000)
+
+    assert _count_bulk_create(repository, statements, _intents(count, levels_per_intent), chunk_size=1000) == baseline
+
+
+def test_bulk_create_statement_count_grows_per_chunk(repository, statements):
+    one_chunk = _count_bulk_create(repository, statements, _intents(50, 2, "one"), chunk_size=50)
+    four_chunks = _count_bulk_create(repository, statements, _intents(200, 2, "four"), chunk_size=50)
+
+    assert four_chunks - one_chunk == 3 * 3
+
+
+def test_bulk_create_writes_concepts_links_and_masks(repository, engine):
+    repository.create_intents_with_levels(_intents(120, 3), bulk=True, chunk_size=50)
+    repository.create_entities_with_levels([[f"entity_{i}", "bulk", "MES"] for i in range(30)], bulk=True)
+
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(Intent)) == 120
+        assert connection.scalar(select(func.count()).select_from(IntentISA95Link)) == 360
+        assert connection.scalar(select(func.count()).select_from(EntityISA95Link)) == 30
+    assert repository.check_level_masks() == {"intent": [], "entity": []}
+
+
+def test_bulk_create_unknown_level_inserts_nothing(repository, engine):
+    with pytest.raises(ValueError):
+        repository.create_intents_with_levels([["ok", "ok", "MES"], ["bad", "bad", "NOPE"]], bulk=True)
+
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(Intent)) == 0
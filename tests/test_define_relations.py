@@ -0,0 +1,115 @@
+'''
+define_intents_relations / define_entities_relations: una relazione per coppia non ordinata,
+in qualunque direzione venga salvata, con un numero di statement fisso per chunk.
+'''
+import pytest
+from sqlalchemy import select
+
+from tables_definition import *
+
+
+@pytest.fixture
+def intent_ids(repository):
+    repository.create_intents_with_levels([[f"intent_{i}", f"intent {i}", "MES"] for i in range(6)])
+    return [intent.id for intent in repository.get_intents_full([f"intent_{i}" for i in range(6)])]
+
+
+def stored_matches(engine, match_model=IntentMatch, a_column="intent_a_id", b_column="intent_b_id"):
+    with engine.connect() as connection:
+        return sorted((getattr(row, a_column), getattr(row, b_column), row.relation_type, row.confidence)
+                      for row in connection.execute(select(match_model)))
+
+
+def test_define_relations_inserts(repository, engine, intent_ids):
+    a, b, c = intent_ids[:3]
+
+    report = repository.define_intents_relations([(a, b, RelationType.EQUIVALENT, 0.9),
+                                                  (c, a, RelationType.BROADER)])
+
+    assert report == {"inserted": 2, "updated": 0, "unchanged": 0}
+    assert stored_matches(engine) == sorted([(a, b, RelationType.EQUIVALENT, 0.9),
+                                             (c, a, RelationType.BROADER, 1.0)])
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_define_relations_either_direction(repository, engine, intent_ids, reverse):
+    a, b = intent_ids[:2]
+    repository.define_intents_relations([(a, b, RelationType.BROADER, 0.5)])
+    pair = (b, a) if reverse else (a, b)
+
+    report = repository.define_intents_relations([(*pair, RelationType.NARROWER, 0.7)])
+
+    # la coppia resta una sola, con la direzione e il tipo dell'ultima richiesta
+    assert report == {"inserted": 0, "updated": 1, "unchanged": 0}
+    assert stored_matches(engine) == [(*pair, RelationType.NARROWER, 0.7)]
+
+
+def test_define_relations_matches_single_define(repository, engine, intent_ids):
+    a, b = intent_ids[:2]
+    repository.define_intents_relation(b, a, RelationType.EQUIVALENT, 0.8)
+
+    assert repository.define_intents_relations([(a, b, RelationType.EQUIVALENT, 0.8)])["updated"] == 1
+    assert stored_matches(engine) == [(a, b, RelationType.EQUIVALENT, 0.8)]
+    assert repository.define_intents_relations([(a, b, RelationType.EQUIVALENT, 0.8)]) == \
+        {"inserted": 0, "updated": 0, "unchanged": 1}
+
+
+def test_define_relations_last_pair_wins(repository, engine, intent_ids):
+    a, b = intent_ids[:2]
+
+    report = repository.define_intents_relations([(a, b, RelationType.BROADER, 0.5),
+                                                  (b, a, RelationType.EQUIVALENT, 0.6)])
+
+    assert report == {"inserted": 1, "updated": 0, "unchanged": 0}
+    assert stored_matches(engine) == [(b, a, RelationType.EQUIVALENT, 0.6)]
+
+
+def test_define_relations_invalid_pairs(repository, engine, intent_ids):
+    a, b = intent_ids[:2]
+
+    with pytest.raises(ValueError, match="non trovati"):
+        repository.define_intents_relations([(a, b, RelationType.EQUIVALENT), (a, 10_000, RelationType.EQUIVALENT)])
+    with pytest.raises(ValueError, match="se stesso"):
+        repository.define_intents_relations([(a, a, RelationType.EQUIVALENT)])
+    with pytest.raises(ValueError, match="Confidence"):
+        repository.define_intents_relations([(a, b, RelationType.EQUIVALENT, 1.5)])
+
+    assert stored_matches(engine) == []
+
+
+def test_define_relations_keeps_previous_batches(repository, engine, intent_ids):
+    a, b, c = intent_ids[:3]
+
+    with pytest.raises(ValueError):
+        repository.define_intents_relations([(a, b, RelationType.EQUIVALENT),
+                                             (b, c, RelationType.EQUIVALENT),
+                                             (c, 10_000, RelationType.EQUIVALENT)], batch_size=2)
+
+    assert stored_matches(engine) == sorted([(a, b, RelationType.EQUIVALENT, 1.0),
+                                             (b, c, RelationType.EQUIVALENT, 1.0)])
+
+
+def test_define_relations_statement_count(repository, statements, intent_ids):
+    pairs = [(a, b, RelationType.EQUIVALENT) for i, a in enumerate(intent_ids) for b in intent_ids[i + 1:]]
+    repository.define_intents_relations(pairs[:1])
+    statements.reset()
+
+    # 15 coppie, 5 per chunk: 3 x (SELECT id, SELECT relazioni, upsert) + versione dell'ontologia
+    repository.define_intents_relations(pairs, chunk_size=5)
+    chunk_statements = [statement for statement in statements.statements if "ontology_version" not in statement]
+    assert len(chunk_statements) == 3 * 3
+
+    # nessuna modifica: niente upsert
+    statements.reset()
+    assert repository.define_intents_relations(pairs, chunk_size=5)["unchanged"] == len(pairs)
+    assert len(statements) == 3 * 2
+
+
+def test_define_entities_relations_either_direction(repository, engine):
+    repository.create_entities_with_levels([["a", "a", "MES"], ["b", "b", "ERP"]])
+    a, b = (entity.id for entity in repository.get_entities_full(["a", "b"]))
+    repository.define_entities_relations([(a, b, RelationType.BROADER)])
+
+    assert repository.define_entities_relations([(b, a, RelationType.BROADER)])["updated"] == 1
+    assert stored_matches(engine, EntityMatch, "entity_a_id", "entity_b_id") == \
+        [(b, a, RelationType.BROADER, 1.0)]
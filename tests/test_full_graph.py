@@ -0,0 +1,96 @@
+'''
+get_*_full: il numero di query è fisso, qualunque sia il numero di concetti, link e match.
+'''
+import pytest
+
+from tables_definition import *
+
+LEVELS = list(ISA95LevelEnum)
+
+
+@pytest.fixture
+def intent_names(repository):
+    names = [f"intent_{i}" for i in range(40)]
+    repository.create_intents_with_levels([[name, name, LEVELS[i % len(LEVELS):i % len(LEVELS) + 2]]
+                                           for i, name in enumerate(names)], bulk=True)
+    ids = {intent.name: intent.id for intent in repository.get_intents_full(names)}
+    repository.define_intents_relations((ids[names[i]], ids[names[j]], RelationType.EQUIVALENT, 0.9)
+                                        for i in range(len(names)) for j in range(i + 1, min(i + 4, len(names))))
+    return names
+
+
+@pytest.fixture
+def entity_names(repository):
+    names = [f"entity_{i}" for i in range(40)]
+    repository.create_entities_with_levels([[name, name, LEVELS[i % len(LEVELS)].value]
+                                            for i, name in enumerate(names)], bulk=True)
+    ids = {entity.name: entity.id for entity in repository.get_entities_full(names)}
+    repository.define_entities_relations((ids[names[i]], ids[names[i + 1]], RelationType.BROADER)
+                                         for i in range(len(names) - 1))
+    return names
+
+
+def _touch_graph(concepts, other_a, other_b):
+    # legge tutto il grafo caricato: un lazy load qui sarebbe una query in più
+    for concept in concepts:
+        [link.isa95_level.name for link in concept.isa95_links]
+        [getattr(match, other_b).name for match in concept.matches_as_a]
+        [getattr(match, other_a).name for match in concept.matches_as_b]
+
+
+@pytest.mark.parametrize("batch_size", [1, 5, 40])
+def test_get_intents_full_statement_count(repository, statements, intent_names, batch_size):
+    statements.reset()
+    intents = repository.get_intents_full(intent_names[:batch_size])
+    _touch_graph(intents, "intent_a", "intent_b")
+
+    assert len(intents) == batch_size
+    assert len(statements) == 4
+
+
+@pytest.mark.parametrize("batch_size", [1, 5, 40])
+def test_get_entities_full_statement_count(repository, statements, entity_names, batch_size):
+    statements.reset()
+    entities = repository.get_entities_full(entity_names[:batch_size])
+    _touch_graph(entities, "entity_a", "entity_b")
+
+    assert len(entities) == batch_size
+    assert len(statements) == 4
+
+
+def test_get_intent_full_statement_count(repository, statements, intent_names):
+    statements.reset()
+    intent = repository.get_intent_full(intent_name=intent_names[10])
+    _touch_graph([intent], "intent_a", "intent_b")
+
+    assert {match.intent_b.name for match in intent.matches_as_a} == set(intent_names[11:14])
+    assert len(statements) == 4
+
+
+def test_get_entity_full_by_id_statement_count(repository, statements, entity_names):
+    entity_id = repository.get_entities_full([entity_names[5]])[0].id
+    statements.reset()
+    entity = repository.get_entity_full(entity_id=entity_id)
+    _touch_graph([entity], "entity_a", "entity_b")
+
+    assert entity.name == entity_names[5]
+    assert {match.entity_b.name for match in entity.matches_as_a} == {entity_names[6]}
+    assert {match.entity_a.name for match in entity.matches_as_b} == {entity_names[4]}
+    assert len(statements) == 4
+
+
+def test_get_full_statement_count_per_chunk(repository, statements, intent_names):
+    # 4 statement per chunk di BULK_CHUNK_SIZE nomi
+    repository.BULK_CHUNK_SIZE = 10
+    statements.reset()
+    intents = repository.get_intents_full(intent_names)
+    _touch_graph(intents, "intent_a", "intent_b")
+
+    assert [intent.name for intent in intents] == intent_names
+    assert len(statements) == 4 * 4
+
+
+def test_get_full_missing_concept(repository):
+    assert repository.get_intents_full(["missing"]) == []
+    with pytest.raises(ValueError, match="non trovato"):
+        repository.get_intent_full(intent_name="missing")
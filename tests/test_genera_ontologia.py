@@ -0,0 +1,45 @@
+'''
+genera_ontologia: archi unici per coppia non ordinata, catene DEPRECATED e cicli,
+output deterministico per seed.
+'''
+import filecmp
+import importlib
+
+import pytest
+
+from genera_ontologia import define_relations_from_edges, entity_name, generate_edges, intent_name, write_ontology
+from tables_definition import *
+
+RepositoryLayer = importlib.import_module("3-repository").RepositoryLayer
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("name_of", [intent_name, entity_name])
+def test_edges_are_unique_unordered_pairs(seed, name_of):
+    pairs = [frozenset((a, b)) for a, b, _, _ in generate_edges(5000, name_of, seed=seed)]
+
+    assert all(len(pair) == 2 for pair in pairs)
+    assert len(set(pairs)) == len(pairs)
+
+
+def test_deprecated_chains_and_cycles(engine, tmp_path):
+    report = write_ontology(tmp_path, intents=2000, entities=10, seed=1, cycle_fraction=0.5)
+    repository = RepositoryLayer(engine, intents_source=report["intents"][0], entities_source=report["entities"][0])
+    repository.populate_default_db_configuration()
+
+    result = define_relations_from_edges(repository, report["intent_matches"][0], "intent")
+    generated = sum(report["intent_matches"][1].values())
+
+    # ogni arco generato diventa una riga: nessuna coppia ripetuta si perde nel db
+    assert result == {"inserted": generated, "updated": 0, "unchanged": 0}
+    resolver = repository.get_intent_deprecation_resolver()
+    resolver.redirect_map()
+    assert resolver.cycles and all(len(cycle) >= 3 for cycle in resolver.cycles)
+
+
+def test_output_is_deterministic(tmp_path):
+    first = write_ontology(tmp_path / "first", intents=500, entities=300, seed=7, compress=True)
+    second = write_ontology(tmp_path / "second", intents=500, entities=300, seed=7, compress=True)
+
+    for kind in first:
+        assert filecmp.cmp(first[kind][0], second[kind][0], shallow=False)
@@ -0,0 +1,72 @@
+'''
+livelli ISA95 passati come ISA95LevelEnum o come nomi, e cache degli id dei livelli per engine.
+'''
+import importlib
+
+import pytest
+
+from tables_definition import *
+
+repository_module = importlib.import_module("3-repository")
+
+
+def _levels(repository, concept, name):
+    if concept == "intent":
+        return {link.isa95_level.name for link in repository.get_intent_full(intent_name=name).isa95_links}
+    return {link.isa95_level.name for link in repository.get_entity_full(entity_name=name).isa95_links}
+
+
+@pytest.fixture(params=["intent", "entity"])
+def concept(request, repository):
+    if request.param == "intent":
+        repository.create_intents_with_levels([["a", "a", "MES"]])
+    else:
+        repository.create_entities_with_levels([["a", "a", "MES"]])
+    return request.param
+
+
+def _call(repository, concept, operation, levels):
+    method = getattr(repository, f"{operation}_{concept}_isa_levels")
+    return method(**{f"{concept}_name": "a", "levels": levels})
+
+
+@pytest.mark.parametrize("levels", [["MES", "ERP"], [ISA95LevelEnum.LEVEL_3, ISA95LevelEnum.LEVEL_4]])
+def test_add_duplicate_level_is_skipped(repository, concept, levels, capsys):
+    _call(repository, concept, "add", levels)
+
+    assert _levels(repository, concept, "a") == {"MES", "ERP"}
+    assert "Livelli già associati (skip): MES" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("levels", [["NOPE"], ["ERP", "NOPE"]])
+def test_add_unknown_level_raises(repository, concept, levels):
+    with pytest.raises(ValueError, match="Livello ISA95 'NOPE' non trovato"):
+        _call(repository, concept, "add", levels)
+
+    assert _levels(repository, concept, "a") == {"MES"}
+
+
+def test_remove_unknown_level_is_reported(repository, concept, capsys):
+    _call(repository, concept, "remove", ["NOPE", "MES"])
+
+    assert _levels(repository, concept, "a") == set()
+    assert "Livelli non trovati nel DB: NOPE" in capsys.readouterr().out
+
+
+def test_replace_with_level_names(repository, concept, capsys):
+    _call(repository, concept, "replace", ["PLC", "SCADA"])
+
+    assert _levels(repository, concept, "a") == {"PLC", "SCADA"}
+    assert "PLC, SCADA" in capsys.readouterr().out
+
+
+def test_level_ids_are_loaded_once_per_engine(engine, repository, statements):
+    repository_module._isa95_level_ids.pop(engine, None)
+    statements.reset()
+    repository._get_isa95_level_ids()
+    other = repository_module.RepositoryLayer(engine)
+    other._get_isa95_level_ids()
+    other._get_isa95_level_id("MES")
+
+    assert sum("FROM isa95_level" in statement for statement in statements.statements) == 1
+    assert other._get_isa95_level_id("NOPE") is None
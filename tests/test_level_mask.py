@@ -0,0 +1,110 @@
+'''
+level_mask: copia denormalizzata dei link ISA95, coerente dopo ogni scrittura;
+check_level_masks trova (e ripara) le maschere corrotte, anche dopo migrazione_level_mask.py.
+'''
+import importlib
+import sys
+
+import pytest
+from sqlalchemy import create_engine, inspect, select, update
+
+import migrazione_level_mask
+from tables_definition import *
+
+RepositoryLayer = importlib.import_module("3-repository").RepositoryLayer
+
+
+def masks(engine, model=Intent):
+    with engine.connect() as connection:
+        return {name: level_mask for name, level_mask in connection.execute(select(model.name, model.level_mask))}
+
+
+def mask(*levels):
+    return levels_to_mask(list(levels))
+
+
+@pytest.fixture
+def concepts(repository):
+    repository.create_intents_with_levels([["a", "a", ["MES", "ERP"]], ["b", "b", "PLC"]])
+    repository.create_entities_with_levels([["x", "x", "SCADA"]], bulk=True)
+
+
+def test_create(engine, concepts):
+    assert masks(engine) == {"a": mask("MES", "ERP"), "b": mask("PLC")}
+    assert masks(engine, Entity) == {"x": mask("SCADA")}
+
+
+@pytest.mark.parametrize("write, expected", [
+    (lambda repository: repository.add_intent_isa_levels(intent_name="b", levels=["MES"]),
+     {"a": mask("MES", "ERP"), "b": mask("PLC", "MES")}),
+    (lambda repository: repository.remove_intent_isa_levels(intent_name="a", levels=["ERP"]),
+     {"a": mask("MES"), "b": mask("PLC")}),
+    (lambda repository: repository.replace_intent_isa_levels(intent_name="a", levels=["DEFAULT"]),
+     {"a": mask("DEFAULT"), "b": mask("PLC")}),
+    (lambda repository: repository.replace_intents_isa_levels({"a": ["PLC"], "b": ["ERP", "SCADA"]}),
+     {"a": mask("PLC"), "b": mask("ERP", "SCADA")}),
+    (lambda repository: repository.upsert_intents_with_levels([["a", "a", ["ERP"]], ["c", "c", ["MES"]]]),
+     {"a": mask("ERP"), "b": mask("PLC"), "c": mask("MES")}),
+    (lambda repository: repository.create_intents_with_levels([["c", "c", ["MES", "PLC"]]], bulk=True),
+     {"a": mask("MES", "ERP"), "b": mask("PLC"), "c": mask("MES", "PLC")}),
+], ids=["add", "remove", "replace", "replace_batch", "upsert", "create_bulk"])
+def test_level_mask_follows_the_links(repository, engine, concepts, write, expected):
+    write(repository)
+
+    assert masks(engine) == expected
+    assert repository.check_level_masks() == {"intent": [], "entity": []}
+
+
+def test_entity_level_mask(repository, engine, concepts):
+    repository.add_entity_isa_levels(entity_name="x", levels=["MES"])
+    repository.remove_entity_isa_levels(entity_name="x", levels=["SCADA"])
+    assert masks(engine, Entity) == {"x": mask("MES")}
+
+    repository.replace_entity_isa_levels(entity_name="x", levels=["ERP", "PLC"])
+    assert masks(engine, Entity) == {"x": mask("ERP", "PLC")}
+    assert repository.check_level_masks() == {"intent": [], "entity": []}
+
+
+def test_check_level_masks_reports_corrupted_masks(repository, engine, concepts):
+    ids = {intent.name: intent.id for intent in repository.get_intents_full(["a", "b"])}
+    with engine.begin() as connection:
+        connection.execute(update(Intent).where(Intent.name == "a").values(level_mask=mask("PLC")))
+        connection.execute(update(Intent).where(Intent.name == "b").values(level_mask=None))
+
+    assert repository.check_level_masks() == {"intent": [ids["a"], ids["b"]], "entity": []}
+    # senza repair non cambia nulla
+    assert masks(engine)["a"] == mask("PLC")
+
+    assert repository.check_level_masks(repair=True) == {"intent": [ids["a"], ids["b"]], "entity": []}
+    assert masks(engine) == {"a": mask("MES", "ERP"), "b": mask("PLC")}
+    assert repository.check_level_masks() == {"intent": [], "entity": []}
+
+
+def test_migration_of_an_old_database(tmp_path, monkeypatch):
+    database_url = f"sqlite:///{tmp_path / 'old.db'}"
+    engine = create_engine(database_url)
+    Base.metadata.create_all(engine)
+    repository = RepositoryLayer(engine)
+    repository._populate_isa95_levels()
+    repository.create_intents_with_levels([["a", "a", ["MES", "ERP"]]])
+    repository.create_entities_with_levels([["x", "x", "SCADA"]])
+    # schema precedente: senza level_mask né ontology_version
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP TABLE ontology_version")
+        connection.exec_driver_sql("ALTER TABLE intent DROP COLUMN level_mask")
+        connection.exec_driver_sql("ALTER TABLE entity DROP COLUMN level_mask")
+    engine.dispose()
+
+    monkeypatch.setattr(sys, "argv", ["migrazione_level_mask.py", database_url])
+    migrazione_level_mask.main()
+    # idempotente
+    migrazione_level_mask.main()
+
+    engine = create_engine(database_url)
+    try:
+        assert "ontology_version" in inspect(engine).get_table_names()
+        assert masks(engine) == {"a": mask("MES", "ERP")}
+        assert masks(engine, Entity) == {"x": mask("SCADA")}
+        assert RepositoryLayer(engine).check_level_masks() == {"intent": [], "entity": []}
+    finally:
+        engine.dispose()
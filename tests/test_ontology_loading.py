@@ -0,0 +1,100 @@
+'''
+caricamento delle ontologie: lettura incrementale, file compressi, JSON Lines e shard.
+'''
+import gzip
+import importlib
+import io
+import json
+import os
+
+import pytest
+from sqlalchemy import create_engine, func, select
+
+from engine_factory import _enable_sqlite_foreign_keys
+from ontology_loader import batched, iter_json_section, iter_ontology_source, list_shards
+from tables_definition import *
+
+RepositoryLayer = importlib.import_module("3-repository").RepositoryLayer
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+INTENTS = {f"intent_{i}": {"description": f"intent \"{i}\" \\ {{x}}", "function": "query",
+                           "domain": "MES", "tags": [1, {"nested": [True, None, 1.5e3]}]}
+           for i in range(25)}
+
+
+def test_iter_json_section_matches_json_load():
+    text = json.dumps({"meta": {"skip": [1, 2, {"a": "}"}]}, "intents": INTENTS, "entities": {}}, indent=2)
+
+    assert list(iter_json_section(io.StringIO(text), "intents")) == list(INTENTS.items())
+
+
+@pytest.mark.parametrize("file_name", ["intents.json", "intents.json.gz", "intents.jsonl", "intents.jsonl.gz"])
+def test_sources_by_extension(tmp_path, file_name):
+    if ".jsonl" in file_name:
+        text = "\n".join(json.dumps({"name": name, **data}) for name, data in INTENTS.items()) + "\n\n"
+    else:
+        text = json.dumps({"intents": INTENTS})
+    path = tmp_path / file_name
+    if file_name.endswith(".gz"):
+        with gzip.open(path, "wt", encoding="utf-8") as file:
+            file.write(text)
+    else:
+        path.write_text(text, encoding="utf-8")
+
+    assert list(iter_ontology_source(str(path), "intents")) == list(INTENTS.items())
+
+
+def test_batched():
+    assert [len(batch) for batch in batched(range(2500), 1000)] == [1000, 1000, 500]
+
+
+def _write_shards(directory, count, per_shard):
+    directory.mkdir()
+    for shard in range(count):
+        concepts = {f"intent_{shard}_{i}": {"description": "d", "domain": "SCADA"} for i in range(per_shard)}
+        with gzip.open(directory / f"intents_{shard:02d}.json.gz", "wt", encoding="utf-8") as file:
+            json.dump({"intents": concepts}, file)
+    (directory / "README.txt").write_text("not a shard")
+    return str(directory)
+
+
+@pytest.mark.parametrize("stream, workers, batch_size", [(False, 1, None), (True, 1, 7), (True, 3, 7)])
+def test_sharded_load(tmp_path, stream, workers, batch_size):
+    # db su file: i worker usano connessioni diverse
+    engine = _enable_sqlite_foreign_keys(create_engine(f"sqlite:///{tmp_path / 'ontology.db'}",
+                                                       connect_args={"check_same_thread": False}))
+    Base.metadata.create_all(engine)
+    source = _write_shards(tmp_path / "intents", count=4, per_shard=30)
+    assert len(list_shards(source)) == 4
+
+    report = RepositoryLayer(engine).populate_db_from_sources(source, None, stream=stream,
+                                                              batch_size=batch_size, workers=workers)
+
+    assert report == {"intents": {"inserted": 120, "updated": 0, "unchanged": 0}}
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(Intent)) == 120
+        assert connection.scalar(select(func.count()).select_from(IntentISA95Link)) == 120
+    engine.dispose()
+
+
+def test_empty_shard_directory_is_an_error(tmp_path):
+    with pytest.raises(ValueError, match="Nessun file di ontologia"):
+        list_shards(str(tmp_path))
+
+
+def test_default_ontology_dir_is_inside_the_repository():
+    import ontology_loader
+
+    if "ONTOLOGY_DIR" not in os.environ:
+        assert ontology_loader.DEFAULT_ONTOLOGY_DIR == os.path.join(REPOSITORY_ROOT, "config", "ontology")
+
+
+def test_missing_default_ontology_is_a_clear_error(engine, tmp_path, monkeypatch):
+    import ontology_loader
+
+    monkeypatch.setattr(ontology_loader, "DEFAULT_ONTOLOGY_DIR", str(tmp_path / "missing"))
+    repository = RepositoryLayer(engine)
+
+    with pytest.raises(ValueError, match="non trovata: impostare la variabile d'ambiente ONTOLOGY_DIR"):
+        repository.populate_default_db_configuration()
@@ -0,0 +1,111 @@
+'''
+ontology_version: ogni scrittura la incrementa, e un altro processo (qui un secondo
+RepositoryLayer sullo stesso db) svuota le proprie cache quando la vede cambiare.
+'''
+import importlib
+
+import pytest
+from sqlalchemy import select
+
+from read_cache import LRUTTLCache
+from tables_definition import *
+
+RepositoryLayer = importlib.import_module("3-repository").RepositoryLayer
+
+
+@pytest.fixture
+def writer(engine, repository):
+    repository.create_intents_with_levels([["a", "a", "MES"], ["b", "b", "MES"]])
+    return repository
+
+
+@pytest.fixture
+def make_reader(engine, writer):
+    def make_reader(poll_interval):
+        reader = RepositoryLayer(engine, cache=LRUTTLCache(ttl=None))
+        reader.VERSION_POLL_INTERVAL = poll_interval
+        reader.check_ontology_version(force=True)
+        return reader
+    return make_reader
+
+
+@pytest.fixture
+def reader(make_reader):
+    return make_reader(3600)
+
+
+def version(engine):
+    with engine.connect() as connection:
+        return connection.scalar(select(OntologyVersion.version).where(OntologyVersion.id == 1))
+
+
+def mes_names(repository):
+    return sorted(record.name for record in repository.get_intent_records_by_isa95_level(ISA95LevelEnum.LEVEL_3))
+
+
+def test_writes_bump_the_version(engine, writer):
+    start = version(engine)
+
+    writer.add_intent_isa_levels(intent_name="a", levels=[ISA95LevelEnum.LEVEL_4])
+    assert version(engine) == start + 1
+    writer.modify_intent_description(intent_name="b", new_description="new")
+    assert version(engine) == start + 2
+
+    # nessuna modifica, nessun incremento
+    writer.add_intent_isa_levels(intent_name="a", levels=[ISA95LevelEnum.LEVEL_4])
+    writer.upsert_intents_with_levels([["a", "a", ["MES", "ERP"]]])
+    with pytest.raises(ValueError):
+        writer.modify_intent_description(intent_name="missing", new_description="new")
+    assert version(engine) == start + 2
+
+
+def test_other_process_write_clears_the_cache(engine, writer, reader, statements):
+    assert mes_names(reader) == ["a", "b"]
+
+    writer.remove_intent_isa_levels(intent_name="a", levels=[ISA95LevelEnum.LEVEL_3])
+
+    # entro VERSION_POLL_INTERVAL la cache non rilegge la versione
+    statements.reset()
+    assert mes_names(reader) == ["a", "b"]
+    assert reader.check_ontology_version() is False
+    assert len(statements) == 0
+
+    assert reader.check_ontology_version(force=True) is True
+    assert mes_names(reader) == ["b"]
+    assert reader.check_ontology_version(force=True) is False
+
+
+def test_cached_reads_poll_the_version(writer, make_reader):
+    reader = make_reader(0)
+    assert mes_names(reader) == ["a", "b"]
+
+    writer.create_intents_with_levels([["c", "c", "MES"]])
+
+    assert mes_names(reader) == ["a", "b", "c"]
+
+
+def test_own_writes_keep_the_caches(reader, statements):
+    assert mes_names(reader) == ["a", "b"]
+    reader.create_intents_with_levels([["c", "c", "ERP"]])
+
+    # la scrittura di questo processo invalida solo i livelli toccati
+    assert reader.check_ontology_version(force=True) is False
+    statements.reset()
+    assert mes_names(reader) == ["a", "b"]
+    assert len(statements) == 0
+
+
+@pytest.mark.parametrize("poll_interval", [0, 3600])
+def test_other_process_write_reloads_the_closures(writer, make_reader, poll_interval):
+    reader = make_reader(poll_interval)
+    ids = {intent.name: intent.id for intent in writer.get_intents_full(["a", "b"])}
+    closure = reader.get_intent_closure()
+    assert not closure.same_class(ids["a"], ids["b"])
+
+    writer.define_intents_relation(ids["a"], ids["b"], RelationType.EQUIVALENT)
+    if poll_interval:
+        # la closure interroga la versione solo allo scadere dell'intervallo
+        assert not closure.same_class(ids["a"], ids["b"])
+        reader.check_ontology_version(force=True)
+
+    assert closure.same_class(ids["a"], ids["b"])
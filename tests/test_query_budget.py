@@ -0,0 +1,104 @@
+'''
+budget di statement: i metodi con un budget fisso lo rispettano (cache dei livelli fredda,
+con e senza read cache) e un blocco che lo supera fallisce o viene segnalato.
+'''
+import importlib
+import logging
+
+import pytest
+
+from query_budget import QueryBudget, QueryBudgetExceeded
+from read_cache import LRUTTLCache
+from tables_definition import *
+
+repository_module = importlib.import_module("3-repository")
+
+LEVELS = list(ISA95LevelEnum)
+
+
+@pytest.fixture(params=[None, "lru"], ids=["no-cache", "lru-cache"])
+def budget_repository(engine, request):
+    cache = LRUTTLCache() if request.param == "lru" else None
+    repository = repository_module.RepositoryLayer(engine, cache=cache)
+    repository._populate_isa95_levels()
+    repository.create_intents_with_levels([[f"intent_{i}", "intent", LEVELS[i:i + 2]] for i in range(4)])
+    repository.create_entities_with_levels([[f"entity_{i}", "entity", LEVELS[i].value] for i in range(4)])
+    # cache degli id dei livelli fredda: i budget comprendono la sua lettura
+    repository_module._isa95_level_ids.pop(engine, None)
+    return repository
+
+
+def _ids(repository, concept):
+    if concept == "intent":
+        return [intent.id for intent in repository.get_intents_full([f"intent_{i}" for i in range(4)])]
+    return [entity.id for entity in repository.get_entities_full([f"entity_{i}" for i in range(4)])]
+
+
+PINNED_CALLS = {
+    "replace_intent_isa_levels": lambda r, ids: r.replace_intent_isa_levels(intent_id=ids[0], levels=LEVELS[3:5]),
+    "add_intent_isa_levels": lambda r, ids: r.add_intent_isa_levels(intent_name="intent_1", levels=[LEVELS[5]]),
+    "remove_intent_isa_levels": lambda r, ids: r.remove_intent_isa_levels(intent_id=ids[1], levels=[LEVELS[1]]),
+    "modify_intent_description": lambda r, ids: r.modify_intent_description(intent_id=ids[2], new_description="x"),
+    "define_intents_relation": lambda r, ids: r.define_intents_relation(ids[0], ids[1], RelationType.EQUIVALENT),
+    "get_intents_by_isa95_level": lambda r, ids: r.get_intents_by_isa95_level(LEVELS[1]),
+    "get_intent_records_by_isa95_level": lambda r, ids: r.get_intent_records_by_isa95_level(LEVELS[1]),
+    "replace_entity_isa_levels": lambda r, ids: r.replace_entity_isa_levels(entity_id=ids[0], levels=LEVELS[3:5]),
+    "add_entity_isa_levels": lambda r, ids: r.add_entity_isa_levels(entity_name="entity_1", levels=[LEVELS[5]]),
+    "remove_entity_isa_levels": lambda r, ids: r.remove_entity_isa_levels(entity_id=ids[1], levels=[LEVELS[1]]),
+    "modify_entity_description": lambda r, ids: r.modify_entity_description(entity_id=ids[2], new_description="x"),
+    "define_entities_relation": lambda r, ids: r.define_entities_relation(ids[0], ids[1], RelationType.BROADER),
+    "get_entities_by_isa95_level": lambda r, ids: r.get_entities_by_isa95_level(LEVELS[1]),
+    "get_entity_records_by_isa95_level": lambda r, ids: r.get_entity_records_by_isa95_level(LEVELS[1]),
+}
+
+
+def test_budgets_are_enforced_in_the_suite(budget_repository):
+    assert budget_repository.query_budget_mode == "raise"
+
+
+@pytest.mark.parametrize("method_name", PINNED_CALLS)
+def test_pinned_method_within_budget(budget_repository, method_name):
+    concept = "entity" if "entit" in method_name else "intent"
+    ids = _ids(budget_repository, concept)
+    repository_module._isa95_level_ids.pop(budget_repository.engine, None)
+
+    PINNED_CALLS[method_name](budget_repository, ids)
+
+
+@pytest.mark.parametrize("concept", ["intent", "entity"])
+def test_remove_relation_within_budget(budget_repository, concept):
+    ids = _ids(budget_repository, concept)
+    if concept == "intent":
+        budget_repository.define_intents_relation(ids[0], ids[1], RelationType.EQUIVALENT)
+        budget_repository.get_intent_closure()
+        assert budget_repository.remove_intents_relation(id_intent_a=ids[0], id_intent_b=ids[1]) == 1
+    else:
+        budget_repository.define_entities_relation(ids[0], ids[1], RelationType.EQUIVALENT)
+        budget_repository.get_entity_closure()
+        assert budget_repository.remove_entities_relation(id_entity_a=ids[0], id_entity_b=ids[1]) == 1
+
+
+def test_exceeded_budget_raises(repository):
+    with pytest.raises(QueryBudgetExceeded) as error:
+        with repository.query_budget(max_statements=1, mode="raise"):
+            repository.get_intents_full(["missing"])
+            repository.get_entities_full(["missing"])
+    assert len(error.value.statements) == 2
+
+
+def test_exceeded_budget_logs(repository, caplog):
+    with caplog.at_level(logging.WARNING, logger="query_budget"):
+        with repository.query_budget(max_statements=1, mode="log", label="two reads"):
+            repository.get_intents_full(["missing"])
+            repository.get_entities_full(["missing"])
+    assert "Query budget superato per two reads" in caplog.text
+
+
+def test_budget_decorator(engine, repository):
+    @QueryBudget(engine, max_statements=1)
+    def two_reads():
+        repository.get_intents_full(["missing"])
+        repository.get_entities_full(["missing"])
+
+    with pytest.raises(QueryBudgetExceeded):
+        two_reads()
@@ -0,0 +1,65 @@
+'''
+QueryMetrics: statement e righe modificate per metodo del repository; le SELECT
+non contano righe (il loro rowcount non è il numero di righe lette).
+'''
+import importlib
+
+import pytest
+
+from query_metrics import QueryMetrics, OTHER
+from tables_definition import *
+
+RepositoryLayer = importlib.import_module("3-repository").RepositoryLayer
+
+
+@pytest.fixture
+def metrics():
+    return QueryMetrics()
+
+
+@pytest.fixture
+def measured(engine, repository, metrics):
+    measured = RepositoryLayer(engine, metrics=metrics)
+    measured.create_intents_with_levels([["a", "a", ["MES", "ERP"]], ["b", "b", "MES"]], bulk=True)
+    return measured
+
+
+def test_affected_rows_of_the_writes(metrics, measured):
+    created = metrics.snapshot()["create_intents_with_levels"]
+
+    # 2 intent + 3 link + ontology_version
+    assert created["calls"] == 1
+    assert created["affected_rows"] == 6
+
+    measured.remove_intent_isa_levels(intent_name="a", levels=["ERP"])
+    # il link eliminato, la level_mask dell'intent e ontology_version
+    assert metrics.snapshot()["remove_intent_isa_levels"]["affected_rows"] == 3
+
+
+def test_reads_have_no_affected_rows(metrics, measured):
+    metrics.reset()
+
+    assert len(measured.get_intent_records_by_isa95_level(ISA95LevelEnum.LEVEL_3)) == 2
+    assert len(measured.get_intents_full(["a", "b"])) == 2
+
+    snapshot = metrics.snapshot()
+    for method_name in ("get_intent_records_by_isa95_level", "get_intents_full"):
+        assert snapshot[method_name]["statements"] > 0
+        assert snapshot[method_name]["affected_rows"] == 0
+
+
+def test_statements_outside_the_repository(engine, metrics, measured):
+    metrics.reset()
+    with engine.begin() as connection:
+        connection.execute(Intent.__table__.update().values(description="x"))
+
+    assert metrics.snapshot()[OTHER]["statements"] == 1
+    assert metrics.snapshot()[OTHER]["affected_rows"] == 2
+
+
+def test_prometheus_text(metrics, measured):
+    text = metrics.prometheus_text()
+
+    assert "# TYPE ontology_repository_affected_rows_total counter" in text
+    assert 'ontology_repository_affected_rows_total{method="create_intents_with_levels"} 6' in text
+    assert "rows_total{" not in text.replace("affected_rows_total{", "")
@@ -0,0 +1,102 @@
+'''
+cache delle letture per livello ISA95: dopo ogni scrittura le letture in cache coincidono
+con quelle senza cache (anche level_mask e updated_at dei livelli non modificati),
+e ogni chiamata riceve oggetti propri.
+'''
+import importlib
+
+import pytest
+from sqlalchemy import update
+
+from read_cache import LRUTTLCache
+from tables_definition import *
+
+RepositoryLayer = importlib.import_module("3-repository").RepositoryLayer
+
+READERS = ["get_intents_by_isa95_level", "get_intent_records_by_isa95_level",
+           "get_entities_by_isa95_level", "get_entity_records_by_isa95_level"]
+
+
+@pytest.fixture
+def cached(engine, repository):
+    return RepositoryLayer(engine, cache=LRUTTLCache(maxsize=64, ttl=None))
+
+
+def snapshot(repository):
+    '''every level read, as comparable tuples'''
+    return {(reader, level): sorted(tuple(getattr(row, column, None)
+                                          for column in ("id", "name", "description", "level_mask", "updated_at"))
+                                    for row in getattr(repository, reader)(level))
+            for reader in READERS for level in ISA95LevelEnum}
+
+
+@pytest.fixture
+def check(repository, cached):
+    '''warms the cache, then compares it with the uncached repository'''
+    def check():
+        assert snapshot(cached) == snapshot(repository)
+    return check
+
+
+@pytest.fixture
+def concepts(cached, check):
+    cached.create_intents_with_levels([["a", "a", ["MES", "ERP"]], ["b", "b", "MES"]])
+    cached.create_entities_with_levels([["x", "x", ["PLC", "SCADA"]]])
+    check()
+
+
+@pytest.mark.parametrize("write", [
+    lambda repository: repository.add_intent_isa_levels(intent_name="a", levels=[ISA95LevelEnum.LEVEL_2]),
+    lambda repository: repository.remove_intent_isa_levels(intent_name="a", levels=["ERP"]),
+    lambda repository: repository.replace_intent_isa_levels(intent_name="a", levels=["MES", "PLC"]),
+    lambda repository: repository.replace_intents_isa_levels({"a": ["ERP"], "b": ["MES", "SCADA"]}),
+    lambda repository: repository.upsert_intents_with_levels([["a", "new", ["MES", "ERP"]],
+                                                              ["b", "b", ["MES", "PLC"]]]),
+    lambda repository: repository.modify_intent_description(intent_name="a", new_description="new"),
+    lambda repository: repository.create_intents_with_levels([["c", "c", "MES"]], bulk=True),
+    lambda repository: repository.remove_intents(intent_names=["a"]),
+    lambda repository: repository.add_entity_isa_levels(entity_name="x", levels=[ISA95LevelEnum.LEVEL_3]),
+    lambda repository: repository.remove_entity_isa_levels(entity_name="x", levels=["PLC"]),
+    lambda repository: repository.replace_entity_isa_levels(entity_name="x", levels=["ERP"]),
+    lambda repository: repository.remove_entities(entity_names=["x"], bulk=True),
+], ids=["add", "remove_levels", "replace", "replace_batch", "upsert", "modify_description", "create_bulk",
+        "remove_concept", "add_entity", "remove_entity_levels", "replace_entity", "remove_entity_bulk"])
+def test_reads_are_fresh_after_each_write(cached, check, concepts, write):
+    write(cached)
+    check()
+
+
+def test_unchanged_levels_see_the_new_level_mask(cached, concepts):
+    [before] = [intent for intent in cached.get_intents_by_isa95_level(ISA95LevelEnum.LEVEL_4) if intent.name == "a"]
+
+    cached.add_intent_isa_levels(intent_name="a", levels=[ISA95LevelEnum.LEVEL_2])
+
+    # ERP non è cambiato, ma la riga di "a" sì
+    [after] = [intent for intent in cached.get_intents_by_isa95_level(ISA95LevelEnum.LEVEL_4) if intent.name == "a"]
+    assert after.level_mask == before.level_mask | levels_to_mask([ISA95LevelEnum.LEVEL_2])
+
+
+def test_repaired_masks_are_fresh(engine, cached, check, concepts):
+    with engine.begin() as connection:
+        connection.execute(update(Intent).where(Intent.name == "a").values(level_mask=None))
+    cached.cache.clear()
+    check()
+
+    assert cached.check_level_masks(repair=True)["intent"]
+    check()
+
+
+def test_each_call_gets_its_own_objects(cached, statements, concepts):
+    cached.VERSION_POLL_INTERVAL = 3600
+    first = cached.get_intents_by_isa95_level(ISA95LevelEnum.LEVEL_3)
+    statements.reset()
+
+    second = cached.get_intents_by_isa95_level(ISA95LevelEnum.LEVEL_3)
+    assert len(statements) == 0
+    assert second is not first
+    assert not {id(intent) for intent in first} & {id(intent) for intent in second}
+
+    first[0].description = "changed by a caller"
+    first.clear()
+    third = cached.get_intents_by_isa95_level(ISA95LevelEnum.LEVEL_3)
+    assert sorted(intent.description for intent in third) == ["a", "b"]
@@ -0,0 +1,111 @@
+'''
+get_*_replacement / get_*_descendants / get_*_ancestors: una sola query WITH RECURSIVE,
+che si ferma sui cicli e a max_depth.
+'''
+import pytest
+
+from tables_definition import *
+
+
+@pytest.fixture
+def ids(repository):
+    names = list("abcdefg")
+    repository.create_intents_with_levels([[name, name, "MES"] for name in names])
+    return {intent.name: intent.id for intent in repository.get_intents_full(names)}
+
+
+def define(repository, ids, edges):
+    repository.define_intents_relations([(ids[a], ids[b], relation_type, confidence)
+                                         for a, b, relation_type, confidence in edges])
+
+
+def names(records, ids):
+    by_id = {concept_id: name for name, concept_id in ids.items()}
+    return [(record.name, record.depth, tuple(by_id[step] for step in record.path)) for record in records]
+
+
+def test_replacement_follows_the_chain(repository, statements, ids):
+    define(repository, ids, [("a", "b", RelationType.DEPRECATED, 0.5),
+                             ("b", "c", RelationType.DEPRECATED, 0.8),
+                             ("c", "d", RelationType.DEPRECATED, 1.0)])
+    statements.reset()
+
+    replacement = repository.get_intent_replacement(intent_name="a")
+
+    assert len(statements) == 1
+    assert names([replacement], ids) == [("d", 3, ("a", "b", "c", "d"))]
+    assert replacement.confidence == pytest.approx(0.4)
+    assert repository.get_intent_replacement(ids["c"]).name == "d"
+    assert repository.get_intent_replacement(ids["d"]) is None
+
+
+def test_replacement_stops_on_cycles(repository, statements, ids):
+    define(repository, ids, [("a", "b", RelationType.DEPRECATED, 1.0),
+                             ("b", "c", RelationType.DEPRECATED, 1.0),
+                             ("c", "a", RelationType.DEPRECATED, 1.0)])
+    statements.reset()
+
+    # nessun intent attuale nella catena: il ciclo non viene percorso all'infinito
+    assert repository.get_intent_replacement(intent_name="a", max_depth=1000) is None
+    assert len(statements) == 1
+
+
+def test_replacement_max_depth(repository, ids):
+    define(repository, ids, [(a, b, RelationType.DEPRECATED, 1.0) for a, b in zip("abcde", "bcdef")])
+
+    assert repository.get_intent_replacement(intent_name="a", max_depth=5).name == "f"
+    # la catena è più lunga di max_depth
+    assert repository.get_intent_replacement(intent_name="a", max_depth=4) is None
+    assert repository.get_intent_replacement(intent_name="c", max_depth=3).name == "f"
+
+
+def test_descendants_in_either_direction(repository, statements, ids):
+    # (a, b, NARROWER): b più specifico di a, (c, a, BROADER): a più generico di c
+    define(repository, ids, [("a", "b", RelationType.NARROWER, 1.0),
+                             ("c", "a", RelationType.BROADER, 0.5),
+                             ("b", "d", RelationType.NARROWER, 1.0),
+                             ("e", "d", RelationType.BROADER, 1.0)])
+    statements.reset()
+
+    descendants = repository.get_intent_descendants(intent_name="a")
+
+    assert len(statements) == 1
+    assert names(descendants, ids) == [("b", 1, ("a", "b")), ("c", 1, ("a", "c")),
+                                       ("d", 2, ("a", "b", "d")), ("e", 3, ("a", "b", "d", "e"))]
+    assert names(repository.get_intent_ancestors(intent_name="e"), ids) == \
+        [("d", 1, ("e", "d")), ("b", 2, ("e", "d", "b")), ("a", 3, ("e", "d", "b", "a"))]
+    assert names(repository.get_intent_descendants(intent_name="a", max_depth=2), ids) == \
+        [("b", 1, ("a", "b")), ("c", 1, ("a", "c")), ("d", 2, ("a", "b", "d"))]
+
+
+def test_descendants_keep_the_shortest_path(repository, ids):
+    define(repository, ids, [("a", "b", RelationType.NARROWER, 1.0),
+                             ("b", "c", RelationType.NARROWER, 1.0),
+                             ("a", "c", RelationType.NARROWER, 0.3)])
+
+    assert names(repository.get_intent_descendants(intent_name="a"), ids) == \
+        [("b", 1, ("a", "b")), ("c", 1, ("a", "c"))]
+
+
+def test_descendants_stop_on_cycles(repository, ids):
+    define(repository, ids, [("a", "b", RelationType.NARROWER, 1.0),
+                             ("b", "c", RelationType.NARROWER, 1.0),
+                             ("c", "a", RelationType.NARROWER, 1.0),
+                             ("c", "d", RelationType.NARROWER, 1.0)])
+
+    # il concetto di partenza e quelli già nel path non vengono rivisitati
+    assert names(repository.get_intent_descendants(intent_name="a", max_depth=100), ids) == \
+        [("b", 1, ("a", "b")), ("c", 2, ("a", "b", "c")), ("d", 3, ("a", "b", "c", "d"))]
+    assert [record.name for record in repository.get_intent_ancestors(intent_name="a", max_depth=100)] == \
+        ["c", "b"]
+
+
+def test_entity_walks(repository):
+    repository.create_entities_with_levels([["old", "old", "MES"], ["new", "new", "MES"], ["part", "part", "MES"]])
+    ids = {entity.name: entity.id for entity in repository.get_entities_full(["old", "new", "part"])}
+    repository.define_entities_relations([(ids["old"], ids["new"], RelationType.DEPRECATED),
+                                          (ids["new"], ids["part"], RelationType.NARROWER)])
+
+    assert repository.get_entity_replacement(entity_name="old").name == "new"
+    assert [record.name for record in repository.get_entity_descendants(entity_name="new")] == ["part"]
+    assert [record.name for record in repository.get_entity_ancestors(entity_name="part")] == ["new"]
@@ -0,0 +1,45 @@
+'''
+indici in memoria delle relazioni: il repository ne registra uno per tipo,
+anche se vengono richiesti a ogni uso.
+'''
+from tables_definition import *
+
+
+def test_closure_is_shared_per_threshold(repository):
+    assert repository.get_intent_closure(0.8) is repository.get_intent_closure(0.8)
+    assert repository.get_intent_closure(0.8) is not repository.get_intent_closure(0.5)
+    assert repository.get_entity_closure() is repository.get_entity_closure()
+
+    for _ in range(100):
+        repository.get_intent_closure(0.8)
+    assert len(repository._relation_indexes["intent"]) == 2
+    assert len(repository._relation_indexes["entity"]) == 1
+
+
+def test_shared_closure_follows_the_relations(repository):
+    repository.create_intents_with_levels([["a", "a", "MES"], ["b", "b", "MES"], ["c", "c", "MES"]])
+    ids = {intent.name: intent.id for intent in repository.get_intents_full(["a", "b", "c"])}
+    repository.get_intent_closure().same_class(ids["a"], ids["b"])
+
+    repository.define_intents_relation(ids["a"], ids["b"], RelationType.EQUIVALENT)
+    repository.define_intents_relation(ids["b"], ids["c"], RelationType.EQUIVALENT)
+    assert repository.get_intent_closure().members(ids["a"]) == {ids["a"], ids["b"], ids["c"]}
+
+    repository.remove_intents_relation(id_intent_a=ids["b"], id_intent_b=ids["c"])
+    assert repository.get_intent_closure().members(ids["a"]) == {ids["a"], ids["b"]}
+
+
+def test_deprecation_resolver_is_shared(repository):
+    resolvers = [repository.get_intent_deprecation_resolver() for _ in range(100)]
+    assert all(resolver is resolvers[0] for resolver in resolvers)
+    assert repository.get_entity_deprecation_resolver() is repository.get_entity_deprecation_resolver()
+    assert len(repository._relation_indexes["intent"]) == 1
+
+
+def test_shared_deprecation_resolver_follows_the_relations(repository):
+    repository.create_intents_with_levels([["old", "old", "MES"], ["new", "new", "MES"]])
+    ids = {intent.name: intent.id for intent in repository.get_intents_full(["old", "new"])}
+    assert repository.get_intent_deprecation_resolver().resolve("old") == "old"
+
+    repository.define_intents_relation(ids["old"], ids["new"], RelationType.DEPRECATED)
+    assert repository.get_intent_deprecation_resolver().resolve("old") == "new"
@@ -0,0 +1,37 @@
+'''
+remove_intents / remove_entities: link e relazioni vengono eliminati dal ON DELETE CASCADE
+anche senza bulk (passive_deletes), purché le foreign key siano attive.
+'''
+import pytest
+from sqlalchemy import func, select
+
+from tables_definition import *
+
+
+@pytest.mark.parametrize("bulk", [False, True])
+def test_remove_intents_leaves_no_orphans(repository, engine, bulk):
+    repository.create_intents_with_levels([["a", "a", ["MES", "ERP"]], ["b", "b", "MES"], ["c", "c", "PLC"]])
+    ids = {intent.name: intent.id for intent in repository.get_intents_full(["a", "b", "c"])}
+    repository.define_intents_relations([(ids["a"], ids["b"], RelationType.EQUIVALENT),
+                                         (ids["c"], ids["a"], RelationType.BROADER)])
+
+    assert repository.remove_intents(intent_names=["a"], bulk=bulk) == 1
+
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(IntentISA95Link)
+                                 .where(IntentISA95Link.intent_id == ids["a"])) == 0
+        assert connection.scalar(select(func.count()).select_from(IntentMatch)) == 0
+
+
+@pytest.mark.parametrize("bulk", [False, True])
+def test_remove_entities_leaves_no_orphans(repository, engine, bulk):
+    repository.create_entities_with_levels([["a", "a", "MES"], ["b", "b", "SCADA"]])
+    ids = {entity.name: entity.id for entity in repository.get_entities_full(["a", "b"])}
+    repository.define_entities_relation(ids["a"], ids["b"], RelationType.NARROWER)
+
+    assert repository.remove_entities(entity_names=["b"], bulk=bulk) == 1
+
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(EntityISA95Link)
+                                 .where(EntityISA95Link.entity_id == ids["b"])) == 0
+        assert connection.scalar(select(func.count()).select_from(EntityMatch)) == 0
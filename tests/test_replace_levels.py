@@ -0,0 +1,92 @@
+'''
+replace_intents_isa_levels / replace_entities_isa_levels: un numero di statement fisso
+per chunk, indipendente dal numero di concetti e di livelli.
+'''
+import pytest
+from sqlalchemy import select
+
+from tables_definition import *
+
+# senza MES, il livello di partenza: ogni sostituzione rimuove e aggiunge link
+LEVELS = ["DEFAULT", "PLC", "SCADA", "ERP"]
+
+
+@pytest.fixture
+def names(repository):
+    names = [f"intent_{i}" for i in range(30)]
+    repository.create_intents_with_levels([[name, name, "MES"] for name in names], bulk=True)
+    return names
+
+
+def links(engine):
+    with engine.connect() as connection:
+        return sorted(connection.execute(
+            select(Intent.name, ISA95Level.name)
+            .join(IntentISA95Link, IntentISA95Link.intent_id == Intent.id)
+            .join(ISA95Level, ISA95Level.id == IntentISA95Link.isa95_id)).all())
+
+
+def concept_statements(statements):
+    '''statements of the replace, without the bump of ontology_version'''
+    return [statement for statement in statements.statements if "ontology_version" not in statement]
+
+
+@pytest.mark.parametrize("levels_per_intent", [1, 3])
+def test_replace_statement_count(repository, statements, names, levels_per_intent):
+    wanted = {name: LEVELS[i % 2:i % 2 + levels_per_intent] for i, name in enumerate(names)}
+    statements.reset()
+
+    report = repository.replace_intents_isa_levels(wanted, chunk_size=10)
+
+    assert report == {"updated": 30, "unchanged": 0}
+    # per chunk: SELECT concetti, SELECT link, DELETE, INSERT, UPDATE delle maschere
+    assert len(concept_statements(statements)) == 3 * 5
+
+    # stessa classificazione: solo le due SELECT per chunk, nessun incremento di versione
+    statements.reset()
+    assert repository.replace_intents_isa_levels(wanted, chunk_size=10) == {"updated": 0, "unchanged": 30}
+    assert len(statements) == 3 * 2
+
+
+def test_replace_only_writes_the_differences(repository, engine, statements, names):
+    statements.reset()
+
+    # solo link aggiunti: nessun DELETE
+    repository.replace_intents_isa_levels({name: ["MES", "ERP"] for name in names[:5]})
+    written = concept_statements(statements)
+    assert len(written) == 4
+    assert not any(statement.lstrip().upper().startswith("DELETE") for statement in written)
+
+    # mix di id e nomi nella stessa chiamata
+    ids = [intent.id for intent in repository.get_intents_full(names[:2])]
+    repository.replace_intents_isa_levels({ids[0]: "PLC", names[1]: ["PLC"]})
+    assert links(engine)[:3] == [("intent_0", "PLC"), ("intent_1", "PLC"), ("intent_10", "MES")]
+
+
+def test_replace_errors_write_nothing(repository, engine, statements, names):
+    before = links(engine)
+    statements.reset()
+
+    # livello inesistente: rifiutato prima di qualsiasi statement
+    with pytest.raises(ValueError):
+        repository.replace_intents_isa_levels({names[0]: ["MES"], names[1]: ["NOT_A_LEVEL"]})
+    assert len(statements) == 0
+    with pytest.raises(ValueError, match="almeno un livello"):
+        repository.replace_intents_isa_levels({names[0]: []})
+
+    # concetto inesistente nel secondo chunk: anche il primo viene annullato
+    with pytest.raises(ValueError, match="missing"):
+        repository.replace_intents_isa_levels({**{name: "ERP" for name in names[:10]}, "missing": "ERP"},
+                                              chunk_size=10)
+    assert links(engine) == before
+
+
+def test_replace_entities_statement_count(repository, statements):
+    repository.create_entities_with_levels([[f"entity_{i}", "entity", "PLC"] for i in range(20)], bulk=True)
+    statements.reset()
+
+    report = repository.replace_entities_isa_levels({f"entity_{i}": ["SCADA", "MES"] for i in range(20)},
+                                                    chunk_size=10)
+
+    assert report == {"updated": 20, "unchanged": 0}
+    assert len(concept_statements(statements)) == 2 * 5
@@ -0,0 +1,124 @@
+'''
+load_snapshot: fotografia immutabile e coerente dell'ontologia, sostituita in blocco
+solo quando la versione cambia.
+'''
+import importlib
+
+import pytest
+from sqlalchemy import create_engine, event
+
+from engine_factory import _enable_sqlite_foreign_keys
+from tables_definition import *
+
+RepositoryLayer = importlib.import_module("3-repository").RepositoryLayer
+
+
+@pytest.fixture
+def ids(repository):
+    repository.create_intents_with_levels([["a", "a", ["MES", "ERP"]], ["b", "b", "MES"], ["c", "c", "PLC"]])
+    repository.create_entities_with_levels([["x", "x", "SCADA"], ["y", "y", "SCADA"]])
+    ids = {intent.name: intent.id for intent in repository.get_intents_full(["a", "b", "c"])}
+    ids.update({entity.name: entity.id for entity in repository.get_entities_full(["x", "y"])})
+    repository.define_intents_relations([(ids["a"], ids["b"], RelationType.EQUIVALENT, 0.9),
+                                         (ids["c"], ids["a"], RelationType.BROADER)])
+    repository.define_entities_relation(ids["x"], ids["y"], RelationType.DEPRECATED)
+    return ids
+
+
+def test_snapshot_content(repository, ids):
+    snapshot = repository.load_snapshot()
+
+    assert len(snapshot.intents) == 3 and len(snapshot.entities) == 2
+    assert snapshot.intents.id_of("a") == ids["a"]
+    assert snapshot.intents.name_of(ids["c"]) == "c"
+    assert snapshot.intents.levels_of("a") == [ISA95LevelEnum.LEVEL_3, ISA95LevelEnum.LEVEL_4]
+    assert set(snapshot.intents.with_level(ISA95LevelEnum.LEVEL_3)) == {ids["a"], ids["b"]}
+    assert snapshot.intents.related("a") == ((ids["b"], RelationType.EQUIVALENT, 0.9),)
+    assert snapshot.intents.related("a", incoming=True) == ((ids["c"], RelationType.BROADER, 1.0),)
+    assert snapshot.entities.related("x", RelationType.DEPRECATED) == ((ids["y"], RelationType.DEPRECATED, 1.0),)
+    assert "missing" not in snapshot.intents and snapshot.intents.related("missing") == ()
+
+
+def test_snapshot_is_immutable(repository, ids):
+    snapshot = repository.load_snapshot()
+
+    with pytest.raises(AttributeError):
+        snapshot.intents = None
+    with pytest.raises(AttributeError):
+        snapshot.intents._names = ()
+    with pytest.raises(TypeError):
+        snapshot.intents.level_masks[0] = 0
+    with pytest.raises(TypeError):
+        snapshot.intents.ids[0] = 0
+
+
+def test_snapshot_is_swapped_only_on_a_new_version(repository, statements, ids):
+    first = repository.load_snapshot()
+    statements.reset()
+
+    # stessa versione: nessuna ricarica, una sola lettura di ontology_version
+    assert repository.load_snapshot() is first
+    assert len(statements) == 1
+
+    repository.add_intent_isa_levels(intent_name="b", levels=[ISA95LevelEnum.LEVEL_4])
+    second = repository.load_snapshot()
+
+    assert second is not first and repository.snapshot is second
+    assert second.version > first.version
+    assert second.intents.has_level("b", ISA95LevelEnum.LEVEL_4)
+    # chi tiene la snapshot precedente continua a vedere la versione precedente
+    assert not first.intents.has_level("b", ISA95LevelEnum.LEVEL_4)
+
+
+def test_snapshot_force_reload(repository, engine, ids):
+    first = repository.load_snapshot()
+    with engine.begin() as connection:
+        # scrittura fuori dal repository: ontology_version non cambia
+        connection.execute(Intent.__table__.insert().values(name="d", description="d"))
+
+    assert repository.load_snapshot() is first
+    assert "d" in repository.load_snapshot(force=True).intents
+
+
+def test_older_snapshot_does_not_replace_a_newer_one(repository, ids):
+    stale = repository._read_snapshot()
+    repository.add_intent_isa_levels(intent_name="b", levels=[ISA95LevelEnum.LEVEL_4])
+    newer = repository.load_snapshot()
+
+    # un caricamento concorrente più lento finisce dopo, con una versione più vecchia
+    repository._read_snapshot = lambda: stale
+    assert repository.load_snapshot(force=True) is newer
+
+
+def test_snapshot_is_consistent_with_concurrent_writes(tmp_path):
+    # database su file in WAL: il writer non aspetta la fine della lettura della snapshot
+    engine = _enable_sqlite_foreign_keys(create_engine(f"sqlite:///{tmp_path / 'snapshot.db'}"))
+    with engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+    Base.metadata.create_all(engine)
+    reader = RepositoryLayer(engine)
+    writer = RepositoryLayer(engine)
+    reader._populate_isa95_levels()
+    reader.create_intents_with_levels([["a", "a", "MES"]])
+    reader.create_entities_with_levels([["x", "x", "MES"]])
+
+    written = []
+
+    def write_during_the_read(conn, cursor, statement, parameters, context, executemany):
+        # dopo la lettura degli intenti, prima di quella delle entità
+        if not written and statement.lstrip().upper().startswith("SELECT") and "FROM entity" in statement:
+            written.append(True)
+            writer.create_intents_with_levels([["b", "b", "MES"]])
+            writer.create_entities_with_levels([["y", "y", "MES"]])
+
+    event.listen(engine, "before_cursor_execute", write_during_the_read)
+    try:
+        snapshot = reader.load_snapshot()
+    finally:
+        event.remove(engine, "before_cursor_execute", write_during_the_read)
+        engine.dispose()
+
+    assert written
+    # tutte le tabelle lette alla stessa versione: né "b" né "y"
+    assert "b" not in snapshot.intents
+    assert "y" not in snapshot.entities
@@ -0,0 +1,62 @@
+'''
+populate con upsert=True: idempotente, con il resoconto inserted / updated / unchanged.
+'''
+import json
+
+import pytest
+from sqlalchemy import func, select
+
+from tables_definition import *
+
+
+def _write(path, section, concepts):
+    path.write_text(json.dumps({section: concepts}), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def sources(tmp_path):
+    intents = {f"intent_{i}": {"description": f"intent {i}", "function": "command", "domain": "MES"}
+               for i in range(20)}
+    entities = {f"entity_{i}": {"description": f"entity {i}", "level": "PLC"} for i in range(10)}
+    return tmp_path, intents, entities
+
+
+def _populate(repository, tmp_path, intents, entities, **options):
+    return repository.populate_db_from_sources(_write(tmp_path / "intents.json", "intents", intents),
+                                               _write(tmp_path / "entities.json", "entities", entities),
+                                               upsert=True, **options)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_upsert_twice_is_idempotent(repository, engine, sources, stream):
+    tmp_path, intents, entities = sources
+
+    first = _populate(repository, tmp_path, intents, entities, stream=stream)
+    second = _populate(repository, tmp_path, intents, entities, stream=stream)
+
+    assert first == {"intents": {"inserted": 20, "updated": 0, "unchanged": 0},
+                     "entities": {"inserted": 10, "updated": 0, "unchanged": 0}}
+    assert second == {"intents": {"inserted": 0, "updated": 0, "unchanged": 20},
+                      "entities": {"inserted": 0, "updated": 0, "unchanged": 10}}
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(Intent)) == 20
+        assert connection.scalar(select(func.count()).select_from(IntentISA95Link)) == 20
+
+
+def test_upsert_reports_changed_descriptions_and_levels(repository, sources):
+    tmp_path, intents, entities = sources
+    _populate(repository, tmp_path, intents, entities)
+
+    intents["intent_0"]["description"] = "changed"
+    intents["intent_1"]["domain"] = "ERP"
+    intents["intent_new"] = {"description": "new", "domain": "SCADA"}
+    entities["entity_0"]["level"] = "SCADA"
+    report = _populate(repository, tmp_path, intents, entities)
+
+    assert report == {"intents": {"inserted": 1, "updated": 2, "unchanged": 18},
+                      "entities": {"inserted": 0, "updated": 1, "unchanged": 9}}
+    intent = repository.get_intent_full(intent_name="intent_1")
+    assert [link.isa95_level.name for link in intent.isa95_links] == ["ERP"]
+    assert repository.get_intent_full(intent_name="intent_0").description.startswith("changed")
+    assert repository.check_level_masks() == {"intent": [], "entity": []}